@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+blobstore - 内容アドレスのブロブストア（ROOT/blobs/ab/cdef...）
+
+大きなペイロードをSHA-256で名前を付けて1回だけ保存し、メッセージには参照
+    {"$blob": "<sha256>", "size": <バイト数>, "preview": "<先頭部分>"}
+だけを残す（JSONにした値の場合は "type": "json" が付く）。bus.jsonlの行や
+tasks.jsonの結果を小さく保ち、書き込みと走査を出力の大きさに依存させないため。
+同じ内容は同じファイルになるので、何度投函されても1つしか保存しない。
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+REF_KEY = "$blob"
+PREVIEW_LENGTH = 200  # 参照に残すプレビューの文字数
+MIN_PREFIX_LENGTH = 6  # find()で受け付けるハッシュの最短の先頭部分
+
+
+class BlobStore:
+    """ディレクトリに内容アドレスでブロブを保存する
+
+    Args:
+        root: 保存先ディレクトリ（ROOT/blobs）
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, digest):
+        """ブロブのパス（先頭2文字をディレクトリにする）"""
+        return self.root / digest[:2] / digest[2:]
+
+    def put(self, data):
+        """バイト列を保存してSHA-256（16進）を返す（保存済みなら書かない）"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if path.exists():
+            return digest
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.parent / f".tmp-{path.name}-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp, path)
+        return digest
+
+    def find(self, prefix):
+        """ハッシュの先頭部分（6文字以上）からブロブのハッシュを探す
+
+        Raises:
+            KeyError: 見つからない、または複数が一致する
+        """
+        prefix = prefix.lower()
+        if len(prefix) < MIN_PREFIX_LENGTH or not all(c in "0123456789abcdef" for c in prefix):
+            raise KeyError(prefix)
+        if len(prefix) == 64:
+            return prefix
+        matches = [prefix[:2] + p.name for p in (self.root / prefix[:2]).glob(f"{prefix[2:]}*")
+                   if not p.name.startswith(".")]
+        if len(matches) != 1:
+            raise KeyError(prefix)
+        return matches[0]
+
+    def get(self, digest):
+        """ブロブの内容を返す
+
+        Raises:
+            KeyError: ブロブが無い
+        """
+        if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+            raise KeyError(digest)
+        try:
+            return self.path(digest).read_bytes()
+        except FileNotFoundError:
+            raise KeyError(digest) from None
+
+
+def is_ref(value):
+    """値がブロブへの参照か"""
+    return isinstance(value, dict) and REF_KEY in value
+
+
+def spill(data, store, min_size, preview=PREVIEW_LENGTH):
+    """dataの大きなフィールドをブロブに移して参照に置き換える
+
+    文字列はUTF-8のまま、リストや辞書はJSONにして保存する。
+
+    Args:
+        data: メッセージのdata
+        store: BlobStore
+        min_size: 保存するとこのバイト数以上になるフィールドを移す
+        preview: 参照に残すプレビューの文字数
+
+    Returns:
+        (dict, int): 置き換えたdata（変更が無ければ元のdata）と移したフィールド数
+    """
+    if not isinstance(data, dict):
+        return data, 0
+    spilled = {}
+    for key, value in data.items():
+        if isinstance(value, str):
+            # 1文字は最大4バイトなので、明らかに小さい文字列はエンコードしない
+            if len(value) * 4 < min_size:
+                continue
+            text, ref = value, {}
+        elif isinstance(value, (dict, list)) and not is_ref(value):
+            text, ref = json.dumps(value, ensure_ascii=False, separators=(",", ":")), {"type": "json"}
+        else:
+            continue
+        raw = text.encode("utf-8")
+        if len(raw) >= min_size:
+            spilled[key] = {REF_KEY: store.put(raw), "size": len(raw), **ref, "preview": text[:preview]}
+    if not spilled:
+        return data, 0
+    return {**data, **spilled}, len(spilled)
+
+
+def resolve(data, store):
+    """spill()で置き換えた参照を元の値に戻す（ブロブが無ければKeyError）"""
+    if not isinstance(data, dict):
+        return data
+    resolved = {}
+    for key, value in data.items():
+        if is_ref(value):
+            raw = store.get(value[REF_KEY])
+            value = json.loads(raw) if value.get("type") == "json" else raw.decode("utf-8")
+        resolved[key] = value
+    return resolved
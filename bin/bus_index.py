@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+bus_index - bus.jsonl のサイドカー索引（SQLite）
+
+各レコードの位置（セグメント番号, バイトオフセット, 長さ）を ts / task_id / type
+とともに logs/bus.index.sqlite に記録する。問い合わせは索引で位置を引き、
+bus_log.read_at() で該当レコードだけを読むため、ログ全体を走査しない。
+
+索引の更新:
+    - busd は BusLogWriter の on_flush から add() を呼び、書き込みと同時に更新する
+    - sync() はまだ索引に無い部分（busd停止中の書き込み、索引の削除等）を
+      マニフェストと現在のファイルから追いかけて登録する
+    (seq, offset) が主キーのため、両者が同じ範囲を登録しても重複しない。
+
+現在のbus.jsonlは (st_dev, st_ino) を live テーブルに記録する。logrotate等で
+別のファイルに置き換わった場合（SIGHUPで開き直した後、前のオフセットを超えて
+伸びていても）、sync() はそのセグメントの登録を捨てて先頭から登録し直す。
+"""
+
+import gzip
+import json
+import os
+import sqlite3
+from pathlib import Path
+
+from bus_log import load_manifest, open_segment
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    ts INTEGER,
+    task_id TEXT,
+    type TEXT,
+    PRIMARY KEY (seq, offset)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS events_task ON events (task_id, seq, offset);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_type ON events (type, seq, offset);
+CREATE TABLE IF NOT EXISTS sealed (
+    seq INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS live (
+    seq INTEGER PRIMARY KEY,
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL
+);
+"""
+
+
+def index_path_for(log_path):
+    """bus.jsonl に対応する索引のパス（bus.index.sqlite）"""
+    log_path = Path(log_path)
+    return log_path.with_name(f"{log_path.name.split('.')[0]}.index.sqlite")
+
+
+def _row(seq, offset, length, record):
+    ts = record.get("ts")
+    task_id = record.get("task_id")
+    msg_type = record.get("type")
+    return (seq, offset, length,
+            int(ts) if isinstance(ts, (int, float)) else None,
+            task_id if isinstance(task_id, str) else None,
+            msg_type if isinstance(msg_type, str) else None)
+
+
+def _scan(fp, start):
+    """fpのstart以降の完全な行を (offset, length, record) で返す"""
+    fp.seek(start)
+    offset = start
+    for raw in fp:
+        if not raw.endswith(b"\n"):
+            # 書き込み途中の行は次回に回す
+            break
+        length = len(raw)
+        try:
+            record = json.loads(raw)
+        except ValueError:
+            record = None
+        if isinstance(record, dict):
+            yield offset, length, record
+        offset += length
+
+
+class BusIndex:
+    """bus.jsonl の索引
+
+    Args:
+        log_path: bus.jsonl のパス
+        path: 索引ファイルのパス（省略時は bus.index.sqlite）
+    """
+
+    def __init__(self, log_path, path=None):
+        self.log_path = Path(log_path)
+        self.path = Path(path) if path else index_path_for(self.log_path)
+        # busdの書き込みとbusqの読み取りが並行するためWALモードで開く
+        self.db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def add(self, seq, entries):
+        """書き込まれたレコードを登録する（BusLogWriterのon_flushに渡す）
+
+        Args:
+            seq: セグメント番号
+            entries: [(offset, length, record), ...]
+        """
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?, ?, ?)",
+                [_row(seq, offset, length, record) for offset, length, record in entries])
+
+    def _indexed_end(self, seq):
+        row = self.db.execute(
+            "SELECT offset + length FROM events WHERE seq = ? ORDER BY offset DESC LIMIT 1",
+            (seq,)).fetchone()
+        return row[0] if row else 0
+
+    def _index_from(self, seq, fp, start):
+        batch = []
+        count = 0
+        for entry in _scan(fp, start):
+            batch.append(entry)
+            if len(batch) >= 10000:
+                self.add(seq, batch)
+                count += len(batch)
+                batch = []
+        self.add(seq, batch)
+        return count + len(batch)
+
+    def sync(self):
+        """索引に無いレコードをセグメントと現在のファイルから登録する
+
+        Returns:
+            int: 新たに登録したレコード数
+        """
+        added = 0
+        segments = load_manifest(self.log_path)
+        sealed = {row[0] for row in self.db.execute("SELECT seq FROM sealed")}
+        for entry in segments:
+            if entry["seq"] in sealed:
+                continue
+            # 行のバイト長（展開後）が必要なためバイナリで読む
+            raw = open_segment(self.log_path, entry, binary=True)
+            if raw is None:
+                continue
+            with raw:
+                fp = gzip.GzipFile(fileobj=raw) if raw.name.endswith(".gz") else raw
+                added += self._index_from(entry["seq"], fp, self._indexed_end(entry["seq"]))
+            with self.db:
+                self.db.execute("INSERT OR IGNORE INTO sealed VALUES (?)", (entry["seq"],))
+
+        live_seq = segments[-1]["seq"] + 1 if segments else 1
+        if self.log_path.exists():
+            with open(self.log_path, "rb") as fp:
+                st = os.fstat(fp.fileno())
+                start = self._indexed_end(live_seq)
+                size = fp.seek(0, 2)
+                if size < start or (start and self._live_id(live_seq) != (st.st_dev, st.st_ino)):
+                    # ファイルが外部で切り詰められた・置き換えられた（または登録済みの部分が
+                    # どのファイルのものか分からない）: このセグメントを索引し直す
+                    with self.db:
+                        self.db.execute("DELETE FROM events WHERE seq = ?", (live_seq,))
+                    start = 0
+                with self.db:
+                    self.db.execute("DELETE FROM live WHERE seq != ?", (live_seq,))
+                    self.db.execute("INSERT OR REPLACE INTO live VALUES (?, ?, ?)",
+                                    (live_seq, st.st_dev, st.st_ino))
+                added += self._index_from(live_seq, fp, start)
+        return added
+
+    def _live_id(self, seq):
+        row = self.db.execute("SELECT dev, ino FROM live WHERE seq = ?", (seq,)).fetchone()
+        return tuple(row) if row else None
+
+    def reset(self):
+        """索引を空にする（次のsync()で全体を登録し直す）"""
+        with self.db:
+            self.db.execute("DELETE FROM events")
+            self.db.execute("DELETE FROM sealed")
+            self.db.execute("DELETE FROM live")
+
+    @staticmethod
+    def _where(task_id, msg_type, since, until):
+        clauses, params = [], []
+        if task_id is not None:
+            clauses.append("task_id = ?")
+            params.append(task_id)
+        if msg_type is not None:
+            clauses.append("type = ?")
+            params.append(msg_type)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts <= ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def lookup(self, task_id=None, msg_type=None, since=None, until=None, limit=None, newest=False):
+        """条件に合うレコードの位置を返す
+
+        Returns:
+            list: [(seq, offset, length), ...]（古い順。newest=Trueなら新しい順）
+        """
+        where, params = self._where(task_id, msg_type, since, until)
+        sql = "SELECT seq, offset, length FROM events" + where
+        sql += " ORDER BY seq DESC, offset DESC" if newest else " ORDER BY seq, offset"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self.db.execute(sql, params).fetchall()
+
+    def count(self, task_id=None, msg_type=None, since=None, until=None):
+        """条件に合うレコード数を返す"""
+        where, params = self._where(task_id, msg_type, since, until)
+        return self.db.execute("SELECT COUNT(*) FROM events" + where, params).fetchone()[0]
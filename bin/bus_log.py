@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+bus_log - logs/bus.jsonl へのバッファ付き書き込み（グループコミット）とセグメント管理
+
+メッセージごとにファイルを開いて1行書いて閉じる代わりに、ファイルハンドルを
+開いたまま保持し、1回のメールボックス走査で溜まった行を1回のwriteで書き込む。
+
+fsyncポリシー:
+    "never"  - fsyncしない（OSに任せる）
+    "batch"  - flushのたびにfsyncする
+    数値     - 前回のfsyncから指定ミリ秒以上経過していればfsyncする
+
+logrotate等でファイルが移動された場合は request_reopen()（SIGHUPハンドラから
+呼ばれる）により、次の書き込み前にファイルを開き直す。
+
+セグメント:
+    bus.jsonl がサイズまたは経過時間の上限に達すると bus.000123.jsonl に
+    リネームして新しい bus.jsonl を開き（tail -F はそのまま追従する）、
+    バックグラウンドで bus.000123.jsonl.gz に圧縮する。各セグメントの
+    時刻範囲・件数・task_idは bus.manifest.json に記録し、read_bus_log() は
+    条件に合わないセグメントを開かずに読み飛ばす。
+
+    圧縮は行境界で区切ったブロックごとに独立したgzipメンバーとして書き、
+    各ブロックの（展開後オフセット, 圧縮後オフセット）をマニフェストに残す。
+    連結したgzipとしてそのまま読めるうえ、read_at() は目的のブロックだけを
+    展開して任意のオフセットのレコードを読める。
+
+レコードの位置は（セグメント番号, バイトオフセット, 長さ）で表す。現在の
+bus.jsonl は次に切り出されるセグメント番号を持つため、切り替え後も同じ位置で
+読める。
+"""
+
+import bisect
+import gzip
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+FSYNC_NEVER = "never"
+FSYNC_BATCH = "batch"
+
+COMPRESS_BLOCK_SIZE = 256 * 1024  # 圧縮ブロックの目安サイズ（展開後のバイト数）
+
+
+def parse_fsync_policy(value):
+    """環境変数等の文字列をfsyncポリシーに変換する
+
+    Returns:
+        str | float: "never" / "batch" / fsync間隔（秒）
+    """
+    value = (value or FSYNC_NEVER).strip().lower()
+    if value in (FSYNC_NEVER, FSYNC_BATCH):
+        return value
+    try:
+        interval_ms = float(value.removesuffix("ms"))
+    except ValueError:
+        raise ValueError(f"Invalid fsync policy: {value!r} (expected never, batch or milliseconds)")
+    if interval_ms <= 0:
+        return FSYNC_BATCH
+    return interval_ms / 1000
+
+
+def manifest_path(path):
+    """bus.jsonl に対応するマニフェストのパス（bus.manifest.json）"""
+    path = Path(path)
+    return path.with_name(f"{path.name.split('.')[0]}.manifest.json")
+
+
+def segment_path(path, seq, compressed=True):
+    """セグメント番号に対応するファイルパス（bus.000123.jsonl[.gz]）"""
+    path = Path(path)
+    stem = path.name.split(".")[0]
+    name = f"{stem}.{seq:06d}.jsonl"
+    return path.with_name(name + ".gz" if compressed else name)
+
+
+def load_manifest(path):
+    """マニフェストのセグメント一覧を古い順に返す（無ければ空）"""
+    try:
+        data = json.loads(manifest_path(path).read_text())
+    except (OSError, ValueError):
+        return []
+    return sorted(data.get("segments", []), key=lambda s: s["seq"])
+
+
+def _write_manifest(path, segments):
+    target = manifest_path(path)
+    tmp = target.with_name(f".{target.name}.tmp")
+    tmp.write_text(json.dumps({"segments": segments}, ensure_ascii=False, indent=2))
+    os.replace(tmp, target)
+
+
+class SegmentStats:
+    """1セグメント分のレコードの時刻範囲・件数・task_id"""
+
+    def __init__(self):
+        self.first_ts = None
+        self.last_ts = None
+        self.count = 0
+        self.task_ids = set()
+        self.opened_at = time.time()
+
+    def add(self, record):
+        ts = record.get("ts")
+        if isinstance(ts, (int, float)):
+            if self.first_ts is None or ts < self.first_ts:
+                self.first_ts = ts
+            if self.last_ts is None or ts > self.last_ts:
+                self.last_ts = ts
+        task_id = record.get("task_id")
+        if task_id:
+            self.task_ids.add(task_id)
+        self.count += 1
+
+    def to_entry(self, seq, file_name):
+        return {
+            "seq": seq,
+            "file": file_name,
+            "first_ts": self.first_ts,
+            "last_ts": self.last_ts,
+            "count": self.count,
+            "task_ids": sorted(self.task_ids),
+        }
+
+
+class BusLogWriter:
+    """bus.jsonl への追記をまとめて行うライター
+
+    Args:
+        path: 書き込み先のパス
+        fsync: fsyncポリシー（"never" / "batch" / 間隔秒数）
+        max_bytes: このサイズを超えたらセグメントを切り替える（0で無効）
+        max_age: セグメントを開いてからこの秒数が経過したら切り替える（0で無効）
+        on_flush: 書き込みのたびに on_flush(seq, [(offset, length, record), ...]) で
+            呼ばれるコールバック（索引の更新用）
+    """
+
+    def __init__(self, path, fsync=FSYNC_NEVER, max_bytes=0, max_age=0, on_flush=None):
+        self.path = Path(path)
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.on_flush = on_flush
+        self.seq = None  # 現在のbus.jsonlが切り出されるときのセグメント番号
+        self._fp = None
+        self._pending = []
+        self._reopen = False
+        self._last_fsync = time.monotonic()
+        self._lock = threading.Lock()
+        self._manifest_lock = threading.Lock()  # 圧縮スレッドとのマニフェスト更新の排他
+        self._stats = None
+        self._compressor = None
+
+    def append(self, record):
+        """レコードをバッファに追加する（書き込みはflush()で行う）"""
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._pending.append((line, record))
+
+    def pending(self):
+        """未書き込みの行数"""
+        return len(self._pending)
+
+    def request_reopen(self):
+        """次の書き込み前にファイルを開き直す（シグナルハンドラから呼べる）"""
+        self._reopen = True
+
+    def flush(self):
+        """バッファの行を1回のwriteで書き込む
+
+        Returns:
+            int: 書き込んだ行数
+        """
+        with self._lock:
+            if self._reopen:
+                self._reopen = False
+                self._close()
+            if not self._pending:
+                return 0
+            if self._fp is None:
+                self._open()
+            offset = self._fp.tell()
+            written = []
+            for line, record in self._pending:
+                written.append((offset, len(line), record))
+                offset += len(line)
+                self._stats.add(record)
+            self._fp.write(b"".join(line for line, _ in self._pending))
+            self._fp.flush()
+            count = len(self._pending)
+            self._pending.clear()
+            self._maybe_fsync()
+            if self.on_flush is not None:
+                self.on_flush(self.seq, written)
+            if self._should_rotate():
+                self._rotate()
+            return count
+
+    def _open(self):
+        self._fp = open(self.path, "ab")
+        with self._manifest_lock:
+            segments = load_manifest(self.path)
+        self.seq = segments[-1]["seq"] + 1 if segments else 1
+        # 既存の内容（再起動前の書き込み分）もセグメントの統計に含める
+        self._stats = SegmentStats()
+        if self._fp.tell():
+            with open(self.path, "rb") as fp:
+                for record in _parse_lines(fp):
+                    self._stats.add(record)
+
+    def _maybe_fsync(self):
+        if self.fsync == FSYNC_NEVER:
+            return
+        now = time.monotonic()
+        if self.fsync == FSYNC_BATCH or now - self._last_fsync >= self.fsync:
+            os.fsync(self._fp.fileno())
+            self._last_fsync = now
+
+    def _should_rotate(self):
+        if self.max_bytes and self._fp.tell() >= self.max_bytes:
+            return True
+        if self.max_age and time.time() - self._stats.opened_at >= self.max_age:
+            return True
+        return False
+
+    def rotate(self):
+        """現在のbus.jsonlを強制的にセグメントとして切り出す"""
+        with self._lock:
+            if self._fp is None and self.path.exists() and self.path.stat().st_size:
+                self._open()
+            if self._fp is not None and self._fp.tell():
+                self._rotate()
+
+    def _rotate(self):
+        if self.fsync != FSYNC_NEVER:
+            os.fsync(self._fp.fileno())
+        stats = self._stats
+        self._close()
+
+        with self._manifest_lock:
+            segments = load_manifest(self.path)
+            seq = segments[-1]["seq"] + 1 if segments else 1
+            if seq != self.seq:
+                print(f"Segment number changed while open: {self.seq} -> {seq}")
+            plain = segment_path(self.path, seq, compressed=False)
+            os.replace(self.path, plain)
+            # tail -F が新しいファイルを追えるようすぐに作り直す
+            self.path.touch()
+            segments.append(stats.to_entry(seq, plain.name))
+            _write_manifest(self.path, segments)
+
+        # 圧縮は前回分の完了を待ってからバックグラウンドで行う
+        self._wait_compressor()
+        self._compressor = threading.Thread(target=self._compress, args=(seq, plain),
+                                            name="bus-log-compress", daemon=True)
+        self._compressor.start()
+
+    def _compress(self, seq, plain):
+        compressed = segment_path(self.path, seq)
+        tmp = compressed.with_name(f".{compressed.name}.tmp")
+        try:
+            blocks = _compress_blocks(plain, tmp)
+            os.replace(tmp, compressed)
+        except OSError as e:
+            print(f"Failed to compress {plain}: {e}")
+            return
+
+        with self._manifest_lock:
+            segments = load_manifest(self.path)
+            for entry in segments:
+                if entry["seq"] == seq:
+                    entry["file"] = compressed.name
+                    entry["blocks"] = blocks
+            _write_manifest(self.path, segments)
+        # 読み手はマニフェストの古いファイル名でも .gz にフォールバックできる
+        plain.unlink()
+
+    def _wait_compressor(self):
+        if self._compressor is not None:
+            self._compressor.join()
+            self._compressor = None
+
+    def _close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def close(self):
+        """残りを書き込んでファイルを閉じる"""
+        self.flush()
+        with self._lock:
+            if self._fp is not None and self.fsync != FSYNC_NEVER:
+                os.fsync(self._fp.fileno())
+            self._close()
+        self._wait_compressor()
+
+
+def _compress_blocks(src_path, dst_path, block_size=COMPRESS_BLOCK_SIZE):
+    """行境界で区切ったブロックごとに独立したgzipメンバーとして圧縮する
+
+    Returns:
+        list: 各ブロックの [展開後オフセット, 圧縮後オフセット]
+    """
+    blocks = []
+    uoffset = 0
+    with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+        while True:
+            chunk = src.read(block_size)
+            if not chunk:
+                break
+            if not chunk.endswith(b"\n"):
+                chunk += src.readline()
+            blocks.append([uoffset, dst.tell()])
+            dst.write(gzip.compress(chunk, mtime=0))
+            uoffset += len(chunk)
+    return blocks
+
+
+def _parse_lines(fp):
+    for line in fp:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # 書き込み途中の行等は読み飛ばす
+            continue
+
+
+def open_segment(path, entry, binary=False):
+    """セグメントを開く（圧縮前・圧縮後のどちらの名前でも開ける）
+
+    binary=Trueの場合は.gzも展開せずにバイナリのまま開く。
+    """
+    candidates = [path.with_name(entry["file"]),
+                  segment_path(path, entry["seq"], compressed=False),
+                  segment_path(path, entry["seq"])]
+    for candidate in candidates:
+        try:
+            if binary:
+                return open(candidate, "rb")
+            if candidate.name.endswith(".gz"):
+                return gzip.open(candidate, "rt", encoding="utf-8", errors="replace")
+            return open(candidate, encoding="utf-8", errors="replace")
+        except FileNotFoundError:
+            continue
+    return None
+
+
+def _segment_matches(entry, since, until, task_id):
+    if since is not None and entry.get("last_ts") is not None and entry["last_ts"] < since:
+        return False
+    if until is not None and entry.get("first_ts") is not None and entry["first_ts"] > until:
+        return False
+    if task_id is not None and task_id not in entry.get("task_ids", []):
+        return False
+    return True
+
+
+def read_bus_log(path, since=None, until=None, task_id=None):
+    """セグメントと現在のbus.jsonlをまたいでレコードを古い順に返す
+
+    マニフェストの時刻範囲・task_idで条件に合わないセグメントは開かない。
+    直近（since以降）の問い合わせであれば現在のファイルだけを読む。
+
+    Args:
+        path: bus.jsonl のパス
+        since: このts（ミリ秒）以降のレコードのみ
+        until: このts（ミリ秒）以前のレコードのみ
+        task_id: このtask_idのレコードのみ
+    """
+    path = Path(path)
+    sources = []
+    for entry in load_manifest(path):
+        if _segment_matches(entry, since, until, task_id):
+            sources.append(lambda entry=entry: open_segment(path, entry))
+    sources.append(lambda: open(path, encoding="utf-8", errors="replace") if path.exists() else None)
+
+    for open_source in sources:
+        fp = open_source()
+        if fp is None:
+            continue
+        with fp:
+            for record in _parse_lines(fp):
+                ts = record.get("ts")
+                if since is not None and isinstance(ts, (int, float)) and ts < since:
+                    continue
+                if until is not None and isinstance(ts, (int, float)) and ts > until:
+                    continue
+                if task_id is not None and record.get("task_id") != task_id:
+                    continue
+                yield record
+
+
+class _BlockReader:
+    """ブロック圧縮されたセグメントから目的のブロックだけを展開して読む"""
+
+    def __init__(self, fp, blocks):
+        self.fp = fp
+        self.starts = [b[0] for b in blocks]
+        self.blocks = blocks
+        self.cached = None  # (ブロック番号, 展開済みデータ)
+
+    def read(self, offset, length):
+        i = bisect.bisect_right(self.starts, offset) - 1
+        if self.cached is None or self.cached[0] != i:
+            start = self.blocks[i][1]
+            end = self.blocks[i + 1][1] if i + 1 < len(self.blocks) else None
+            self.fp.seek(start)
+            raw = self.fp.read(end - start) if end is not None else self.fp.read()
+            self.cached = (i, gzip.decompress(raw))
+        data = self.cached[1]
+        rel = offset - self.starts[i]
+        return data[rel:rel + length]
+
+
+class _PlainReader:
+    def __init__(self, fp):
+        self.fp = fp
+
+    def read(self, offset, length):
+        self.fp.seek(offset)
+        return self.fp.read(length)
+
+
+def _segment_reader(path, entry):
+    """セグメント（entryがNoneなら現在のbus.jsonl）を位置指定で読むリーダーを返す"""
+    if entry is None:
+        return _PlainReader(open(path, "rb")) if path.exists() else None
+    fp = open_segment(path, entry, binary=True)
+    if fp is None:
+        return None
+    if not fp.name.endswith(".gz"):
+        return _PlainReader(fp)
+    if entry.get("blocks"):
+        return _BlockReader(fp, entry["blocks"])
+    # ブロック情報の無いgzipは先頭から展開してシークする
+    return _PlainReader(gzip.GzipFile(fileobj=fp))
+
+
+def read_at(path, locations):
+    """（セグメント番号, オフセット, 長さ）の位置にあるレコードを順に返す
+
+    同じセグメントの位置はまとめて1回開いたファイルから読む。読めなかった
+    位置（ファイルの消失や書き込み途中の行）は読み飛ばす。
+    """
+    path = Path(path)
+    segments = {entry["seq"]: entry for entry in load_manifest(path)}
+    readers = {}
+    try:
+        for seq, offset, length in locations:
+            if seq not in readers:
+                readers[seq] = _segment_reader(path, segments.get(seq))
+            reader = readers[seq]
+            if reader is None:
+                continue
+            try:
+                yield json.loads(reader.read(offset, length))
+            except (OSError, ValueError):
+                continue
+    finally:
+        for reader in readers.values():
+            if reader is not None:
+                reader.fp.close()
@@ -10,72 +10,207 @@ Usage:
     busctl send --to unit:root-api --type instruct --data '{"text": "status"}'
     busctl post --from unit:root --type log --task root --data '{"msg": "Task started"}'
     busctl post --from unit:root --type result --task root --data '{"is_error": false}'
+    busctl batch --from unit:root --task root < messages.jsonl   # One line per post
+    busctl --serve state/busctl/root.fifo  # Per-unit helper for the bin/shim/busctl client
+    busctl blob get 3f2a9c                 # Print a payload stored in ROOT/blobs
+    busctl dlq list                        # Messages busd gave up on (mbox/*/dead)
+    busctl dlq replay bus/20250101T000000.000Z-0123456789ab.json  # Deliver one of them again
 """
 
-import argparse
 import json
 import os
+import socket
+import struct
 import sys
-import tempfile
-from datetime import datetime
-from pathlib import Path
-import random
-import string
-import yaml
+import time
+import types
+
+# argparse, pathlib and yaml are imported only where they are needed: busctl
+# runs for every post/send an agent makes, so import time is most of its run time.
 
 
 # Constants
 DEFAULT_FROM = "pmai"
 DEFAULT_TO_PMAI = "pmai"
 DEFAULT_TO_BUS = "bus"
-TIMESTAMP_FORMAT = "%Y%m%dT%H%M%S.%f"
+TIMESTAMP_FORMAT = "%Y%m%dT%H%M%S"
 RANDOM_ID_LENGTH = 12
+SOCKET_NAME = "bus.sock"  # busd listens here while running
+SOCKET_TIMEOUT = 5.0  # Seconds to wait for busd to acknowledge a message
+FRAME_HEADER = struct.Struct(">I")  # Big-endian length prefix of each frame
+SERVE_READ_SIZE = 65536  # Bytes read from the FIFO at a time by --serve
+PIPE_BUF = 4096  # FIFO writes up to this size are never interleaved with other writers
+ENVELOPE_MIN_SIZE = 8 * 1024  # Mailbox messages with at least this much data use the envelope format
+
+# Options of the commands agents run for every message, mapped to their argparse dest
+FAST_PATH_OPTIONS = {
+    'post': {'--from': 'from_', '--type': 'type', '--task': 'task', '--data': 'data'},
+    'send': {'--to': 'to', '--type': 'type', '--data': 'data'},
+}
 
 
 def get_timestamp():
     """Generate timestamp in format: YYYYMMDDTHHMMSS.sssZ"""
-    # Use timezone-aware UTC datetime to avoid deprecation warning
-    from datetime import timezone
-    return datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)[:-3] + "Z"
+    now = time.time()
+    return f"{time.strftime(TIMESTAMP_FORMAT, time.gmtime(now))}.{int(now * 1000) % 1000:03d}Z"
 
 
 def get_random_id():
     """Generate random hex string for unique IDs"""
-    return ''.join(random.choices(string.hexdigits.lower(), k=RANDOM_ID_LENGTH))
+    return os.urandom(RANDOM_ID_LENGTH // 2).hex()
 
 
 def get_timestamp_ms():
     """Get current timestamp in milliseconds since epoch"""
-    # Use timezone-aware UTC datetime to avoid deprecation warning
-    from datetime import timezone
-    return int(datetime.now(timezone.utc).timestamp() * 1000)
+    return int(time.time() * 1000)
+
+
+def encode_message(message):
+    """Serialize a message for a mailbox file
+
+    Messages with large data use the compact envelope format (see
+    envelope.py), the rest pretty-printed JSON. Set BUSCTL_FORMAT=json or
+    BUSCTL_FORMAT=envelope to always use one format.
+
+    Returns:
+        (bytes, str): File contents and file name suffix
+    """
+    format_ = os.environ.get('BUSCTL_FORMAT', 'auto')
+    if format_ != 'json':
+        data_json = json.dumps(message.get('data'), ensure_ascii=False, separators=(',', ':'))
+        if format_ == 'envelope' or len(data_json) >= ENVELOPE_MIN_SIZE:
+            import envelope
+            return envelope.encode(message, data_json), envelope.SUFFIX
+    return (json.dumps(message, ensure_ascii=False, indent=2) + '\n').encode('utf-8'), '.json'
 
 
 def atomic_write_json(dest_dir, message):
-    """Write JSON message atomically to destination directory"""
+    """Write a message atomically to destination directory (see encode_message)"""
+    from pathlib import Path
+
     dest_path = Path(dest_dir)
     dest_path.mkdir(parents=True, exist_ok=True)
     
     # Create temporary file
     ts = get_timestamp()
     rand = get_random_id()
-    tmp_name = f".tmp-{ts}-{rand}.json"
-    final_name = f"{ts}-{rand}.json"
+    content, suffix = encode_message(message)
+    tmp_name = f".tmp-{ts}-{rand}{suffix}"
+    final_name = f"{ts}-{rand}{suffix}"
     
     tmp_path = dest_path / tmp_name
     final_path = dest_path / final_name
     
     # Write to temp file
-    with open(tmp_path, 'w', encoding='utf-8') as f:
-        json.dump(message, f, ensure_ascii=False, indent=2)
-        f.write('\n')
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
     
     # Atomic rename
     tmp_path.rename(final_path)
     
+    # Let busd find the message without listing the directory (see inbox_index.py)
+    fd = os.open(dest_path / ".seq", os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, f"{final_name}\n".encode('utf-8'))
+    finally:
+        os.close(fd)
+    
     return final_path
 
 
+def _recv_exact(sock, size):
+    buf = b""
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("busd closed the connection before acknowledging")
+        buf += chunk
+    return buf
+
+
+def _exchange(sock, message):
+    """Send one message frame and wait for busd's acknowledgement"""
+    payload = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+    (length,) = FRAME_HEADER.unpack(_recv_exact(sock, FRAME_HEADER.size))
+    reply = json.loads(_recv_exact(sock, length))
+    if not reply.get("ok"):
+        raise ConnectionError(f"busd rejected message: {reply.get('error')}")
+
+
+def send_via_socket(root, message):
+    """Send a message to busd over ROOT/bus.sock and wait for its acknowledgement
+
+    busd acknowledges only after the message is durably journaled.
+
+    Raises:
+        OSError: busd is not listening or did not acknowledge the message
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(SOCKET_TIMEOUT)
+        sock.connect(os.path.join(root, SOCKET_NAME))
+        _exchange(sock, message)
+
+
+class BusConnection:
+    """Long-lived connection to ROOT/bus.sock, reconnected when busd restarts"""
+
+    def __init__(self, root):
+        self.root = root
+        self.sock = None
+
+    def send(self, message):
+        """Send a message and wait for its acknowledgement (same errors as send_via_socket)"""
+        for attempt in range(2):
+            if self.sock is None:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(SOCKET_TIMEOUT)
+                try:
+                    sock.connect(os.path.join(self.root, SOCKET_NAME))
+                except OSError:
+                    sock.close()
+                    raise
+                self.sock = sock
+            try:
+                _exchange(self.sock, message)
+                return
+            except OSError:
+                # busd may have restarted since the last message: reconnect once
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def deliver(root, mailbox, message, connection=None):
+    """Deliver a message to busd
+
+    Tries busd's socket first and falls back to writing the mailbox file, so
+    messages still queue up while busd is down. Set BUSCTL_TRANSPORT=file to
+    always use the mailbox.
+
+    Args:
+        connection: BusConnection to reuse instead of connecting for this message
+
+    Returns:
+        Path of the mailbox file, or None if busd acknowledged it over the socket
+    """
+    if os.environ.get('BUSCTL_TRANSPORT', 'auto') != 'file' and os.path.exists(os.path.join(root, SOCKET_NAME)):
+        try:
+            if connection is not None:
+                connection.send(message)
+            else:
+                send_via_socket(root, message)
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Warning: busd socket unavailable ({e}), using mailbox", file=sys.stderr)
+    return atomic_write_json(os.path.join(root, "mbox", mailbox, "in"), message)
+
+
 def detect_unit_context():
     """Detect unit context from current directory
     
@@ -84,6 +219,10 @@ def detect_unit_context():
     2. If .parent_unit exists -> "{parent_id}-{task_id}"
        where task_id is extracted from directory name or task-breakdown.yml
     """
+    from pathlib import Path
+
+    import yaml
+
     cwd = Path.cwd()
     
     # Check for requirements.yml
@@ -224,9 +363,8 @@ def handle_spawn(args, root):
         }
     }
     
-    # Write to mailbox
-    dest = Path(root) / "mbox" / "bus" / "in"
-    atomic_write_json(dest, message)
+    # Deliver to busd
+    deliver(root, "bus", message)
     
     print(f"Spawned unit: {unit_id}")
     if parent_id:
@@ -235,6 +373,10 @@ def handle_spawn(args, root):
 
 def handle_spawn_from_breakdown(args, root):
     """Handle spawn --from-breakdown command"""
+    from pathlib import Path
+
+    import yaml
+
     # Auto-detect unit context
     unit_id, parent_id, target_repo = detect_unit_context()
     
@@ -319,14 +461,25 @@ def handle_spawn_from_breakdown(args, root):
             }
         }
         
-        # Write to mailbox
-        dest = Path(root) / "mbox" / "bus" / "in"
-        print(f"[DEBUG] Writing spawn message for {child_unit_id} to {dest}", file=sys.stderr)
+        # Optional scope hint: busd checks out only these paths (sparse worktree)
+        paths = task.get('paths')
+        if isinstance(paths, str):
+            paths = [paths]
+        if paths:
+            if isinstance(paths, list) and all(isinstance(p, str) and p for p in paths):
+                message["data"]["paths"] = paths
+            else:
+                print(f"Warning: 'paths' of task {task_id} must be a list of paths, checking out everything")
+        
+        # Deliver to busd
+        print(f"[DEBUG] Delivering spawn message for {child_unit_id}", file=sys.stderr)
         print(f"[DEBUG] Message content: {json.dumps(message, indent=2)}", file=sys.stderr)
-        final_path = atomic_write_json(dest, message)
+        final_path = deliver(root, "bus", message)
         
         # Verify file was written
-        if final_path.exists():
+        if final_path is None:
+            print(f"[DEBUG] busd acknowledged message over {SOCKET_NAME}", file=sys.stderr)
+        elif final_path.exists():
             print(f"[DEBUG] Successfully wrote file: {final_path}", file=sys.stderr)
         else:
             print(f"[DEBUG] WARNING: File not found after write: {final_path}", file=sys.stderr)
@@ -365,28 +518,28 @@ def handle_send(args, root):
     
     # Determine destination mailbox
     agent_name = args.to.replace(':', '-')
-    dest = Path(root) / "mbox" / agent_name / "in"
     
-    # Write to mailbox
-    atomic_write_json(dest, message)
+    # Deliver to busd
+    deliver(root, agent_name, message)
 
 
-def handle_post(args, root):
-    """Handle post command"""
+def build_post(args):
+    """Build the message for a post command
+
+    Raises:
+        ValueError: --data is not valid JSON, or a result lacks is_error
+    """
     # Parse JSON data
     try:
         data = json.loads(args.data)
     except json.JSONDecodeError as e:
-        print(f"Error: Invalid JSON in --data: {e}", file=sys.stderr)
-        sys.exit(1)
+        raise ValueError(f"Invalid JSON in --data: {e}")
     
     # Validate result type requires is_error field
     if args.type == "result" and "is_error" not in data:
-        print("Error: 'result' type requires 'is_error' field in data", file=sys.stderr)
-        sys.exit(1)
+        raise ValueError("'result' type requires 'is_error' field in data")
     
-    # Build message
-    message = {
+    return {
         "id": f"{get_timestamp()}-{get_random_id()}",
         "ts": get_timestamp_ms(),
         "from": args.from_,
@@ -395,14 +548,339 @@ def handle_post(args, root):
         "task_id": args.task,
         "data": data
     }
+
+
+def handle_post(args, root):
+    """Handle post command"""
+    try:
+        message = build_post(args)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    
+    if forward_to_helper(args):
+        return
+    # Deliver to busd
+    deliver(root, "pmai", message)
+
+
+def handle_blob(args, root):
+    """Handle blob get command"""
+    from blobstore import BlobStore
+    
+    store = BlobStore(os.path.join(root, "blobs"))
+    try:
+        content = store.get(store.find(args.digest))
+    except KeyError:
+        print(f"Error: no blob matches {args.digest} (give at least 6 hex digits)", file=sys.stderr)
+        sys.exit(1)
+    
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(content)
+    else:
+        sys.stdout.buffer.write(content)
+        sys.stdout.flush()
+
+
+def handle_dlq(args, root):
+    """Handle dlq list/replay commands"""
+    from retry_queue import list_dead, replay
+    
+    entries = list_dead(os.path.join(root, "mbox"))
+    if args.mailbox:
+        entries = [e for e in entries if e["mailbox"] == args.mailbox]
+    
+    if args.dlq_command == 'list':
+        for e in entries:
+            print(f"{e['mailbox']}/{e['file']}\t{e['type']}\t{e['id']}\t"
+                  f"attempts={e['attempts']}\t{e['error']}")
+        return
+    
+    # replay
+    if args.all:
+        selected = entries
+    elif args.names:
+        by_name = {}
+        for e in entries:
+            by_name[e["file"]] = by_name[f"{e['mailbox']}/{e['file']}"] = e
+        unknown = [name for name in args.names if name not in by_name]
+        if unknown:
+            print(f"Error: not in the dead letter mailboxes: {', '.join(unknown)}", file=sys.stderr)
+            sys.exit(1)
+        selected = [by_name[name] for name in args.names]
+    else:
+        print("Error: give the messages to replay (as shown by 'busctl dlq list') or --all", file=sys.stderr)
+        sys.exit(1)
     
-    # Write to mailbox
-    dest = Path(root) / "mbox" / "pmai" / "in"
-    atomic_write_json(dest, message)
+    for e in selected:
+        replay(e["path"])
+        print(f"Replayed {e['mailbox']}/{e['file']}")
+
+
+def take_netstrings(buf):
+    """Remove the complete netstrings at the front of buf and return their payloads
+
+    A netstring is `<length>:<bytes>,` (e.g. b"4:post,"). An incomplete
+    netstring at the end stays in buf.
+
+    Raises:
+        ValueError: buf does not start with a netstring
+    """
+    items = []
+    while buf:
+        colon = buf.find(b":")
+        if colon < 0:
+            if len(buf) > 20:
+                raise ValueError("missing netstring length")
+            break
+        if not buf[:colon].isdigit():
+            raise ValueError("invalid netstring length")
+        length = int(buf[:colon])
+        end = colon + 1 + length
+        if len(buf) <= end:
+            break
+        if buf[end] != ord(","):
+            raise ValueError("netstring not terminated by ','")
+        items.append(bytes(buf[colon + 1:end]))
+        del buf[:end + 1]
+    return items
+
+
+def netstring(data):
+    """Encode bytes as a netstring (see take_netstrings)"""
+    return str(len(data)).encode('ascii') + b":" + data + b","
+
+
+def forward_to_helper(args):
+    """Hand a validated post to this unit's --serve helper, if one is running
+
+    bin/shim/busctl sends plain posts through the helper and runs this
+    program for the rest (results, unusual command lines). Those go through
+    the helper as well once they are validated, so that they reach busd in
+    order with the posts before them.
+
+    Returns:
+        True if the helper took the post
+    """
+    fifo_path = os.environ.get('BUSCTL_FIFO')
+    if not fifo_path:
+        return False
+    argv = ["post", "--from", args.from_, "--type", args.type, "--task", args.task, "--data", args.data]
+    record = netstring(b"".join(netstring(arg.encode('utf-8')) for arg in argv))
+    if len(record) > PIPE_BUF:
+        return False
+    try:
+        with open(os.path.splitext(fifo_path)[0] + ".pid") as f:
+            pid = int(f.read())
+        os.kill(pid, 0)
+        # Fails with ENXIO instead of blocking when nothing has the FIFO open for reading
+        fd = os.open(fifo_path, os.O_WRONLY | os.O_NONBLOCK)
+    except (OSError, ValueError):
+        return False
+    try:
+        os.write(fd, record)
+    except OSError:
+        return False  # Full: the helper is stuck
+    finally:
+        os.close(fd)
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False  # Exited meanwhile: deliver it directly rather than lose it
+    return True
+
+
+def serve_command(root, record, connection):
+    """Run one command received by --serve (a netstring of netstring arguments)
+
+    Returns:
+        The error message if the post was not delivered, otherwise None
+    """
+    try:
+        buf = bytearray(record)
+        argv = [arg.decode('utf-8') for arg in take_netstrings(buf)]
+        if buf:
+            raise ValueError("truncated argument")
+        args = parse_fast(argv)
+        if args is None:
+            args = create_parser().parse_args(argv)
+        if args.command != 'post':
+            raise ValueError(f"only post is served, got {args.command}")
+        message = build_post(args)
+    except ValueError as e:
+        return str(e)
+    except SystemExit:
+        return "invalid command line"  # argparse has printed the details
+    
+    try:
+        deliver(root, "pmai", message, connection)
+    except OSError as e:
+        return f"could not deliver {message['id']}: {e}"
+    return None
+
+
+def serve(root, fifo_path):
+    """Run the per-unit helper behind bin/shim/busctl (busctl --serve FIFO)
+
+    The shim writes each `busctl post` command line into the FIFO as one
+    netstring, using only shell builtins. This process parses the commands
+    and forwards the messages to busd over one long-lived connection. The
+    shim gets no reply, so errors go to this helper's output and to
+    <unit>.errors, which the shim prints on its next call.
+    """
+    import signal
+
+    pid_path = os.path.splitext(fifo_path)[0] + ".pid"
+    errors_path = os.path.splitext(fifo_path)[0] + ".errors"
+
+    def run(records):
+        for record in records:
+            error = serve_command(root, record, connection)
+            if error is not None:
+                print(f"Error: {error}", file=sys.stderr, flush=True)
+                with open(errors_path, 'a', encoding='utf-8') as f:
+                    f.write(error.replace("\n", " ") + "\n")
+
+    if os.path.exists(fifo_path):
+        os.unlink(fifo_path)
+    os.mkfifo(fifo_path, 0o600)
+    # Also open for writing so that reads never see EOF between clients
+    fd = os.open(fifo_path, os.O_RDWR)
+    # The shim only writes to the FIFO once this names a live process
+    with open(pid_path + ".tmp", 'w') as f:
+        f.write(f"{os.getpid()}\n")
+    os.replace(pid_path + ".tmp", pid_path)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Serving busctl on {fifo_path}", flush=True)
+    
+    connection = BusConnection(root)
+    buf = bytearray()
+    try:
+        while True:
+            buf += os.read(fd, SERVE_READ_SIZE)
+            try:
+                records = take_netstrings(buf)
+            except ValueError as e:
+                print(f"Error: discarding unreadable input: {e}", file=sys.stderr, flush=True)
+                buf.clear()
+                continue
+            run(records)
+    finally:
+        # New shims run bin/busctl from here on; forward what was written before
+        try:
+            os.unlink(pid_path)
+        except FileNotFoundError:
+            pass
+        os.set_blocking(fd, False)
+        try:
+            while True:
+                buf += os.read(fd, SERVE_READ_SIZE)
+        except BlockingIOError:
+            pass
+        try:
+            run(take_netstrings(buf))
+        except ValueError:
+            pass
+        connection.close()
+        os.close(fd)
+        try:
+            os.unlink(fifo_path)
+        except FileNotFoundError:
+            pass
+
+
+def parse_fast(argv):
+    """Parse a plain post/send command line without argparse
+
+    Only accepts every option of the command spelled out once as
+    `--option value`. Anything else (spawn, --help, --opt=value, abbreviations,
+    missing options) returns None and goes through argparse.
+    """
+    if not argv or argv[0] not in FAST_PATH_OPTIONS:
+        return None
+    options = FAST_PATH_OPTIONS[argv[0]]
+    if len(argv) != 1 + 2 * len(options):
+        return None
+    values = {}
+    for flag, value in zip(argv[1::2], argv[2::2]):
+        if flag not in options or options[flag] in values or value.startswith('-'):
+            return None
+        values[options[flag]] = value
+    return types.SimpleNamespace(serve=None, command=argv[0], **values)
+
+
+def build_batch(lines, from_=None, task=None):
+    """Build the messages of a batch from newline-delimited JSON specs
+
+    Each non-blank line is a post spec such as {"type": "log", "data": {...}}.
+    A spec may set "from" and "task" itself, otherwise the defaults are used.
+
+    Raises:
+        ValueError: A line is not a valid spec (the message names the line)
+    """
+    messages = []
+    for lineno, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            spec = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"line {lineno}: invalid JSON: {e}")
+        if not isinstance(spec, dict) or "type" not in spec or "data" not in spec:
+            raise ValueError(f"line {lineno}: expected an object with 'type' and 'data'")
+        if spec["type"] == "result" and "is_error" not in spec["data"]:
+            raise ValueError(f"line {lineno}: 'result' type requires 'is_error' field in data")
+        sender = spec.get("from", from_)
+        task_id = spec.get("task", task)
+        if sender is None or task_id is None:
+            raise ValueError(f"line {lineno}: no 'from'/'task' in the spec and no --from/--task given")
+        messages.append({
+            "id": f"{get_timestamp()}-{get_random_id()}",
+            "ts": get_timestamp_ms(),
+            "from": sender,
+            "to": "pmai",
+            "type": spec["type"],
+            "task_id": task_id,
+            "data": spec["data"]
+        })
+    return messages
+
+
+def handle_batch(args, root):
+    """Handle batch command"""
+    try:
+        if args.file and args.file != '-':
+            with open(args.file, 'r', encoding='utf-8') as f:
+                messages = build_batch(f, args.from_, args.task)
+        else:
+            messages = build_batch(sys.stdin, args.from_, args.task)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    
+    if not messages:
+        return
+    
+    # One envelope: busd unpacks it and processes the messages in order
+    envelope = {
+        "id": f"{get_timestamp()}-{get_random_id()}",
+        "ts": get_timestamp_ms(),
+        "from": messages[0]["from"],
+        "to": "pmai",
+        "type": "batch",
+        "task_id": messages[0]["task_id"],
+        "data": {"messages": messages}
+    }
+    
+    # Deliver to busd
+    deliver(root, "pmai", envelope)
 
 
 def create_parser():
     """Create and configure argument parser"""
+    import argparse
+
     parser = argparse.ArgumentParser(
         description='Message bus control utility for AI App Studio',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -422,9 +900,24 @@ Examples:
   
   # Post result from agent
   %(prog)s post --from impl:T001 --type result --task T001 --data '{"is_error": false, "summary": "Done"}'
+  
+  # Post several messages at once (one JSON spec per line, delivered in order)
+  %(prog)s batch --from impl:T001 --task T001 <<'EOF'
+  {"type": "log", "data": {"msg": "Tests pass"}}
+  {"type": "result", "data": {"is_error": false, "summary": "Done"}}
+  EOF
+  
+  # Fetch a large payload that busd stored as {"$blob": "<sha256>", ...}
+  %(prog)s blob get 3f2a9c > output.txt
+  
+  # List messages busd gave up on after repeated failures, then deliver them again
+  %(prog)s dlq list
+  %(prog)s dlq replay --all
 '''
     )
     
+    parser.add_argument('--serve', metavar='FIFO', help='Run the per-unit helper that serves bin/shim/busctl through FIFO')
+    
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
     
     # Spawn command (simplified)
@@ -445,6 +938,29 @@ Examples:
     post_parser.add_argument('--task', required=True, help='Task ID')
     post_parser.add_argument('--data', required=True, help='JSON data (for result type, must include is_error)')
     
+    # Batch command
+    batch_parser = subparsers.add_parser('batch', help='Post many messages from stdin or a file in one delivery')
+    batch_parser.add_argument('--from', dest='from_', help='Default source agent for specs without "from"')
+    batch_parser.add_argument('--task', help='Default task ID for specs without "task"')
+    batch_parser.add_argument('--file', help='Read specs from this file instead of stdin ("-" for stdin)')
+    
+    # Blob command
+    blob_parser = subparsers.add_parser('blob', help='Read payloads stored in ROOT/blobs')
+    blob_subparsers = blob_parser.add_subparsers(dest='blob_command', required=True)
+    blob_get_parser = blob_subparsers.add_parser('get', help='Print a blob')
+    blob_get_parser.add_argument('digest', help='SHA-256 of the blob, or a unique prefix of at least 6 hex digits')
+    blob_get_parser.add_argument('--output', '-o', help='Write the blob to this file instead of stdout')
+    
+    # Dead letter command
+    dlq_parser = subparsers.add_parser('dlq', help='Inspect and replay messages busd moved to mbox/*/dead')
+    dlq_subparsers = dlq_parser.add_subparsers(dest='dlq_command', required=True)
+    dlq_list_parser = dlq_subparsers.add_parser('list', help='List dead letters with their errors')
+    dlq_list_parser.add_argument('--mailbox', help='Only this mailbox (e.g. bus, pmai)')
+    dlq_replay_parser = dlq_subparsers.add_parser('replay', help='Move dead letters back to their inbox')
+    dlq_replay_parser.add_argument('names', nargs='*', help='Messages as shown by "dlq list" (MAILBOX/FILE or FILE)')
+    dlq_replay_parser.add_argument('--all', action='store_true', help='Replay every dead letter')
+    dlq_replay_parser.add_argument('--mailbox', help='Only this mailbox (e.g. bus, pmai)')
+    
     return parser
 
 
@@ -456,11 +972,15 @@ def main():
     else:
         root = os.path.join(os.getcwd(), ".ai-app-studio")
     
-    # Create and configure parser
-    parser = create_parser()
+    # Parse arguments (argparse only when the fast path does not apply)
+    args = parse_fast(sys.argv[1:])
+    if args is None:
+        parser = create_parser()
+        args = parser.parse_args()
     
-    # Parse arguments
-    args = parser.parse_args()
+    if args.serve:
+        serve(root, args.serve)
+        sys.exit(0)
     
     if not args.command:
         parser.print_help()
@@ -474,6 +994,12 @@ def main():
             handle_send(args, root)
         elif args.command == 'post':
             handle_post(args, root)
+        elif args.command == 'batch':
+            handle_batch(args, root)
+        elif args.command == 'blob':
+            handle_blob(args, root)
+        elif args.command == 'dlq':
+            handle_dlq(args, root)
     except Exception as e:
         import traceback
         print(f"Error: {e}", file=sys.stderr)
@@ -3,10 +3,18 @@
 busd - tmuxオーケストレータ兼メッセージバスデーモン
 
 役割:
-- mailboxの投函ファイルを監視（ポーリング）
+- mailboxの投函ファイルを監視（inotify、使えない環境では適応的ポーリング）。新着は受信箱の.seqから見つける
+- 処理済みのメッセージIDを台帳（state/ledger.sqlite）に記録し、再配信されたメッセージの副作用を繰り返さない
+- 処理に失敗した投函は間隔を伸ばしながら再試行し、上限に達したら mbox/<name>/dead/ に移す
+- 走査で集めたメッセージは宛先ごとのシャードに分けてワーカーで並列に処理（宛先ごとの順序は保つ）
+- bus.sockでbusctlからのメッセージを直接受け付け（ジャーナルに記録してから応答）
+- ユニットごとにbusctl --serveを起動し、ペインのbusctl postをFIFO経由で転送させる
 - spawnメッセージ: git branch/worktree作成、tmux pane起動、pipe-pane設定
-- sendメッセージ: tmux send-keys実行
-- postメッセージ: logs/bus.jsonl追記、state/tasks.json更新
+- worktreeはプールで事前にチェックアウトしておき、spawnではブランチの切り替えと移動だけを行う
+- spawnにpaths（task-breakdown.ymlのpaths:）があれば、そのパスだけをsparse-checkoutする
+- 終了したユニットのworktree・ブランチ・ペイン・生ログは、保持の方針に従ってバックグラウンドで片付ける
+- sendメッセージ: tmux send-keys実行（tmux制御モードの常駐接続経由）
+- postメッセージ: logs/bus.jsonl追記（一定サイズ・時間でgzセグメントに切り替え）、state/tasks.json更新（差分はstate/journal.jsonlに追記し定期的に集約）
 """
 
 import json
@@ -16,11 +24,36 @@ import time
 import glob
 import subprocess
 import shlex
-import shutil
+import signal
+import sqlite3
+import threading
+import traceback
 import yaml
 from pathlib import Path
 from datetime import datetime, timezone
 
+# bin/ 配下の補助モジュールを読み込めるようにする（bin.busd としてimportされた場合も含む）
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mailbox_watcher import create_watcher
+from inbox_index import InboxIndex, append_sequence
+from dispatcher import ShardedDispatcher
+from spawn_pipeline import SpawnInProgress, SpawnPipeline
+from tmux_client import TmuxClient, TmuxConnectionError, batch_argv
+from state_journal import StateJournal, apply_records, write_snapshot
+from bus_log import BusLogWriter, parse_fsync_policy
+from bus_index import BusIndex
+from event_stream import EventStreamServer
+from ingest_server import IngestServer
+from blobstore import BlobStore, spill
+from message_ledger import MessageLedger
+from retry_queue import RetryQueue, bury
+from worktree_pool import WorktreePool
+from repo_info import RepoInfo
+from provision import Provisioner
+from reaper import Reaper, select_reapable
+import envelope
+
 # ターゲットリポジトリの決定
 # 優先順位: 1) コマンドライン引数 2) カレントディレクトリ
 # 注: 環境変数は使わない（汎用性のため）
@@ -35,9 +68,33 @@ print(f"busd starting with TARGET_REPO: {TARGET_REPO}")
 AI_APP_STUDIO_ROOT = Path(__file__).parent.parent
 
 # タイミング関連の定数
-POLLING_INTERVAL = 0.5  # メールボックスのポーリング間隔（秒）
+POLLING_INTERVAL = 0.5  # メールボックスのポーリング間隔（秒）。ポーリング時の最長間隔
+POLLING_MIN_INTERVAL = 0.01  # 適応的ポーリングの最短間隔（秒）
+WATCHER_IDLE_TIMEOUT = 5.0  # イベント待機の最大時間（秒）。取りこぼし対策の定期走査
+WATCHER_BACKEND = os.environ.get("BUSD_WATCHER")  # "inotify" / "poll" / 未設定で自動選択
+# .seqに載らない投函を拾うため、受信箱全体を走査し直す間隔（秒）
+MAILBOX_RESCAN_INTERVAL = float(os.environ.get("BUSD_MAILBOX_RESCAN_INTERVAL", "30"))
+# 処理に失敗した投函の再試行: 待ち時間は1回ごとに倍（上限あり）、上限回数でdead/に移す
+RETRY_BASE_DELAY = float(os.environ.get("BUSD_RETRY_BASE_DELAY", "1"))  # 秒
+RETRY_MAX_DELAY = float(os.environ.get("BUSD_RETRY_MAX_DELAY", "300"))  # 秒
+RETRY_MAX_ATTEMPTS = int(os.environ.get("BUSD_RETRY_MAX_ATTEMPTS", "5"))
 TMUX_OPERATION_DELAY = 0.1  # tmux操作後の待機時間（秒）
 CLAUDE_STARTUP_DELAY = 5  # Claude Code起動待機時間（秒）
+SPAWN_WAIT_DELAY = 0.5  # 起動中のユニット宛のsendを再試行する間隔（秒）
+SPAWN_WORKERS = int(os.environ.get("BUSD_SPAWN_WORKERS", "4"))  # spawnパイプラインのワーカー数（0で同期実行）
+DISPATCH_WORKERS = int(os.environ.get("BUSD_DISPATCH_WORKERS", "4"))  # メッセージ処理のワーカー数（0で同期実行）
+# sparseなworktreeでも常にチェックアウトするディレクトリ（copy_project_filesが置くもの。
+# ルート直下のファイルはコーンモードでは常に含まれる）
+SPARSE_ALWAYS_PATHS = (".claude",)
+# フレーム（frames/*/CLAUDE.md）をworktreeにハードリンクで置くか（0でreflink・コピーのみ）
+PROVISION_HARDLINK_FRAMES = os.environ.get("BUSD_PROVISION_HARDLINK", "1") != "0"
+# 終了したユニットの後始末（BUSD_REAPER=0で無効）
+REAPER_ENABLED = os.environ.get("BUSD_REAPER", "1") != "0"
+REAP_INTERVAL = float(os.environ.get("BUSD_REAP_INTERVAL", "60"))  # 対象を選ぶ間隔（秒）
+REAP_KEEP = int(os.environ.get("BUSD_REAP_KEEP", "20"))  # 直近に終了したこの数のユニットは残す
+REAP_KEEP_AGE = float(os.environ.get("BUSD_REAP_KEEP_AGE", "3600"))  # 終了からこの秒数は残す
+REAP_KEEP_FAILED = os.environ.get("BUSD_REAP_KEEP_FAILED", "1") != "0"  # 失敗したユニットは残す
+WORKTREE_POOL_SIZE = int(os.environ.get("BUSD_WORKTREE_POOL", "2"))  # 事前に用意するworktreeの数（0で使わない）
 TEXT_PREVIEW_LENGTH = 50  # テキストプレビューの最大文字数
 MS_PER_SECOND = 1000  # ミリ秒変換係数
 
@@ -67,6 +124,41 @@ WORK.mkdir(exist_ok=True)
 BUS_LOG = LOGS / "bus.jsonl"
 PANES_FILE = STATE / "panes.json"
 TASKS_FILE = STATE / "tasks.json"
+JOURNAL_FILE = STATE / "journal.jsonl"  # tasks/pane_mapの差分ジャーナル
+BLOBS = ROOT / "blobs"  # 大きなペイロードの保存先（blobstore.py）
+
+# 状態永続化の設定
+STATE_COMPACT_EVERY = 1000  # ジャーナルがこの件数に達したらスナップショットへ集約
+STATE_COMPACT_INTERVAL = 30.0  # 未集約の差分があればこの間隔（秒）で集約
+STATE_FSYNC = os.environ.get("BUSD_STATE_FSYNC", "0") == "1"  # ジャーナル追記ごとにfsyncするか
+
+# bus.jsonlのfsyncポリシー: never / batch（走査ごと）/ ミリ秒数（その間隔ごと）
+BUS_LOG_FSYNC = parse_fsync_policy(os.environ.get("BUSD_BUS_LOG_FSYNC", "never"))
+# bus.jsonlのセグメント切り替え（どちらも0で無効）
+BUS_LOG_MAX_BYTES = int(os.environ.get("BUSD_BUS_LOG_MAX_BYTES", str(64 * 1024 * 1024)))
+BUS_LOG_MAX_AGE = float(os.environ.get("BUSD_BUS_LOG_MAX_AGE", "86400"))  # 秒
+# bus.jsonlの索引（logs/bus.index.sqlite、busqが使う）を書き込みと同時に更新するか
+BUS_INDEX_ENABLED = os.environ.get("BUSD_BUS_INDEX", "1") != "0"
+# イベント購読ソケット（busq --follow 等が接続する）
+EVENTS_SOCK = STATE / "events.sock"
+EVENTS_ENABLED = os.environ.get("BUSD_EVENTS", "1") != "0"
+# busctlからのソケット経由の投函（使えない場合busctlはメールボックスに書き込む）
+INGEST_SOCK = ROOT / "bus.sock"
+INGEST_JOURNAL = STATE / "ingest.jsonl"  # 応答済み・未処理のメッセージ
+INGEST_ENABLED = os.environ.get("BUSD_INGEST", "1") != "0"
+INGEST_FSYNC = os.environ.get("BUSD_INGEST_FSYNC", "1") != "0"  # 応答前にfsyncするか
+# postのdataでこのバイト数以上のフィールドはブロブに移し、bus.jsonlとtasks.jsonには
+# 参照とプレビューだけを書く（0で無効）
+BLOB_MIN_SIZE = int(os.environ.get("BUSD_BLOB_MIN_SIZE", "4096"))
+# 処理済みメッセージIDの台帳。同じIDの再配信は処理済みとして扱う
+LEDGER_FILE = STATE / "ledger.sqlite"
+LEDGER_ENABLED = os.environ.get("BUSD_LEDGER", "1") != "0"
+LEDGER_CACHE_SIZE = int(os.environ.get("BUSD_LEDGER_CACHE_SIZE", "10000"))  # メモリ上に保持するID数
+LEDGER_RETENTION = float(os.environ.get("BUSD_LEDGER_RETENTION", str(7 * 86400)))  # IDを保持する期間（秒）
+# ユニットごとのbusctl常駐ヘルパー（busctl --serve）。ペインのbusctl postは
+# bin/shim/busctl からFIFO経由でヘルパーに渡り、Pythonを起動しない
+BUSCTL_SERVE_DIR = STATE / "busctl"  # FIFOとpidファイル
+BUSCTL_SERVE_ENABLED = os.environ.get("BUSD_BUSCTL_SERVE", "1") != "0"
 
 # ログファイルの初期化
 BUS_LOG.touch(exist_ok=True)
@@ -75,6 +167,8 @@ BUS_LOG.touch(exist_ok=True)
 TMUX_SESSION = os.environ.get("TMUX_SESSION", "cc")
 CLAUDE_CMD = os.environ.get("CLAUDE_CMD", 
     "claude --dangerously-skip-permissions --allowedTools Bash,Edit --add-dir .")
+# tmux制御モードの常駐接続を使うか（"0"でコマンドごとにtmuxを起動）
+TMUX_CONTROL_MODE = os.environ.get("BUSD_TMUX_CONTROL", "1") != "0"
 
 # レイアウト設定
 LAYOUT_RIGHT_BASE_PANE = 2  # 右側ペインのベースインデックス
@@ -88,6 +182,40 @@ NOTIFICATION_DELAY = 0.1  # 連続通知時の待機時間（秒）
 # グローバル状態
 pane_map = {}  # task_id -> tmux pane id (e.g. 'cc:T001.0')
 tasks = {}     # task_id -> task info
+spawn_pipeline = None  # main()で生成。Noneの場合handle_spawnは同期実行
+dispatcher = None  # main()で生成。Noneの場合メッセージはメインスレッドで順に処理
+tmux_client = None  # main()で接続。Noneの場合tmuxコマンドごとにプロセスを起動
+event_server = None  # main()で起動。Noneの場合イベントは配信しない
+ingest_server = None  # main()で起動。Noneの場合メールボックスのみを処理
+busctl_servers = {}  # task_id -> busctl --serve のプロセス
+ledger = None  # main()で開く。Noneの場合は再配信を検出しない
+worktree_pool = None  # main()で生成。Noneの場合worktreeはspawnのたびにチェックアウトする
+reaper = None  # main()で生成。Noneの場合終了したユニットを片付けない
+_journal = None  # 状態ジャーナル（_get_journal()で生成）
+_bus_log = None  # bus.jsonlのライター（_get_bus_log()で生成）
+_bus_index = None  # bus.jsonlの索引（_get_bus_index()で生成）
+_blob_store = None  # ブロブストア（_get_blob_store()で生成）
+_inbox_indexes = {}  # 受信箱ディレクトリ -> InboxIndex（_get_inbox_index()で生成）
+_repo_info = None  # TARGET_REPOのgitの状態（_get_repo_info()で生成）
+_provisioner = None  # プロジェクトファイルの配置（_get_provisioner()で生成）
+retry_queue = RetryQueue(RETRY_BASE_DELAY, RETRY_MAX_DELAY, RETRY_MAX_ATTEMPTS)  # 投函ファイル -> 再試行の予定
+_in_flight = {}  # 処理を投入し、結果をまだ反映していない投函ファイル -> msg
+_received = {}  # 処理を投入したソケット経由のメッセージ seq -> [msg, 状態（running/retry/done）]
+_finished = []  # 処理を終え、結果をまだ反映していないメッセージ [(token, error)]
+_last_compaction = time.monotonic()
+_last_reap = 0.0
+_dirty_tasks = set()  # 変更済みで未永続化のtask_id（_state_lockで保護する）
+
+# タスク状態の永続化カウンタ（writes: ジャーナルへの書き込み回数、
+# avoided: 変更なし・同一走査内での集約により省略した書き込み回数）
+state_metrics = {"writes": 0, "avoided": 0}
+
+# gitのref/worktree操作はリポジトリ単位でロックを取るため直列化する
+_git_lock = threading.Lock()
+# ディスパッチャのワーカーから並行して更新される状態の保護
+_state_lock = threading.Lock()  # tasks・_dirty_tasks・state_metrics
+_children_status_lock = threading.Lock()  # children-status.ymlの読み書き
+_spawn_lock = threading.Lock()  # 同期実行のspawnでのペインの配置
 
 
 def sh(cmd, check=True):
@@ -104,8 +232,176 @@ def sh(cmd, check=True):
         return None
 
 
+def tmux(*args, check=True):
+    """tmuxコマンドを実行して出力を返す
+    
+    制御モード接続があればそれを使い、なければtmuxを直接起動する（シェルは経由しない）。
+    check=Falseの場合、失敗時はNoneを返す。
+    """
+    return tmux_batch([args], check=check)
+
+
+def tmux_batch(commands, check=True):
+    """複数のtmuxコマンドを1回の呼び出し（cmd1 \\; cmd2 \\; ...）で実行する
+    
+    Args:
+        commands: 引数リストのリスト
+        check: Falseの場合、失敗時に例外ではなくNoneを返す
+    
+    Returns:
+        str: 各コマンドの出力を連結したもの
+    """
+    if tmux_client is not None and tmux_client.alive:
+        try:
+            outputs = tmux_client.run_many(commands)
+            return "\n".join(o for o in outputs if o).strip()
+        except TmuxConnectionError as e:
+            # 未送信のまま接続が切れた: 以降はプロセス起動にフォールバック
+            print(f"tmux control connection unavailable ({e}), falling back to tmux processes")
+        except subprocess.CalledProcessError as e:
+            if check:
+                print(f"Command failed: {e.cmd}")
+                print(f"stderr: {e.stderr}")
+                raise
+            return None
+    
+    argv = batch_argv(commands)
+    try:
+        result = subprocess.run(argv, text=True, capture_output=True, check=check)
+    except subprocess.CalledProcessError as e:
+        print(f"Command failed: {' '.join(argv)}")
+        print(f"stderr: {e.stderr}")
+        raise
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip()
+
+
+def send_text(pane, text):
+    """ペインにテキストをリテラルとして入力し、Enterを送る（1回のtmux呼び出し）"""
+    tmux_batch([
+        ["send-keys", "-t", pane, "-l", text],
+        ["send-keys", "-t", pane, "Enter"],
+    ])
+
+
+def start_tmux_client():
+    """tmux制御モードの常駐接続を開始する（失敗時はプロセス起動のまま）"""
+    global tmux_client
+    if not TMUX_CONTROL_MODE:
+        return None
+    try:
+        tmux_client = TmuxClient(TMUX_SESSION).start()
+        print(f"Attached tmux control client to session {TMUX_SESSION}")
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"tmux control mode unavailable ({e}), using tmux processes")
+        tmux_client = None
+    return tmux_client
+
+
+def _get_journal():
+    """状態ジャーナルを返す（JOURNAL_FILEが差し替えられた場合は作り直す）"""
+    global _journal
+    if _journal is None or _journal.path != JOURNAL_FILE:
+        _journal = StateJournal(JOURNAL_FILE, fsync=STATE_FSYNC)
+    return _journal
+
+
+def _get_bus_log():
+    """bus.jsonlのライターを返す（BUS_LOGが差し替えられた場合は作り直す）"""
+    global _bus_log
+    if _bus_log is None or _bus_log.path != BUS_LOG:
+        if _bus_log is not None:
+            _bus_log.close()
+        _bus_log = BusLogWriter(BUS_LOG, fsync=BUS_LOG_FSYNC,
+                                max_bytes=BUS_LOG_MAX_BYTES, max_age=BUS_LOG_MAX_AGE,
+                                on_flush=_on_bus_log_flush)
+    return _bus_log
+
+
+def _get_bus_index():
+    """bus.jsonlの索引を返す（BUS_LOGが差し替えられた場合は作り直す）"""
+    global _bus_index
+    if _bus_index is None or _bus_index.log_path != BUS_LOG:
+        if _bus_index is not None:
+            _bus_index.close()
+        _bus_index = BusIndex(BUS_LOG)
+    return _bus_index
+
+
+def _get_blob_store():
+    """ブロブストアを返す（BLOBSが差し替えられた場合は作り直す）"""
+    global _blob_store
+    if _blob_store is None or _blob_store.root != BLOBS:
+        _blob_store = BlobStore(BLOBS)
+    return _blob_store
+
+
+def _get_provisioner():
+    """worktreeにプロジェクトファイルを置くProvisionerを返す"""
+    global _provisioner
+    if _provisioner is None:
+        _provisioner = Provisioner(hardlink=PROVISION_HARDLINK_FRAMES, stage_dir=STATE / "frames")
+    return _provisioner
+
+
+def _get_inbox_index(inbox_dir):
+    """受信箱の新着を見つけるInboxIndexを返す（初めての受信箱なら作る）"""
+    index = _inbox_indexes.get(inbox_dir)
+    if index is None:
+        index = _inbox_indexes[inbox_dir] = InboxIndex(inbox_dir, MAILBOX_RESCAN_INTERVAL)
+    return index
+
+
+def _on_bus_log_flush(seq, entries):
+    """bus.jsonlに書き込んだレコードを索引に登録し、購読者に配信する
+
+    索引はbusqの高速化のためのもので、失敗してもbusqの次回sync()で追いつくため
+    メッセージ処理は止めない。
+    """
+    if BUS_INDEX_ENABLED:
+        try:
+            _get_bus_index().add(seq, entries)
+        except sqlite3.Error as e:
+            print(f"Failed to update bus index: {e}")
+    if event_server is not None:
+        event_server.publish([record for _, _, record in entries])
+
+
+def start_event_server():
+    """イベント購読ソケットを開く（BUSD_EVENTS=0 なら何もしない）"""
+    global event_server
+    if not EVENTS_ENABLED:
+        return None
+    try:
+        event_server = EventStreamServer(EVENTS_SOCK).start()
+        print(f"Streaming bus events on {EVENTS_SOCK}")
+    except OSError as e:
+        # ソケットのパスが長すぎる場合等
+        print(f"Event stream unavailable ({e})")
+        event_server = None
+    return event_server
+
+
+def sync_bus_index():
+    """busd停止中の書き込み等、索引に無いレコードを登録する"""
+    if not BUS_INDEX_ENABLED:
+        return
+    try:
+        added = _get_bus_index().sync()
+    except sqlite3.Error as e:
+        print(f"Failed to sync bus index: {e}")
+        return
+    if added:
+        print(f"Indexed {added} bus log records")
+
+
 def load_state():
-    """永続化された状態を読み込み"""
+    """永続化された状態を読み込み
+    
+    スナップショット（panes.json / tasks.json）を読み込んだ後、
+    ジャーナルに残っている差分を再生する。
+    """
     global pane_map, tasks
     
     # pane_map
@@ -124,26 +420,132 @@ def load_state():
         except Exception as e:
             print(f"Failed to load tasks.json: {e}")
             tasks = {}
+    
+    # 前回終了時に集約されなかった差分を再生
+    records = _get_journal().replay()
+    if records:
+        apply_records(records, tasks, pane_map)
+        print(f"Replayed {len(records)} journal records")
+        compact_state()
+
+
+def save_pane_map(task_id=None):
+    """pane_mapを永続化
+    
+    task_idを指定した場合はそのエントリの差分だけをジャーナルに追記する。
+    省略した場合は全体をスナップショットとして書き出す。
+    """
+    if task_id is None:
+        compact_state()
+        return
+    _get_journal().append([{"k": "pane", "id": task_id, "v": pane_map.get(task_id)}])
+
+
+def save_tasks(task_id=None):
+    """tasksを永続化
+    
+    task_idを指定した場合はそのタスクの差分だけをジャーナルに追記する。
+    省略した場合は全体をスナップショットとして書き出す。
+    """
+    if task_id is None:
+        compact_state()
+        return
+    _get_journal().append([{"k": "task", "id": task_id, "v": tasks.get(task_id)}])
+
+
+def update_task(task_id, **fields):
+    """タスクのフィールドを更新し、実際に値が変わった場合だけ永続化対象にする
+
+    永続化はflush_tasks()でまとめて行う。
+
+    Returns:
+        bool: いずれかのフィールドが変わったか
+    """
+    with _state_lock:
+        task = tasks.setdefault(task_id, {"id": task_id})
+        changed = False
+        for key, value in fields.items():
+            if key not in task or task[key] != value:
+                task[key] = value
+                changed = True
+        _mark_task_dirty(task_id, changed)
+    return changed
+
 
+def set_task(task_id, record):
+    """タスクのレコード全体を置き換える（内容が同じなら永続化しない）
 
-def save_pane_map():
-    """pane_mapを永続化"""
-    PANES_FILE.write_text(json.dumps(pane_map, ensure_ascii=False, indent=2))
+    Returns:
+        bool: レコードが変わったか
+    """
+    with _state_lock:
+        changed = tasks.get(task_id) != record
+        if changed:
+            tasks[task_id] = record
+        _mark_task_dirty(task_id, changed)
+    return changed
+
+
+def _mark_task_dirty(task_id, changed):
+    if not changed:
+        state_metrics["avoided"] += 1
+    elif task_id in _dirty_tasks:
+        # 同じ走査内の変更は1回の書き込みにまとめられる
+        state_metrics["avoided"] += 1
+    else:
+        _dirty_tasks.add(task_id)
 
 
-def save_tasks():
-    """tasksを永続化"""
-    task_list = list(tasks.values())
-    TASKS_FILE.write_text(json.dumps(task_list, ensure_ascii=False, indent=2))
+def flush_tasks():
+    """変更されたタスクをまとめて1回でジャーナルに追記する
+
+    Returns:
+        int: 追記したタスク数
+    """
+    with _state_lock:
+        if not _dirty_tasks:
+            return 0
+        records = [{"k": "task", "id": task_id, "v": tasks.get(task_id)}
+                   for task_id in sorted(_dirty_tasks)]
+        _dirty_tasks.clear()
+    _get_journal().append(records)
+    state_metrics["writes"] += 1
+    return len(records)
+
+
+def compact_state():
+    """tasks/pane_mapをスナップショットに書き出し、ジャーナルを空にする"""
+    global _last_compaction
+    journal = _get_journal()
+    with journal.lock:
+        # reaper等のワーカーはupdate_taskでタスクをその場で書き換えるため、ロックを取って
+        # 写しを作ってから直列化する（以降の変更は_dirty_tasksに残り、集約後に追記される）
+        with _state_lock:
+            # スナップショットに含まれるため未追記の差分は不要になる
+            _dirty_tasks.clear()
+            task_records = [dict(task) for task in tasks.values()]
+            panes = dict(pane_map)
+        write_snapshot(PANES_FILE, panes, fsync=STATE_FSYNC)
+        write_snapshot(TASKS_FILE, task_records, fsync=STATE_FSYNC)
+        journal.reset()
+    _last_compaction = time.monotonic()
+
+
+def maybe_compact_state():
+    """ジャーナルが溜まっているか、一定時間経過していれば集約する"""
+    entries = _get_journal().entries
+    if not entries:
+        return
+    if entries >= STATE_COMPACT_EVERY or time.monotonic() - _last_compaction >= STATE_COMPACT_INTERVAL:
+        compact_state()
 
 
 def ensure_session():
     """tmuxセッションが存在することを確認"""
-    result = sh(f"tmux has-session -t {TMUX_SESSION} 2>&1", check=False)
-    if result is None or "can't find session" in str(result):
+    result = tmux("has-session", "-t", TMUX_SESSION, check=False)
+    if result is None:
         # セッションを作成（TEMPウィンドウで開始）
-        cmd = f"tmux new-session -d -s {TMUX_SESSION} -n TEMP 'bash'"
-        if sh(cmd, check=False) is not None:
+        if tmux("new-session", "-d", "-s", TMUX_SESSION, "-n", "TEMP", "bash", check=False) is not None:
             print(f"Created tmux session: {TMUX_SESSION}")
             time.sleep(TMUX_OPERATION_DELAY)  # セッション作成を待つ
     
@@ -151,7 +553,7 @@ def ensure_session():
     ensure_main_window_layout()
     
     # MAINウィンドウをアクティブにする
-    sh(f"tmux select-window -t {TMUX_SESSION}:MAIN", check=False)
+    tmux("select-window", "-t", f"{TMUX_SESSION}:MAIN", check=False)
 
 
 def get_worktree_path(task_id):
@@ -164,32 +566,12 @@ def get_worktree_path(task_id):
     return worktree_path
 
 
-def is_git_repository(repo_path):
-    """指定されたパスがGitリポジトリかどうかをチェック"""
-    try:
-        sh(f"git -C {shlex.quote(str(repo_path))} rev-parse --git-dir")
-        return True
-    except subprocess.CalledProcessError:
-        return False
-
-
-def get_current_branch(repo_path):
-    """現在のブランチを取得"""
-    current_branch = sh(f"git -C {shlex.quote(str(repo_path))} branch --show-current", check=False)
-    
-    if not current_branch:
-        # デフォルトブランチを取得（HEADが指すブランチ）
-        try:
-            current_branch = sh(f"git -C {shlex.quote(str(repo_path))} symbolic-ref --short HEAD")
-        except subprocess.CalledProcessError:
-            # HEADがデタッチド状態の場合、最初のブランチを使用
-            branches = sh(f"git -C {shlex.quote(str(repo_path))} branch --format='%(refname:short)'", check=False)
-            if branches:
-                current_branch = branches.split('\n')[0].strip()
-            else:
-                return None
-    
-    return current_branch
+def _get_repo_info():
+    """TARGET_REPOのgitの状態のキャッシュを返す"""
+    global _repo_info
+    if _repo_info is None or _repo_info.repo != TARGET_REPO:
+        _repo_info = RepoInfo(TARGET_REPO)
+    return _repo_info.refresh()
 
 
 def create_initial_commit(repo_path):
@@ -215,48 +597,87 @@ def create_initial_commit(repo_path):
     print("Created initial commit")
 
 
-def branch_exists(repo_path, branch):
-    """指定されたブランチが存在するかチェック"""
+def _worktree_add(repo_path, worktree_path, branch, base=None, options=""):
+    """git worktree add のコマンド（base を指定するとブランチも同時に作る）"""
+    repo = shlex.quote(str(repo_path))
+    worktree = shlex.quote(str(worktree_path))
+    if base is None:
+        return f"git -C {repo} worktree add {options}{worktree} {branch}"
+    return f"git -C {repo} worktree add {options}-b {branch} {worktree} {base}"
+
+
+def setup_worktree(repo_path, worktree_path, branch, base=None):
+    """Worktreeをセットアップ（base を指定した場合はそこからブランチを作る）"""
     try:
-        sh(f"git -C {shlex.quote(str(repo_path))} show-ref --verify --quiet refs/heads/{branch}")
+        sh(_worktree_add(repo_path, worktree_path, branch, base))
+        if base is not None:
+            print(f"Created git branch: {branch} (from {base})")
+        print(f"Created worktree: {worktree_path}")
         return True
-    except subprocess.CalledProcessError:
+    except subprocess.CalledProcessError as e:
+        # worktreeが作成できない場合は通常のディレクトリを作成
+        print(f"Failed to create worktree: {e.stderr}")
+        worktree_path.mkdir(parents=True, exist_ok=True)
+        print(f"Created directory: {worktree_path}")
         return False
 
 
-def create_branch_if_needed(repo_path, branch, base_branch):
-    """必要に応じてブランチを作成"""
-    if not branch_exists(repo_path, branch):
-        # ベースブランチがコミットを持っているか確認
-        try:
-            sh(f"git -C {shlex.quote(str(repo_path))} rev-parse {base_branch}")
-            # ブランチ作成
-            sh(f"git -C {shlex.quote(str(repo_path))} branch {branch} {base_branch}")
-            print(f"Created git branch: {branch} (from {base_branch})")
-        except subprocess.CalledProcessError:
-            # リポジトリが空の場合、初期コミットを作成
-            print(f"Repository has no commits yet. Creating initial commit...")
-            create_initial_commit(repo_path)
-            # ブランチ作成を再試行
-            sh(f"git -C {shlex.quote(str(repo_path))} branch {branch} {base_branch}")
-            print(f"Created git branch: {branch} (from {base_branch})")
-
-
-def setup_worktree(repo_path, worktree_path, branch):
-    """Worktreeをセットアップ"""
+def sparse_cone(paths):
+    """spawnのpathsをsparse-checkoutのコーンに直す（指定が無ければNone）
+
+    "./src/" のような表記は "src" にそろえ、SPARSE_ALWAYS_PATHS を加える。
+    リポジトリ外を指すパスは無視する。
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    cone = set()
+    for path in paths or []:
+        parts = [part for part in str(path).replace("\\", "/").split("/") if part not in ("", ".")]
+        if not parts or ".." in parts or str(path).startswith("/"):
+            print(f"Ignoring sparse path outside the repository: {path!r}")
+            continue
+        cone.add("/".join(parts))
+    if not cone:
+        return None
+    return sorted(cone | set(SPARSE_ALWAYS_PATHS))
+
+
+def setup_sparse_worktree(repo_path, worktree_path, branch, cone, base=None):
+    """cone のパスだけをチェックアウトしたworktreeをセットアップ（sparse-checkoutのコーンモード）
+
+    オブジェクトはリポジトリと共有するため、ユニットごとの時間とディスクは
+    チェックアウトするファイルの分だけで済む。sparse-checkoutが使えなければ全体をチェックアウトする。
+    """
+    worktree = shlex.quote(str(worktree_path))
     try:
-        sh(f"git -C {shlex.quote(str(repo_path))} worktree add {shlex.quote(str(worktree_path))} {branch}")
-        print(f"Created worktree: {worktree_path}")
+        sh(_worktree_add(repo_path, worktree_path, branch, base, options="--no-checkout "))
     except subprocess.CalledProcessError as e:
-        # worktreeが作成できない場合は通常のディレクトリを作成
         print(f"Failed to create worktree: {e.stderr}")
         worktree_path.mkdir(parents=True, exist_ok=True)
         print(f"Created directory: {worktree_path}")
+        return False
+    if base is not None:
+        print(f"Created git branch: {branch} (from {base})")
+    try:
+        sh(f"git -C {worktree} sparse-checkout set --cone " + " ".join(shlex.quote(p) for p in cone))
+        sh(f"git -C {worktree} reset -q --hard")
+        print(f"Created sparse worktree: {worktree_path} ({', '.join(cone)})")
+    except subprocess.CalledProcessError as e:
+        print(f"Sparse checkout failed, checking out everything: {e.stderr}")
+        sh(f"git -C {worktree} sparse-checkout disable", check=False)
+        sh(f"git -C {worktree} reset -q --hard")
+        print(f"Created worktree: {worktree_path}")
+    return True
 
 
-def ensure_worktree(task_id, branch):
-    """git worktreeが存在することを確認（並列ディレクトリ方式）"""
+def ensure_worktree(task_id, branch, paths=None):
+    """git worktreeが存在することを確認（並列ディレクトリ方式）
+
+    paths を指定した場合は、そのパス（とSPARSE_ALWAYS_PATHS）だけをチェックアウトする。
+    リポジトリの状態はキャッシュ（RepoInfo）から読むため、gitの起動はworktree addの1回で済む。
+    """
     worktree_path = get_worktree_path(task_id)
+    cone = sparse_cone(paths)
     
     print(f"DEBUG: ensure_worktree called for task_id={task_id}, branch={branch}")
     print(f"  worktree_path: {worktree_path}")
@@ -265,9 +686,10 @@ def ensure_worktree(task_id, branch):
         return worktree_path  # すでに存在
     
     # TARGET_REPOがgitリポジトリかチェック
-    if is_git_repository(TARGET_REPO):
+    info = _get_repo_info()
+    if info.is_git:
         # 現在のブランチを取得
-        current_branch = get_current_branch(TARGET_REPO)
+        current_branch = info.current_branch()
         
         if not current_branch:
             # ブランチが全く存在しない場合はエラー
@@ -277,11 +699,30 @@ def ensure_worktree(task_id, branch):
             print(f"Created directory instead: {worktree_path}")
             return worktree_path
         
-        # 必要に応じてブランチを作成
-        create_branch_if_needed(TARGET_REPO, branch, current_branch)
+        # プールにチェックアウト済みのworktreeがあれば、切り替えて移すだけで済む
+        # （プールのworktreeは全体をチェックアウトしているため、sparseの場合は使わない）
+        if cone is None and worktree_pool is not None and \
+                worktree_pool.claim(worktree_path, branch, current_branch):
+            info.note_branch(branch, current_branch)
+            return worktree_path
+        
+        # ブランチが無ければworktreeと同時に作る
+        base = None
+        empty = not info.has_branch(current_branch)
+        if not info.has_branch(branch):
+            base = current_branch
+            if empty:
+                # リポジトリが空の場合、初期コミットを作成
+                print(f"Repository has no commits yet. Creating initial commit...")
+                create_initial_commit(TARGET_REPO)
         
         # worktreeをセットアップ
-        setup_worktree(TARGET_REPO, worktree_path, branch)
+        if cone is None:
+            created = setup_worktree(TARGET_REPO, worktree_path, branch, base)
+        else:
+            created = setup_sparse_worktree(TARGET_REPO, worktree_path, branch, cone, base)
+        if created and base is not None and not empty:
+            info.note_branch(branch, current_branch)
     else:
         # gitリポジトリでない場合は通常のディレクトリを作成
         print(f"Note: {TARGET_REPO} is not a git repository")
@@ -322,7 +763,12 @@ children: []
 
 
 def copy_project_files(worktree_path, unit_id=None):
-    """プロジェクト設定ファイルをworktreeにコピー"""
+    """プロジェクト設定ファイルをworktreeに配置する
+
+    フレームはハードリンク、それ以外はreflink（使えなければコピー）で置き、
+    内容が同じファイルは置き直さない（provision.py）。
+    """
+    provisioner = _get_provisioner()
     # CLAUDE.mdをコピー（AI App Studioのframesディレクトリから）
     if unit_id == "root":
         # ルートユニットはframes/root/CLAUDE.mdを使用
@@ -332,60 +778,63 @@ def copy_project_files(worktree_path, unit_id=None):
         claude_source = AI_APP_STUDIO_ROOT / "frames" / "unit" / "CLAUDE.md"
     
     if claude_source.exists():
-        shutil.copy2(claude_source, worktree_path / "CLAUDE.md")
-        print(f"Copied {claude_source.name} to worktree")
+        method = provisioner.provision(claude_source, worktree_path / "CLAUDE.md", link=True)
+        print(f"Copied {claude_source.name} to worktree ({method})")
     
     # requirements.ymlをコピー（重要！）
     requirements_yml = TARGET_REPO / "requirements.yml"
     if requirements_yml.exists():
-        shutil.copy2(requirements_yml, worktree_path / "requirements.yml")
-        print(f"Copied requirements.yml to worktree")
+        method = provisioner.provision(requirements_yml, worktree_path / "requirements.yml")
+        print(f"Copied requirements.yml to worktree ({method})")
     else:
         print(f"WARNING: requirements.yml not found in {TARGET_REPO}")
     
     # .env.localをコピー（存在する場合）
     env_local = TARGET_REPO / ".env.local"
     if env_local.exists():
-        shutil.copy2(env_local, worktree_path / ".env.local")
-        print(f"Copied .env.local to worktree")
+        method = provisioner.provision(env_local, worktree_path / ".env.local")
+        print(f"Copied .env.local to worktree ({method})")
     
     # .claudeディレクトリをコピー（存在する場合）
     claude_dir = TARGET_REPO / ".claude"
     if claude_dir.exists() and claude_dir.is_dir():
-        dest_claude_dir = worktree_path / ".claude"
-        shutil.copytree(claude_dir, dest_claude_dir, dirs_exist_ok=True)
-        print(f"Copied .claude directory to worktree")
+        counts = provisioner.provision_tree(claude_dir, worktree_path / ".claude")
+        print(f"Copied .claude directory to worktree "
+              f"({', '.join(f'{n} {method}' for method, n in sorted(counts.items()))})")
 
 
 def ensure_main_window_layout():
     """メインウィンドウのレイアウトを確保"""
     # MAINウィンドウが存在するかチェック
-    result = sh(f"tmux list-windows -t {TMUX_SESSION} -F '#{{window_name}}'", check=False)
+    result = tmux("list-windows", "-t", TMUX_SESSION, "-F", "#{window_name}", check=False)
     
     if result is None or "MAIN" not in str(result):
         # 存在しない場合は作成
         print("Creating MAIN window with initial layout")
         
         # セッションに最初のウィンドウがある場合は、それをリネーム
-        first_window = sh(f"tmux list-windows -t {TMUX_SESSION} -F '#{{window_index}}'", check=False)
+        first_window = tmux("list-windows", "-t", TMUX_SESSION, "-F", "#{window_index}", check=False)
         if first_window:
             first_window_idx = first_window.strip().split('\n')[0]
-            sh(f"tmux rename-window -t {TMUX_SESSION}:{first_window_idx} MAIN")
+            tmux("rename-window", "-t", f"{TMUX_SESSION}:{first_window_idx}", "MAIN")
         else:
             # ウィンドウがない場合は新規作成
-            sh(f"tmux new-window -t {TMUX_SESSION} -n MAIN 'bash'")
+            tmux("new-window", "-t", TMUX_SESSION, "-n", "MAIN", "bash")
         time.sleep(TMUX_OPERATION_DELAY)
         
         # 左右に分割 - オプションなしで実行（互換性向上）
-        sh(f"tmux split-window -h -t {TMUX_SESSION}:MAIN")
+        tmux("split-window", "-h", "-t", f"{TMUX_SESSION}:MAIN")
         
         # 左側を上下に分割 - PMAI用とダッシュボード用
-        sh(f"tmux select-pane -t {TMUX_SESSION}:MAIN.0")
-        sh(f"tmux split-window -v -t {TMUX_SESSION}:MAIN.0")
+        tmux("select-pane", "-t", f"{TMUX_SESSION}:MAIN.0")
+        tmux("split-window", "-v", "-t", f"{TMUX_SESSION}:MAIN.0")
         
         # ダッシュボード起動（左下ペイン）
-        dashboard_cmd = 'tail -F logs/bus.jsonl 2>/dev/null || echo "Waiting for logs..."'
-        sh(f"tmux send-keys -t {TMUX_SESSION}:MAIN.{PANE_DASHBOARD} {shlex.quote(dashboard_cmd)} C-m")
+        # busdのイベント購読に接続できなければ従来どおりファイルを追う
+        busq = shlex.quote(str(AI_APP_STUDIO_ROOT / "bin" / "busq"))
+        dashboard_cmd = (f'BUSCTL_ROOT={shlex.quote(str(ROOT))} python3 {busq} --follow --wait 30 2>/dev/null'
+                         ' || tail -F logs/bus.jsonl 2>/dev/null || echo "Waiting for logs..."')
+        tmux("send-keys", "-t", f"{TMUX_SESSION}:MAIN.{PANE_DASHBOARD}", dashboard_cmd, "C-m")
         
         return False
     return True
@@ -408,22 +857,20 @@ def get_right_pane_for_child(child_count):
     else:
         # 既存の右側ペインを分割
         # 最後の右側ペインを取得して分割
-        panes = sh(f"tmux list-panes -t {TMUX_SESSION}:MAIN -F '#{{pane_index}}'")
+        panes = tmux("list-panes", "-t", f"{TMUX_SESSION}:MAIN", "-F", "#{pane_index}")
         if panes:
             last_pane = max([int(p) for p in panes.split('\n') if p])
             # 最後のペインを分割（エラーハンドリング付き）
+            # -P で新しく作られたペインのインデックスを直接受け取る
             try:
-                sh(f"tmux split-window -v -t {TMUX_SESSION}:MAIN.{last_pane}")
+                newest_pane = tmux("split-window", "-v", "-t", f"{TMUX_SESSION}:MAIN.{last_pane}",
+                                   "-P", "-F", "#{pane_index}")
             except subprocess.CalledProcessError as e:
                 if "no space for new pane" in str(e.stderr):
                     print(f"WARNING: No space for new pane, maximum panes reached")
                     return None
                 raise
-            time.sleep(TMUX_OPERATION_DELAY)
-            # 新しく作られたペインのIDを取得
-            new_panes = sh(f"tmux list-panes -t {TMUX_SESSION}:MAIN -F '#{{pane_index}}'")
-            if new_panes:
-                newest_pane = max([int(p) for p in new_panes.split('\n') if p])
+            if newest_pane:
                 return f"{TMUX_SESSION}:MAIN.{newest_pane}"
     
     return None
@@ -454,46 +901,77 @@ def _determine_target_pane(task_id):
     return target_pane
 
 
-def _execute_in_pane(target_pane, worktree_path, task_id, goal=None, env=None):
-    """対象ペインでコマンドを実行してペインIDを返す"""
+def write_bootstrap_script(task_id, worktree_path, goal=None, env=None, busctl_fifo=None):
+    """ペインで読み込むブートストラップスクリプトを生成する
+    
+    cd・環境変数の設定・Claude Codeの起動を1つのスクリプトにまとめ、
+    ペインへは「. スクリプト」の1行だけを入力すればよいようにする。
+    busctl_fifoを指定すると、busctlとしてbin/shim/busctlを使わせる。
+    
+    Returns:
+        Path: 生成したスクリプトのパス
+    """
     if env is None:
         env = {}
     ai_app_studio_bin = str(AI_APP_STUDIO_ROOT / "bin")
     
+    lines = [
+        f"# AI App Studio bootstrap for {task_id} (generated by busd)",
+        # 1. 作業ディレクトリに移動
+        f"cd {shlex.quote(str(worktree_path))}",
+        # 2. 環境変数を設定
+        f'export PATH={shlex.quote(ai_app_studio_bin)}:"$PATH"',
+        f"export ROOT={shlex.quote(str(ROOT))}",
+        f"export BUSCTL_ROOT={shlex.quote(str(ROOT))}",  # 重要: busctlがbusdと同じROOTを使うように
+        f"export TASK_ID={shlex.quote(task_id)}",
+    ]
+    if goal:
+        lines.append(f"export TASK_GOAL={shlex.quote(goal)}")
+    if task_id == "PMAI":
+        lines.append(f"export TARGET_REPO={shlex.quote(str(TARGET_REPO))}")
+    if busctl_fifo:
+        lines.append(f'export PATH={shlex.quote(str(AI_APP_STUDIO_ROOT / "bin" / "shim"))}:"$PATH"')
+        lines.append(f"export BUSCTL_FIFO={shlex.quote(str(busctl_fifo))}")
+    
+    # 3. カスタム環境変数を設定
+    for key, value in env.items():
+        if not key.isidentifier():
+            print(f"Warning: Skipping invalid environment variable name: {key}")
+            continue
+        lines.append(f"export {key}={shlex.quote(str(value))}")
+        print(f"DEBUG: Set env {key}={value}")
+    
+    # 4. Claudeを起動
+    lines.append(CLAUDE_CMD)
+    
+    bootstrap_dir = STATE / "bootstrap"
+    bootstrap_dir.mkdir(parents=True, exist_ok=True)
+    script = bootstrap_dir / f"{task_id}.sh"
+    script.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return script
+
+
+def _execute_in_pane(target_pane, worktree_path, task_id, goal=None, env=None):
+    """対象ペインでコマンドを実行してペインIDを返す
+    
+    セットアップ一式はブートストラップスクリプトにまとめ、スクリプトの読み込み・
+    ペイン出力のロギング・ペインIDの取得を1回のtmux呼び出しで行う。
+    """
     try:
         print(f"DEBUG: Setting up pane {target_pane}")
         print(f"[DEBUG] Setting BUSCTL_ROOT={str(ROOT)} for unit {task_id}")
         
-        # 1. 作業ディレクトリに移動
-        sh(f"tmux send-keys -t {target_pane} 'cd {shlex.quote(str(worktree_path))}' Enter")
-        time.sleep(POLLING_INTERVAL)
-        
-        # 2. 環境変数を設定
-        sh(f"tmux send-keys -t {target_pane} 'export PATH=\"{ai_app_studio_bin}:$PATH\"' Enter")
-        sh(f"tmux send-keys -t {target_pane} 'export ROOT=\"{str(ROOT)}\"' Enter")
-        sh(f"tmux send-keys -t {target_pane} 'export BUSCTL_ROOT=\"{str(ROOT)}\"' Enter")  # 重要: busctlがbusdと同じROOTを使うように
-        sh(f"tmux send-keys -t {target_pane} 'export TASK_ID=\"{task_id}\"' Enter")
-        if goal:
-            sh(f"tmux send-keys -t {target_pane} 'export TASK_GOAL=\"{goal}\"' Enter")
-        if task_id == "PMAI":
-            sh(f"tmux send-keys -t {target_pane} 'export TARGET_REPO=\"{str(TARGET_REPO)}\"' Enter")
-        
-        # 3. カスタム環境変数を設定
-        for key, value in env.items():
-            # 値に特殊文字が含まれる場合に備えてエスケープ
-            escaped_value = value.replace('"', '\\"').replace('$', '\\$')
-            sh(f"tmux send-keys -t {target_pane} 'export {key}=\"{escaped_value}\"' Enter")
-            print(f"DEBUG: Set env {key}={value}")
+        busctl_fifo = start_busctl_server(task_id)
+        script = write_bootstrap_script(task_id, worktree_path, goal, env, busctl_fifo)
+        raw_log = LOGS / "raw" / f"{task_id}.raw"
         
-        time.sleep(POLLING_INTERVAL)
-        
-        # 4. Claudeを起動
-        sh(f"tmux send-keys -t {target_pane} '{CLAUDE_CMD}' Enter")
+        pane = tmux_batch([
+            ["send-keys", "-t", target_pane, f". {shlex.quote(str(script))}", "Enter"],
+            ["pipe-pane", "-o", "-t", target_pane, f"stdbuf -oL -eL tee -a {shlex.quote(str(raw_log))}"],
+            ["display-message", "-p", "-t", target_pane, "-F", "#{pane_id}"],
+        ])
         
         print(f"DEBUG: Commands sent to pane {target_pane}")
-        
-        # 実際のペインIDを取得
-        pane = sh(f"tmux display-message -p -t {target_pane} -F '#{{pane_id}}'")
         return pane
         
     except subprocess.CalledProcessError as e:
@@ -502,16 +980,53 @@ def _execute_in_pane(target_pane, worktree_path, task_id, goal=None, env=None):
         raise
 
 
-def _setup_pane_logging(task_id, pane):
-    """ペインの出力ログを設定"""
-    raw_log = LOGS / "raw" / f"{task_id}.raw"
-    sh(f"tmux pipe-pane -o -t {pane} " +
-       f"'stdbuf -oL -eL tee -a {shlex.quote(str(raw_log))}'")
+def start_busctl_server(task_id):
+    """ユニット用のbusctl --serveを起動してFIFOのパスを返す
+    
+    ヘルパーはbus.sockへの常駐接続で転送するため、ソケットで受け付けていない
+    場合やBUSD_BUSCTL_SERVE=0の場合は起動せずNoneを返す（busctlは通常どおり）。
+    FIFOの準備ができるまでの投函はシムがbin/busctlで行う。
+    """
+    if not BUSCTL_SERVE_ENABLED or ingest_server is None:
+        return None
+    stop_busctl_server(task_id)
     
+    BUSCTL_SERVE_DIR.mkdir(parents=True, exist_ok=True)
+    fifo = BUSCTL_SERVE_DIR / f"{task_id}.fifo"
+    log_dir = LOGS / "busctl"
+    log_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(log_dir / f"{task_id}.log", "ab") as log:
+            busctl_servers[task_id] = subprocess.Popen(
+                [sys.executable, str(AI_APP_STUDIO_ROOT / "bin" / "busctl"), "--serve", str(fifo)],
+                env=dict(os.environ, BUSCTL_ROOT=str(ROOT)),
+                stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                start_new_session=True)
+    except OSError as e:
+        print(f"Warning: could not start busctl helper for {task_id}: {e}")
+        return None
+    return fifo
+
+
+def stop_busctl_server(task_id):
+    """ユニットのbusctl --serveを停止する（FIFOとpidファイルはヘルパーが削除する）"""
+    proc = busctl_servers.pop(task_id, None)
+    if proc is None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(timeout=2)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def _setup_pane_logging(task_id, pane):
+    """ペインをpane_mapに登録する（出力ログのpipe-paneは_execute_in_paneで設定済み）"""
     # pane_mapを更新
     print(f"[DEBUG] Updating pane_map: {task_id} -> {pane}")
     pane_map[task_id] = pane
-    save_pane_map()
+    save_pane_map(task_id)
     print(f"[DEBUG] pane_map after update: {pane_map}")
     print(f"Spawned child {task_id} in pane {pane}")
 
@@ -520,9 +1035,6 @@ def _send_initial_message(task_id, pane, frame=None, goal=None):
     """起動したエージェントに初期指示を送信（統一ユニット対応版）"""
     print(f"DEBUG _send_initial_message: task_id={task_id}, pane={pane}, frame={repr(frame)}, goal={repr(goal)}")
     
-    # Claude Codeの起動を待つ
-    time.sleep(CLAUDE_STARTUP_DELAY)
-    
     # frameが指定されていない場合は、CLAUDE.mdを読むよう指示
     if not frame:
         print(f"DEBUG: Frame is empty/None, sending initial message for unified unit system")
@@ -536,8 +1048,7 @@ def _send_initial_message(task_id, pane, frame=None, goal=None):
         
         print(f"DEBUG: Sending message: {init_message}")
         try:
-            sh(f"tmux send-keys -t {pane} -l {shlex.quote(init_message)}")
-            sh(f"tmux send-keys -t {pane} Enter")
+            send_text(pane, init_message)
             print(f"Sent initial instructions to unit {task_id}")
         except Exception as e:
             print(f"ERROR sending initial message: {e}")
@@ -548,21 +1059,23 @@ def _send_initial_message(task_id, pane, frame=None, goal=None):
     if task_id == "PMAI" and frame and "pmai" in frame:
         init_message = (f"Read {frame} and follow the instructions to act as the Parent Agent. "
                        f"Process $TARGET_REPO/requirements.yml and spawn tasks using busctl commands.")
-        sh(f"tmux send-keys -t {pane} -l {shlex.quote(init_message)}")
-        sh(f"tmux send-keys -t {pane} Enter")
+        send_text(pane, init_message)
         print(f"Sent initial instructions to parent agent")
     
     # 子エージェントの指示
     elif frame and "impl" in frame and goal:
         init_message = (f"You are task {task_id}. Your goal: {goal}. "
                        f"Read {frame} for instructions on reporting progress with busctl post commands.")
-        sh(f"tmux send-keys -t {pane} -l {shlex.quote(init_message)}")
-        sh(f"tmux send-keys -t {pane} Enter")
+        send_text(pane, init_message)
         print(f"Sent initial instructions to child agent {task_id}")
 
 
-def spawn_child(task_id, worktree_path, frame=None, goal=None, env=None):
-    """子Claude Codeをtmux paneで起動（分割表示）"""
+def spawn_child(task_id, worktree_path, frame=None, goal=None, env=None, send_initial=True):
+    """子Claude Codeをtmux paneで起動（分割表示）
+
+    send_initial=Falseの場合、初期メッセージは呼び出し側が送信する
+    （spawnパイプラインでは遅延タイマーで送信）
+    """
     if env is None:
         env = {}
     print(f"[DEBUG] spawn_child START for task {task_id}, worktree: {worktree_path}")
@@ -592,16 +1105,17 @@ def spawn_child(task_id, worktree_path, frame=None, goal=None, env=None):
     # 3. ロギングをセットアップ
     _setup_pane_logging(task_id, pane)
     
-    # 4. 初期メッセージを送信
-    _send_initial_message(task_id, pane, frame, goal)
+    # 4. Claude Codeの起動を待って初期メッセージを送信
+    if send_initial:
+        time.sleep(CLAUDE_STARTUP_DELAY)
+        _send_initial_message(task_id, pane, frame, goal)
     
     print(f"[DEBUG] spawn_child COMPLETE for {task_id}, returning pane: {pane}")
     return pane
 
 
-def handle_spawn(msg):
-    """spawnメッセージを処理"""
-    print(f"[DEBUG] handle_spawn called with message: {json.dumps(msg, indent=2)}")
+def _prepare_spawn(msg):
+    """spawnの準備段階: worktree作成とファイル配置を行いコンテキストを返す"""
     data = msg.get("data", {})
     task_id = msg["task_id"]
     print(f"[DEBUG] Processing spawn for task_id: {task_id}")
@@ -618,7 +1132,8 @@ def handle_spawn(msg):
     else:
         # 子タスクはサブディレクトリのworktreeで動作
         print(f"[DEBUG] Creating worktree for {task_id} with branch {branch}")
-        worktree_path = ensure_worktree(task_id, branch)
+        with _git_lock:
+            worktree_path = ensure_worktree(task_id, branch, data.get("paths"))
         print(f"[DEBUG] Worktree created at: {worktree_path}")
     
     # ファイルセットアップ（PMAIは除外）
@@ -628,10 +1143,108 @@ def handle_spawn(msg):
         unit_id = env.get("UNIT_ID", task_id)
         copy_project_files(worktree_path, unit_id=unit_id)
     
+    return {
+        "task_id": task_id,
+        "worktree_path": worktree_path,
+        "branch": branch,
+        "frame": frame,
+        "goal": goal,
+        "env": env,
+    }
+
+
+def _launch_spawn(ctx):
+    """spawnの起動段階: tmuxペインでClaude Codeを起動（初期メッセージは送らない）"""
+    return spawn_child(ctx["task_id"], ctx["worktree_path"], ctx["frame"], ctx["goal"],
+                       ctx["env"], send_initial=False)
+
+
+def _greet_spawn(ctx, pane):
+    """spawnの最終段階: 起動したエージェントに初期メッセージを送信"""
+    _send_initial_message(ctx["task_id"], pane, ctx["frame"], ctx["goal"])
+
+
+def _context_fields(ctx):
+    """spawnの準備で決まったフィールド（worktreeを作る前ならどちらも空）"""
+    worktree_path = ctx.get("worktree_path") if ctx else None
+    return {
+        "cwd": str(worktree_path) if worktree_path else "",
+        "worktree_path": str(worktree_path) if worktree_path else "",  # children-status.yml・reaper用
+    }
+
+
+def _record_task(msg, ctx, status="running"):
+    """spawnしたタスクの状態を記録"""
+    data = msg.get("data", {})
+    task_id = msg["task_id"]
+    set_task(task_id, {
+        "id": task_id,
+        "status": status,
+        "created_at": msg.get("ts", int(time.time() * MS_PER_SECOND)),
+        **_context_fields(ctx),
+        "branch": data.get("branch", f"feat/{task_id}"),
+        "goal": data.get("goal", ""),
+        "frame": data.get("frame", ""),
+        "env": data.get("env", {}),  # 環境変数も保存
+        "spawn_id": msg.get("id"),  # 再配信の判定用
+    })
+
+
+def finish_spawns():
+    """spawnパイプラインで起動完了・失敗したジョブをタスク状態に反映"""
+    if spawn_pipeline is None:
+        return
+    
+    for job in spawn_pipeline.drain():
+        current = tasks.get(job.task_id, {})
+        if current.get("status") not in (None, "spawning"):
+            # 起動中に結果が届いた等、すでに状態が進んでいる: 状態はそのままで、worktreeだけ記録する
+            if job.context:
+                update_task(job.task_id, **_context_fields(job.context))
+            continue
+        if job.state == job.FAILED:
+            _record_task(job.msg, job.context, status="error")
+            update_task(job.task_id, error=str(job.error))
+        else:
+            _record_task(job.msg, job.context)
+            print(f"[DEBUG] Spawn of {job.task_id} launched in pane {job.pane}")
+    
+    flush_tasks()
+
+
+def handle_spawn(msg):
+    """spawnメッセージを処理
+    
+    spawnパイプラインが動作している場合はワーカーに投入して即座に戻る。
+    """
+    print(f"[DEBUG] handle_spawn called with message: {json.dumps(msg, indent=2)}")
+    
+    current = tasks.get(msg["task_id"], {})
+    if msg.get("id") is not None and current.get("spawn_id") == msg["id"] and msg["task_id"] in pane_map:
+        # 同じspawnの再配信（前回はペインの作成後に失敗した等）: 2つ目のペインは作らない
+        print(f"Spawn {msg['id']} of {msg['task_id']} already has pane {pane_map[msg['task_id']]}")
+        if spawn_pipeline is None and current.get("status") == "spawning":
+            update_task(msg["task_id"], status="running")
+        return
+    
+    if spawn_pipeline is not None:
+        job = spawn_pipeline.submit(msg)
+        if job.msg is msg:
+            # 新規ジョブ: 起動完了まではspawning状態として登録
+            _record_task(msg, None, status="spawning")
+        return
+    
+    ctx = _prepare_spawn(msg)
+    task_id = ctx["task_id"]
+    # ペインの作成後に失敗した場合の再試行で、作成済みのペインを使うための記録
+    _record_task(msg, ctx, status="spawning")
+    
     # プロセス起動
     print(f"[DEBUG] About to spawn child process for {task_id}")
     try:
-        pane = spawn_child(task_id, worktree_path, frame, goal, env)
+        # ペインの配置は他のspawnと並行させない
+        with _spawn_lock:
+            pane = spawn_child(task_id, ctx["worktree_path"], ctx["frame"], ctx["goal"], ctx["env"])
         print(f"[DEBUG] spawn_child returned pane: {pane}")
     except Exception as e:
         print(f"[DEBUG] Error in spawn_child: {e}")
@@ -640,18 +1253,7 @@ def handle_spawn(msg):
         raise
     
     # タスク状態を記録
-    tasks[task_id] = {
-        "id": task_id,
-        "status": "running",
-        "created_at": msg.get("ts", int(time.time() * MS_PER_SECOND)),
-        "cwd": str(worktree_path),
-        "worktree_path": str(worktree_path),  # children-status.yml更新用
-        "branch": branch,
-        "goal": goal,
-        "frame": frame,
-        "env": env  # 環境変数も保存
-    }
-    save_tasks()
+    _record_task(msg, ctx)
 
 
 def handle_send(msg):
@@ -664,6 +1266,12 @@ def handle_send(msg):
     else:
         task_id = to
     
+    # 起動中のユニットには初期メッセージを送り終えてから送る（それまではペインが無いか、
+    # エージェントが入力を受け付けられない）。投函ファイルは残して再試行される
+    job = spawn_pipeline.active_job(task_id) if spawn_pipeline is not None else None
+    if job is not None:
+        raise SpawnInProgress(f"{task_id} is still starting ({job.state})")
+    
     # paneを検索
     pane = pane_map.get(task_id)
     if not pane:
@@ -678,8 +1286,7 @@ def handle_send(msg):
         text = str(data)
     
     # tmux send-keys実行
-    sh(f"tmux send-keys -t {pane} -l {shlex.quote(text)}")
-    sh(f"tmux send-keys -t {pane} Enter")
+    send_text(pane, text)
     print(f"Sent to {task_id}: {text[:TEXT_PREVIEW_LENGTH]}...")
 
 
@@ -705,8 +1312,7 @@ def notify_parent_unit(parent_unit_id, child_unit_id, status, message):
     )
     
     # 安全な送信（-lオプションでリテラルとして送信）
-    sh(f"tmux send-keys -t {parent_pane} -l {shlex.quote(notification)}")
-    sh(f"tmux send-keys -t {parent_pane} Enter")
+    send_text(parent_pane, notification)
     
     time.sleep(NOTIFICATION_DELAY)  # 連続通知対策
     print(f"Notified parent {parent_unit_id} about {child_unit_id}: {status}")
@@ -789,9 +1395,16 @@ def update_children_status(parent_unit_id, child_unit_id, status, error_message=
 
 def handle_post(msg):
     """postメッセージを処理（log/result）"""
-    # bus.jsonlに追記
-    with BUS_LOG.open("a", encoding="utf-8") as fp:
-        fp.write(json.dumps(msg, ensure_ascii=False) + "\n")
+    # 大きな出力等はブロブに移し、bus.jsonlとタスク状態には参照だけを残す
+    # （親ユニットへの通知には移す前のdataのテキストを使う）
+    data = msg.get("data", {})
+    if BLOB_MIN_SIZE > 0:
+        stored, spilled = spill(data, _get_blob_store(), BLOB_MIN_SIZE)
+        if spilled:
+            msg = {**msg, "data": stored}
+    
+    # bus.jsonlに追記（走査の終わりにまとめて書き込む）
+    _get_bus_log().append(msg)
     
     # タスク状態を更新
     task_id = msg.get("task_id")
@@ -800,66 +1413,410 @@ def handle_post(msg):
     if task_id and task_id in tasks:
         if msg_type == "result":
             # 結果メッセージの場合、ステータスを更新
-            is_error = msg.get("data", {}).get("is_error", False)
-            tasks[task_id]["status"] = "error" if is_error else "done"
-            tasks[task_id]["completed_at"] = msg.get("ts", int(time.time() * MS_PER_SECOND))
+            is_error = data.get("is_error", False)
+            fields = {
+                "status": "error" if is_error else "done",
+                "completed_at": msg.get("ts", int(time.time() * MS_PER_SECOND)),
+            }
             if "data" in msg:
-                tasks[task_id]["result"] = msg["data"]
+                fields["result"] = msg["data"]
+            update_task(task_id, **fields)
             
             # 親ユニットへの通知
             task_info = tasks.get(task_id, {})
             if "env" in task_info and "PARENT_UNIT_ID" in task_info["env"]:
                 parent_id = task_info["env"]["PARENT_UNIT_ID"]
                 status = "error" if is_error else "completed"
-                summary = msg.get("data", {}).get("summary", "Task finished")
-                error_message = msg.get("data", {}).get("message") if is_error else None
+                summary = data.get("summary", "Task finished")
+                error_message = data.get("message") if is_error else None
                 
-                # children-status.ymlを更新
-                update_children_status(parent_id, task_id, status, error_message)
+                # children-status.ymlを更新（兄弟ユニットの結果と並行して書き換えない）
+                with _children_status_lock:
+                    update_children_status(parent_id, task_id, status, error_message)
                 
                 # 親ユニットへ通知
                 notify_parent_unit(parent_id, task_id, status, summary)
-        
-        save_tasks()
+        else:
+            # log/error等はタスク状態を変えないため書き込まない
+            with _state_lock:
+                state_metrics["avoided"] += 1
     
     print(f"Posted {msg_type} from {msg.get('from')} for task {task_id}")
 
 
+def handle_batch(msg):
+    """batchメッセージを処理（busctl batch がまとめたメッセージを順に処理する）
+
+    途中のメッセージで失敗した場合は、msgのmessagesをそのメッセージ以降に
+    書き換えてから例外を送出する。呼び出し元は書き換えたmsgで投函ファイルを
+    置き換え（_save_progress）、batch全体と同じく間隔を空けて再試行する。
+    処理済みのメッセージを再処理せず、残りの順序も保ち、失敗し続ければdead/に移すため。
+    """
+    messages = msg.get("data", {}).get("messages", [])
+    for i, inner in enumerate(messages):
+        try:
+            dispatch_message(inner)
+        except Exception:
+            if i:
+                msg["data"] = dict(msg["data"], messages=messages[i:])
+            raise
+    
+    print(f"Processed batch {msg.get('id')} ({len(messages)} messages)")
+
+
+def dispatch_message(msg):
+    """メッセージタイプに応じて処理
+
+    台帳に記録済みのIDのメッセージ（再配信）は処理せずに成功として扱う。
+    処理に成功したメッセージのIDは台帳に記録する（永続化は走査の終わり）。
+    """
+    msg_id = msg.get("id") if ledger is not None else None
+    if msg_id is not None and ledger.seen(msg_id):
+        print(f"Skipping already processed message {msg_id}")
+        return
+    
+    msg_type = msg.get("type")
+    if msg_type == "spawn":
+        handle_spawn(msg)
+    elif msg_type == "batch":
+        handle_batch(msg)
+    elif msg_type in ["send", "instruct"]:
+        handle_send(msg)
+    else:
+        # log, result, error等はすべてpostとして扱う
+        handle_post(msg)
+    
+    if msg_id is not None:
+        ledger.add(msg_id)
+
+
+def dispatch_key(msg):
+    """メッセージの宛先（ディスパッチャのシャードのキー）を返す
+
+    send/instructは送り先のユニット、それ以外（spawn・post・batch）はtask_id。
+    同じユニットへのsendとそのユニットからのpostは同じシャードで順に処理される。
+    """
+    if msg.get("type") in ("send", "instruct"):
+        return msg.get("to", "").split(":", 1)[-1]
+    return msg.get("task_id") or msg.get("from") or ""
+
+
+def dispatch(msg, token):
+    """メッセージの処理を投入する
+
+    ディスパッチャが動作していれば宛先ごとのキューに積み（完了は待たない）、
+    そうでなければその場で処理する。結果はどちらも(token, error)として
+    commit_finished()で反映される。
+    """
+    if dispatcher is not None:
+        dispatcher.submit(msg, token)
+        return
+    try:
+        dispatch_message(msg)
+        _finished.append((token, None))
+    except Exception as e:
+        _finished.append((token, e))
+
+
+def _report_error(source, error):
+    print(f"Error processing {source}: {error}")
+    traceback.print_exception(error)
+
+
+def _retry_later(json_file, error):
+    """処理に失敗した投函ファイルの再試行を予約し、上限回数に達したらdead/に移す
+
+    スタックトレースは1回目の失敗だけで出力する。
+    """
+    attempts, delay = retry_queue.failed(json_file)
+    if delay is None:
+        print(f"Giving up on {json_file} after {attempts} attempts: {error}")
+        try:
+            dest = bury(json_file, error, attempts)
+        except OSError as e:
+            print(f"Failed to move {json_file} to the dead letter mailbox: {e}")
+            return
+        _inbox_indexes[json_file.parent].forget([json_file])
+        print(f"Moved to {dest}")
+    elif attempts == 1:
+        _report_error(json_file, error)
+        print(f"Retrying {json_file.name} in {delay:g}s")
+    else:
+        print(f"Error processing {json_file} (attempt {attempts}, retrying in {delay:g}s): {error}")
+
+
+def _save_progress(json_file, msg):
+    """途中まで処理したbatchの残りで投函ファイルを置き換える（ファイル名と再試行の回数はそのまま）"""
+    if msg.get("type") != "batch":
+        return
+    tmp = json_file.with_name(f".tmp-{json_file.name}")
+    try:
+        tmp.write_text(json.dumps(msg, ensure_ascii=False))
+        os.replace(tmp, json_file)
+    except OSError as e:
+        # 元のbatchのまま再試行する（処理済みのメッセージは台帳があれば読み飛ばされる）
+        print(f"Failed to save progress of batch {msg.get('id')}: {e}")
+
+
+def write_to_mailbox(msg, mailbox="bus"):
+    """メッセージをメールボックスにファイルとして投函する（busctlと同じ形式）"""
+    dest = MBOX / mailbox / "in"
+    dest.mkdir(parents=True, exist_ok=True)
+    name = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S.%f')[:-3]}Z-{os.urandom(6).hex()}.json"
+    tmp = dest / f".tmp-{name}"
+    tmp.write_text(json.dumps(msg, ensure_ascii=False))
+    tmp.rename(dest / name)
+    append_sequence(dest, name)
+
+
+def read_message(path):
+    """メールボックスのファイルからメッセージを読む（JSONまたはエンベロープ形式）"""
+    raw = path.read_bytes()
+    if envelope.is_envelope(raw):
+        return envelope.decode(raw)
+    return json.loads(raw)
+
+
 def process_mailbox_once():
-    """mailbox内のメッセージを一度処理"""
-    # すべてのin/ディレクトリを走査
+    """mailbox内のメッセージとソケットで受け取ったメッセージの処理を投入し、処理を終えた分を反映する
+
+    処理は宛先ごとのワーカーで進み、走査はその完了を待たない。処理中の投函ファイルは
+    次の走査で投入し直さず、処理を終えた走査で永続化してから削除する。
+
+    Returns:
+        int: 処理を終えて反映したメッセージ数
+    """
+    # ワーカーが並行して追記するため、ライターは処理を始める前に用意しておく
+    _get_bus_log()
+    
+    # すべてのin/ディレクトリから未処理の投函ファイル（.json と .msg）を到着順に取り出す
     for inbox_dir in MBOX.glob("*/in"):
-        # JSONファイルを時刻順にソート
-        json_files = sorted(inbox_dir.glob("*.json"))
+        index = _get_inbox_index(inbox_dir)
+        json_files = [json_file for json_file in index.discover() if json_file not in _in_flight]
         
         if json_files:
             print(f"[DEBUG] Found {len(json_files)} messages in {inbox_dir}")
         
         for json_file in json_files:
+            if not retry_queue.ready(json_file):
+                # 前回失敗して再試行を待っている
+                continue
             try:
                 # メッセージを読み込み
-                msg = json.loads(json_file.read_text())
-                msg_type = msg.get("type")
-                
-                print(f"Processing {msg_type} message from {json_file}")
-                
-                # メッセージタイプに応じて処理
-                if msg_type == "spawn":
-                    handle_spawn(msg)
-                elif msg_type in ["send", "instruct"]:
-                    handle_send(msg)
-                else:
-                    # log, result, error等はすべてpostとして扱う
-                    handle_post(msg)
-                
-                # 処理済みファイルを削除
-                json_file.unlink()
-                
+                msg = read_message(json_file)
+            except FileNotFoundError:
+                # 走査と.seqの両方で見つかり、すでに処理して削除したファイル
+                index.forget([json_file])
+                continue
             except Exception as e:
-                print(f"Error processing {json_file}: {e}")
-                import traceback
-                traceback.print_exc()
-                # エラーが発生してもファイルは削除しない（再試行のため）
+                _retry_later(json_file, e)
+                continue
+            print(f"Processing {msg.get('type')} message from {json_file}")
+            _in_flight[json_file] = msg
+            dispatch(msg, ("file", json_file))
+    
+    # 失敗してメールボックスにも移せなかったソケット経由のメッセージを処理し直す
+    for seq, entry in sorted(_received.items()):
+        if entry[1] == "retry":
+            entry[1] = "running"
+            dispatch(entry[0], ("sock", seq))
+    
+    # ソケット経由のメッセージ（受け取り時にジャーナル済み）
+    received = ingest_server.drain() if ingest_server is not None else []
+    for seq, msg in received:
+        print(f"Processing {msg.get('type')} message from {INGEST_SOCK}")
+        _received[seq] = [msg, "running"]
+        dispatch(msg, ("sock", seq))
+    
+    return commit_finished()
+
+
+def commit_finished():
+    """処理を終えたメッセージの結果を永続化し、投函ファイルを片付ける
+
+    Returns:
+        int: 処理を終えて反映したメッセージ数
+    """
+    if dispatcher is not None:
+        # ここまでに処理を終えたメッセージの追記・タスクの変更は以下の永続化に含まれる
+        _finished.extend(dispatcher.drain())
+    
+    # 走査中のbus.jsonlへの追記とタスクの変更をまとめて永続化
+    try:
+        _get_bus_log().flush()
+    except OSError as e:
+        # 書き込めなかった場合は結果を反映せず、次の走査で再試行
+        print(f"Error writing {BUS_LOG}: {e}")
+        return 0
+    flush_tasks()
+    if ledger is not None:
+        try:
+            ledger.commit()
+        except sqlite3.Error as e:
+            # 次の走査で書き込み直す。書き込めないまま停止すると再配信を処理し直す
+            print(f"Failed to record processed messages: {e}")
+    
+    finished = list(_finished)
+    _finished.clear()
+    processed = 0
+    for (source, ref), error in finished:
+        if source == "file":
+            msg = _in_flight.pop(ref)
+            if error is None:
+                # 永続化できてから処理済みファイルを削除
+                ref.unlink()
+                _inbox_indexes[ref.parent].forget([ref])
+                retry_queue.forget(ref)
+                processed += 1
+            else:
+                # ファイルは削除せず、間隔を空けて再試行する
+                _save_progress(ref, msg)
+                if isinstance(error, SpawnInProgress):
+                    # 宛先の起動を待つだけなので失敗回数には数えない
+                    print(f"Deferring {ref.name}: {error}")
+                    retry_queue.defer(ref, SPAWN_WAIT_DELAY)
+                else:
+                    _retry_later(ref, error)
+            continue
+        
+        entry = _received[ref]
+        if error is None:
+            entry[1] = "done"
+            processed += 1
+            continue
+        if not isinstance(error, SpawnInProgress):
+            _report_error(f"message {entry[0].get('id')} from {INGEST_SOCK}", error)
+        # メールボックスに移してファイルと同じく再試行させる
+        try:
+            write_to_mailbox(entry[0])
+            entry[1] = "done"
+            processed += 1
+        except OSError as write_error:
+            print(f"Failed to requeue message {entry[0].get('id')}: {write_error}")
+            entry[1] = "retry"
+    
+    # 到着順で先頭から処理を終えた所までを処理済みとする（以降の処理済み分は再処理され得る）
+    done_seq = None
+    for seq in sorted(_received):
+        if _received[seq][1] != "done":
+            break
+        del _received[seq]
+        done_seq = seq
+    if done_seq is not None:
+        ingest_server.done(done_seq)
+    return processed
+
+
+def start_ingest_server(on_message=None):
+    """bus.sockでの受け付けを開始する（BUSD_INGEST=0 なら何もしない）"""
+    global ingest_server
+    if not INGEST_ENABLED:
+        return None
+    try:
+        ingest_server = IngestServer(INGEST_SOCK, INGEST_JOURNAL, fsync=INGEST_FSYNC,
+                                     on_message=on_message).start()
+        print(f"Accepting messages on {INGEST_SOCK}")
+    except OSError as e:
+        # ソケットのパスが長すぎる場合等。busctlはメールボックスに書き込む
+        print(f"Socket transport unavailable ({e}), using mailboxes only")
+        ingest_server = None
+    return ingest_server
+
+
+def start_spawn_pipeline(on_complete=None):
+    """spawnパイプラインを起動する（SPAWN_WORKERS=0なら同期実行のまま）"""
+    global spawn_pipeline
+    if SPAWN_WORKERS <= 0:
+        return None
+    spawn_pipeline = SpawnPipeline(_prepare_spawn, _launch_spawn, _greet_spawn,
+                                   workers=SPAWN_WORKERS,
+                                   startup_delay=CLAUDE_STARTUP_DELAY,
+                                   on_complete=on_complete)
+    return spawn_pipeline
+
+
+def start_dispatcher(on_complete=None):
+    """メッセージ処理のディスパッチャを起動する（DISPATCH_WORKERS=0なら同期実行のまま）"""
+    global dispatcher
+    if DISPATCH_WORKERS <= 0:
+        return None
+    dispatcher = ShardedDispatcher(dispatch_message, dispatch_key, workers=DISPATCH_WORKERS,
+                                   on_complete=on_complete)
+    return dispatcher
+
+
+def get_worktree_pool_dir():
+    """プールのworktreeを置くディレクトリ（worktreeと同じくTARGET_REPOの隣）"""
+    return TARGET_REPO.parent / f".{TARGET_REPO.name}-worktree-pool"
+
+
+def start_worktree_pool():
+    """worktreeの事前チェックアウトを開始する（WORKTREE_POOL_SIZE=0やコミットが無いリポジトリでは何もしない）"""
+    global worktree_pool
+    if WORKTREE_POOL_SIZE <= 0 or not _get_repo_info().has_commits():
+        return None
+    worktree_pool = WorktreePool(TARGET_REPO, get_worktree_pool_dir(), size=WORKTREE_POOL_SIZE,
+                                 lock=_git_lock,
+                                 branch_exists=lambda branch: _get_repo_info().has_branch(branch)).start()
+    return worktree_pool
+
+
+def _reaped(task_id, result):
+    """後始末が終わったタスクに印を付ける（reaperのワーカーから呼ばれる）"""
+    update_task(task_id, reaped_at=int(time.time() * MS_PER_SECOND), reaped=result)
+
+
+def start_reaper():
+    """終了したユニットの後始末を開始する（REAPER_ENABLED=0なら何もしない）"""
+    global reaper
+    if not REAPER_ENABLED:
+        return None
+    reaper = Reaper(TARGET_REPO, TARGET_REPO.parent / f".{TARGET_REPO.name}-reaped",
+                    LOGS / "raw", LOGS / "raw" / "archive", lock=_git_lock, on_done=_reaped)
+    return reaper
+
+
+def maybe_reap(force=False):
+    """保持の方針から外れた終了済みユニットを選び、ペインを閉じて後始末を予約する
+
+    Returns:
+        list: 後始末を予約したtask_id
+    """
+    global _last_reap
+    if reaper is None or (not force and time.monotonic() - _last_reap < REAP_INTERVAL):
+        return []
+    _last_reap = time.monotonic()
+    with _state_lock:
+        snapshot = [dict(task) for task in tasks.values()]
+    by_id = {task["id"]: task for task in snapshot}
+    submitted = []
+    for task_id in select_reapable(snapshot, int(time.time() * MS_PER_SECOND), keep=REAP_KEEP,
+                                   keep_age=REAP_KEEP_AGE, keep_failed=REAP_KEEP_FAILED):
+        task = by_id[task_id]
+        # busdが作ったworktree以外（PMAIのTARGET_REPO等）には触れない
+        if task.get("worktree_path") != str(get_worktree_path(task_id)) or reaper.pending(task_id):
+            continue
+        pane = pane_map.pop(task_id, None)
+        if pane is not None:
+            tmux("kill-pane", "-t", pane, check=False)
+            save_pane_map(task_id)
+        stop_busctl_server(task_id)
+        reaper.submit(task)
+        submitted.append(task_id)
+    return submitted
+
+
+def start_ledger():
+    """処理済みメッセージIDの台帳を開く（BUSD_LEDGER=0 なら何もしない）"""
+    global ledger
+    if not LEDGER_ENABLED:
+        return None
+    try:
+        ledger = MessageLedger(LEDGER_FILE, cache_size=LEDGER_CACHE_SIZE, retention=LEDGER_RETENTION)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Message ledger unavailable ({e}), redelivered messages will be processed again")
+        ledger = None
+    return ledger
 
 
 def main():
@@ -869,21 +1826,88 @@ def main():
     print(f"ROOT: {ROOT}")
     print(f"TMUX_SESSION: {TMUX_SESSION}")
     
+    # SIGTERMでもKeyboardInterruptと同様に後始末（状態の集約等）を行う
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    # SIGHUPでbus.jsonlを開き直す（logrotate対応）
+    signal.signal(signal.SIGHUP, lambda signum, frame: _get_bus_log().request_reopen())
+    
     # 状態を復元
     load_state()
+    start_ledger()
+    sync_bus_index()
+    start_event_server()
     
     # tmuxセッションを確保
     ensure_session()
     
-    print("Monitoring mailboxes...")
+    # 以降のtmux操作は制御モード接続で行う
+    start_tmux_client()
+    
+    # 投函の監視を開始（inotifyが使えなければ適応的ポーリング）
+    watcher = create_watcher(MBOX, POLLING_MIN_INTERVAL, POLLING_INTERVAL, WATCHER_BACKEND)
+    print(f"Monitoring mailboxes ({watcher.backend})...")
+    
+    # spawnはワーカーで実行し、完了したらメインループを起こす
+    start_spawn_pipeline(on_complete=watcher.wake)
+    
+    # メッセージは宛先ごとに並列に処理し、処理を終えたらメインループを起こす
+    start_dispatcher(on_complete=watcher.wake)
+    
+    # spawnに備えてworktreeをバックグラウンドでチェックアウトしておく
+    start_worktree_pool()
+    
+    # 終了したユニットはバックグラウンドで片付ける
+    start_reaper()
+    
+    # ソケット経由の投函を受け付け、届いたらメインループを起こす
+    start_ingest_server(on_message=watcher.wake)
     
     # メインループ
     try:
         while True:
-            process_mailbox_once()
-            time.sleep(POLLING_INTERVAL)  # 500msポーリング
+            processed = process_mailbox_once()
+            finish_spawns()
+            maybe_compact_state()
+            maybe_reap()
+            # 再試行の予定があればその時刻までに起きる
+            retry_delay = retry_queue.next_delay()
+            timeout = WATCHER_IDLE_TIMEOUT if retry_delay is None else min(WATCHER_IDLE_TIMEOUT, retry_delay)
+            watcher.wait(timeout, active=processed > 0)
     except KeyboardInterrupt:
         print("\nShutting down...")
+    finally:
+        if dispatcher is not None:
+            # 処理中のメッセージを終えてから結果を反映する（処理待ちの分は再起動後に再配信される）
+            dispatcher.shutdown(wait=True)
+            commit_finished()
+        if spawn_pipeline is not None:
+            spawn_pipeline.shutdown()
+        if worktree_pool is not None:
+            worktree_pool.shutdown()
+        if reaper is not None:
+            reaper.shutdown()
+        if tmux_client is not None:
+            tmux_client.close()
+        watcher.close()
+        for index in _inbox_indexes.values():
+            index.close()
+        _get_bus_log().close()
+        for task_id in list(busctl_servers):
+            stop_busctl_server(task_id)
+        if ingest_server is not None:
+            ingest_server.close()
+        if event_server is not None:
+            event_server.close()
+        if _bus_index is not None:
+            _bus_index.close()
+        if ledger is not None:
+            ledger.close()
+        compact_state()
+        print(f"State writes: {state_metrics['writes']} performed, {state_metrics['avoided']} avoided")
+        if worktree_pool is not None:
+            print(f"Worktree pool: {worktree_pool.metrics['hits']} hits, {worktree_pool.metrics['misses']} misses")
+        if _provisioner is not None:
+            print("Provisioned files: " + ", ".join(f"{n} {method}" for method, n in _provisioner.metrics.items()))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+busq - Query the AI App Studio bus event log
+
+Looks records up through the sidecar index (logs/bus.index.sqlite) and reads
+only the matching records from bus.jsonl and its rotated segments, instead of
+scanning the whole log.
+
+With --follow, subscribes to busd's event stream (state/events.sock) and
+prints matching events as busd processes them. Filtering happens in busd.
+
+Usage:
+    busq --task root-api-users --type result     # All results for a task
+    busq --since 14:00 --until 14:05             # Events in a time window (today)
+    busq --since 10m                             # Events from the last 10 minutes
+    busq --task root --last 5                    # Five most recent events for a task
+    busq --count --type error                    # Number of error events
+    busq --follow --task-prefix root-api         # Stream events for a subtree
+"""
+
+import argparse
+import json
+import os
+import re
+import socket
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Allow running from any directory
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bus_index import BusIndex
+from bus_log import read_at
+
+RELATIVE_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_time(value, now=None):
+    """Convert a time argument into epoch milliseconds
+
+    Accepts epoch milliseconds, ISO 8601 (2024-05-01T14:00), a time of day
+    (14:00 or 14:00:30, local time today) or a relative age (30s, 10m, 2h, 1d).
+    """
+    now = time.time() if now is None else now
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", value)
+    if match:
+        return int((now - float(match.group(1)) * RELATIVE_UNITS[match.group(2)]) * 1000)
+
+    match = re.fullmatch(r"(\d{1,2}):(\d{2})(?::(\d{2}))?", value)
+    if match:
+        hour, minute, second = (int(g or 0) for g in match.groups())
+        day = datetime.fromtimestamp(now)
+        return int(day.replace(hour=hour, minute=minute, second=second, microsecond=0).timestamp() * 1000)
+
+    try:
+        return int(datetime.fromisoformat(value).timestamp() * 1000)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid time: {value!r}")
+
+
+def query(log_path, task_id=None, msg_type=None, since=None, until=None, limit=None,
+          newest=False, sync=True):
+    """Return matching bus records, oldest first (newest first if newest=True)"""
+    index = BusIndex(log_path)
+    try:
+        if sync:
+            index.sync()
+        locations = index.lookup(task_id=task_id, msg_type=msg_type, since=since,
+                                 until=until, limit=limit, newest=newest)
+    finally:
+        index.close()
+    return list(read_at(log_path, locations))
+
+
+def follow(sock_path, filters, wait=0):
+    """Subscribe to busd's event stream and yield matching events
+
+    Args:
+        sock_path: Path of busd's events.sock
+        filters: Subscription filters (task_prefix, task_id, type, from)
+        wait: Seconds to keep retrying while busd is not listening yet
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(sock_path))
+            break
+        except (FileNotFoundError, ConnectionRefusedError):
+            sock.close()
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.2)
+
+    with sock:
+        sock.sendall((json.dumps(filters) + "\n").encode("utf-8"))
+        for line in sock.makefile("r", encoding="utf-8"):
+            record = json.loads(line)
+            if "error" in record and len(record) == 1:
+                raise ValueError(f"busd rejected subscription: {record['error']}")
+            if "subscribed" in record and len(record) == 1:
+                continue
+            yield record
+
+
+def create_parser():
+    """Create and configure argument parser"""
+    parser = argparse.ArgumentParser(
+        description='Query the AI App Studio bus event log',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__.split("Usage:", 1)[1])
+    parser.add_argument('--task', help='Only events for this task ID')
+    parser.add_argument('--type', help='Only events of this message type (log, result, error, ...)')
+    parser.add_argument('--since', type=parse_time, help='Only events at or after this time')
+    parser.add_argument('--until', type=parse_time, help='Only events at or before this time')
+    parser.add_argument('--limit', type=int, help='Return at most N events (oldest first)')
+    parser.add_argument('--last', type=int, help='Return the N most recent events')
+    parser.add_argument('--count', action='store_true', help='Print the number of matching events')
+    parser.add_argument('--reindex', action='store_true', help='Rebuild the index from scratch')
+    parser.add_argument('-f', '--follow', action='store_true', help='Stream new events from busd')
+    parser.add_argument('--task-prefix', help='With --follow: only events whose task ID starts with this')
+    parser.add_argument('--from', dest='from_', help='With --follow: only events from this sender')
+    parser.add_argument('--wait', type=float, default=0,
+                        help='With --follow: seconds to wait for busd to start listening')
+    return parser
+
+
+def main():
+    """Main entry point"""
+    if 'BUSCTL_ROOT' in os.environ:
+        root = os.environ['BUSCTL_ROOT']
+    else:
+        root = os.path.join(os.getcwd(), ".ai-app-studio")
+    log_path = Path(root) / "logs" / "bus.jsonl"
+
+    parser = create_parser()
+    args = parser.parse_args()
+
+    if args.follow:
+        filters = {"task_prefix": args.task_prefix, "task_id": args.task,
+                   "type": args.type, "from": args.from_}
+        filters = {k: v for k, v in filters.items() if v is not None}
+        try:
+            for record in follow(Path(root) / "state" / "events.sock", filters, wait=args.wait):
+                print(json.dumps(record, ensure_ascii=False), flush=True)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        except KeyboardInterrupt:
+            pass
+        return
+    if args.task_prefix or args.from_:
+        parser.error("--task-prefix and --from require --follow")
+
+    if args.reindex or args.count:
+        index = BusIndex(log_path)
+        try:
+            if args.reindex:
+                index.reset()
+            index.sync()
+            if args.count:
+                print(index.count(task_id=args.task, msg_type=args.type,
+                                  since=args.since, until=args.until))
+                return
+        finally:
+            index.close()
+
+    newest = args.last is not None
+    records = query(log_path, task_id=args.task, msg_type=args.type,
+                    since=args.since, until=args.until,
+                    limit=args.last if newest else args.limit, newest=newest)
+    if newest:
+        records.reverse()
+    for record in records:
+        print(json.dumps(record, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
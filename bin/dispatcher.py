@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+dispatcher - 宛先ごとのキューでメッセージを並列に処理するディスパッチャ
+
+投入されたメッセージは宛先（ペインやtask_id）をキーにしたキューに積まれ、
+常駐するワーカーが処理する。同じキーのメッセージは一度に1つのワーカーだけが
+投入順に処理するため宛先ごとの順序は保たれ、遅い宛先（応答の遅いペインへの
+send等）が他の宛先を待たせることはない。
+
+submit()は処理の完了を待たない。呼び出し側はdrain()で処理を終えたメッセージを
+受け取り、その分だけ永続化・投函ファイルの削除を行う（走査ごとに全宛先の完了を
+待ち合わせることはない）。
+"""
+
+import queue
+import threading
+from collections import deque
+
+
+class ShardedDispatcher:
+    """宛先ごとの順序を保ったままメッセージを並列に処理する
+
+    Args:
+        handler: msg -> None。メッセージを処理する（例外は失敗として返す）
+        key: msg -> str。キューのキー（同じキーのメッセージは投入順に処理される）
+        workers: ワーカースレッド数
+        on_complete: メッセージの処理を終えた時に呼ばれる（メインループの起床用）
+    """
+
+    def __init__(self, handler, key, workers=4, on_complete=None):
+        self.handler = handler
+        self.key = key
+        self.workers = max(1, workers)
+        self.on_complete = on_complete
+        self._queues = {}  # キー -> deque[(token, msg)]（処理中か処理待ちのキーだけ）
+        self._ready = deque()  # 処理待ちのメッセージがあり、ワーカーが付いていないキー
+        self._cond = threading.Condition()
+        self._pending = 0  # 投入されて処理を終えていないメッセージ数
+        self._completed = queue.SimpleQueue()
+        self._stopped = False
+        self._threads = [threading.Thread(target=self._work, name=f"dispatch-{i}", daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, msg, token=None):
+        """メッセージを宛先のキューに積む（処理の完了は待たない）
+
+        Args:
+            token: drain()で結果と一緒に返す値（投函ファイル等）
+        """
+        key = self.key(msg)
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("dispatcher is shut down")
+            pending = self._queues.get(key)
+            if pending is None:
+                pending = self._queues[key] = deque()
+                self._ready.append(key)
+                self._cond.notify()
+            pending.append((token, msg))
+            self._pending += 1
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                key = self._ready.popleft()
+                token, msg = self._queues[key].popleft()
+
+            error = None
+            try:
+                self.handler(msg)
+            except Exception as e:
+                error = e
+
+            with self._cond:
+                self._completed.put((token, error))
+                self._pending -= 1
+                if self._queues[key]:
+                    # 他の宛先にも順番を回すため、残りは後ろに並び直す
+                    self._ready.append(key)
+                    self._cond.notify()
+                else:
+                    del self._queues[key]
+                self._cond.notify_all()
+            if self.on_complete:
+                self.on_complete()
+
+    def drain(self):
+        """処理を終えたメッセージを取り出す
+
+        Returns:
+            list: [(token, error), ...]（errorは成功ならNone、失敗なら送出された例外）
+        """
+        finished = []
+        while True:
+            try:
+                finished.append(self._completed.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def pending(self):
+        """投入されて処理を終えていないメッセージ数"""
+        return self._pending
+
+    def join(self, timeout=None):
+        """投入済みのメッセージをすべて処理し終えるまで待つ
+
+        Returns:
+            bool: 処理し終えたか（timeoutの場合False）
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending == 0 or self._stopped, timeout)
+
+    def shutdown(self, wait=False):
+        """ワーカーを停止する（処理待ちのメッセージは処理されない）"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
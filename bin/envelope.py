@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+envelope - 大きなメッセージ用のメールボックス投函形式（.msg）
+
+整形済みJSON（.json）の代わりに、ヘッダーとペイロードを分けて書く。
+
+    BUSENV1\\n                 # マジックとバージョン
+    {"id": ..., "type": ..., "payload": {"size": n, "encoding": "zlib"}}\\n
+    <n バイトのペイロード>     # data をコンパクトなJSONにしたもの（圧縮することもある）
+
+ヘッダーは data 以外のフィールドを1行のJSONにしたもので、`head -2` で読める。
+ペイロードはヘッダーに書いた長さだけ読むため、data 内の文字のエスケープや
+整形の手間がなく、大きな出力を小さく書ける。
+"""
+
+import json
+import zlib
+
+MAGIC = b"BUSENV"
+VERSION = 1
+SUFFIX = ".msg"  # メールボックスでのファイル名の拡張子
+COMPRESS_MIN_SIZE = 1024  # これ以上のペイロードは圧縮を試す（バイト）
+
+
+def encode(message, data_json=None):
+    """メッセージをエンベロープ形式のバイト列にする
+
+    Args:
+        message: メッセージ（dataを含む）
+        data_json: message["data"] をJSONにした文字列（作成済みなら渡す）
+    """
+    if data_json is None:
+        data_json = json.dumps(message.get("data"), ensure_ascii=False, separators=(",", ":"))
+    payload = data_json.encode("utf-8")
+    encoding = "identity"
+    if len(payload) >= COMPRESS_MIN_SIZE:
+        compressed = zlib.compress(payload, 6)
+        if len(compressed) < len(payload):
+            payload, encoding = compressed, "zlib"
+
+    header = {k: v for k, v in message.items() if k != "data"}
+    header["payload"] = {"size": len(payload), "encoding": encoding}
+    return b"".join([
+        MAGIC, str(VERSION).encode("ascii"), b"\n",
+        json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), b"\n",
+        payload,
+    ])
+
+
+def is_envelope(raw):
+    """バイト列がエンベロープ形式か"""
+    return raw.startswith(MAGIC)
+
+
+def decode(raw):
+    """エンベロープ形式のバイト列からメッセージを復元する
+
+    Raises:
+        ValueError: 形式が不正、未対応のバージョン、またはペイロードが欠けている
+    """
+    magic_end = raw.find(b"\n")
+    if not raw.startswith(MAGIC) or magic_end < 0:
+        raise ValueError("not a bus envelope")
+    version = raw[len(MAGIC):magic_end]
+    if version != str(VERSION).encode("ascii"):
+        raise ValueError(f"unsupported envelope version: {version.decode('ascii', 'replace')}")
+
+    header_end = raw.find(b"\n", magic_end + 1)
+    if header_end < 0:
+        raise ValueError("envelope header is incomplete")
+    header = json.loads(raw[magic_end + 1:header_end])
+    info = header.pop("payload")
+    payload = raw[header_end + 1:]
+    if len(payload) != info["size"]:
+        raise ValueError(f"envelope payload is {len(payload)} bytes, expected {info['size']}")
+    if info["encoding"] == "zlib":
+        payload = zlib.decompress(payload)
+    elif info["encoding"] != "identity":
+        raise ValueError(f"unknown payload encoding: {info['encoding']}")
+
+    header["data"] = json.loads(payload)
+    return header
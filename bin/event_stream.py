@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+event_stream - busイベントの購読API（Unixドメインソケット）
+
+クライアントは接続後に購読条件を1行のJSONで送る。以降、busdが bus.jsonl に
+書き込んだイベントのうち条件に合うものだけが改行区切りのJSONで送られてくる。
+
+購読条件（すべて省略可、指定したものはすべて満たす必要がある）:
+    {"task_prefix": "root-api", "task_id": "root-api-users",
+     "type": "result" | ["result", "error"], "from": "unit:root-api"}
+
+条件を受け付けると {"subscribed": {...}} を1行返す。条件が不正な場合は
+{"error": "..."} を返して切断する。
+
+読み取りが追いつかないクライアントは送信バッファが上限を超えた時点で切断する
+（busdのメインループを遅いクライアントで止めないため）。
+"""
+
+import json
+import os
+import selectors
+import socket
+import threading
+
+MAX_CLIENT_BUFFER = 1024 * 1024  # クライアントごとの未送信データの上限（バイト）
+MAX_REQUEST_SIZE = 64 * 1024  # 購読条件の行の最大長
+
+
+def parse_filters(request):
+    """購読条件を検証して正規化する
+
+    Raises:
+        ValueError: 条件が不正
+    """
+    if not isinstance(request, dict):
+        raise ValueError("subscription must be a JSON object")
+    unknown = set(request) - {"task_prefix", "task_id", "type", "from"}
+    if unknown:
+        raise ValueError(f"unknown filter keys: {', '.join(sorted(unknown))}")
+    filters = {}
+    for key in ("task_prefix", "task_id", "from"):
+        value = request.get(key)
+        if value is not None:
+            if not isinstance(value, str):
+                raise ValueError(f"{key} must be a string")
+            filters[key] = value
+    types = request.get("type")
+    if types is not None:
+        if isinstance(types, str):
+            types = [types]
+        if not isinstance(types, list) or not all(isinstance(t, str) for t in types):
+            raise ValueError("type must be a string or a list of strings")
+        filters["type"] = types
+    return filters
+
+
+def matches(filters, record):
+    """イベントが購読条件を満たすか"""
+    task_id = record.get("task_id") or ""
+    if "task_prefix" in filters and not str(task_id).startswith(filters["task_prefix"]):
+        return False
+    if "task_id" in filters and task_id != filters["task_id"]:
+        return False
+    if "type" in filters and record.get("type") not in filters["type"]:
+        return False
+    if "from" in filters and record.get("from") != filters["from"]:
+        return False
+    return True
+
+
+class _Client:
+    def __init__(self, sock):
+        self.sock = sock
+        self.rbuf = b""
+        self.wbuf = bytearray()
+        self.filters = None  # 購読条件を受け取るまではNone
+        self.closing = False  # 送信し終えたら切断する
+
+
+class EventStreamServer:
+    """busイベントの購読サーバー
+
+    publish()はメインスレッドから呼ばれ、送信は専用スレッドが行う。
+
+    Args:
+        path: ソケットファイルのパス
+        max_buffer: クライアントごとの未送信データの上限（バイト）
+    """
+
+    def __init__(self, path, max_buffer=MAX_CLIENT_BUFFER):
+        self.path = str(path)
+        self.max_buffer = max_buffer
+        self._sock = None
+        self._selector = selectors.DefaultSelector()
+        self._clients = {}  # fd -> _Client
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._thread = None
+        self._stopped = False
+        self.dropped = 0  # 送信が追いつかず切断したクライアント数
+
+    def start(self):
+        """ソケットを作成して受け付けを開始する"""
+        if os.path.exists(self.path):
+            # 前回のbusdが残したソケット
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        self._sock.listen(16)
+        self._sock.setblocking(False)
+        self._selector.register(self._sock, selectors.EVENT_READ, "accept")
+        self._selector.register(self._wake_r, selectors.EVENT_READ, "wake")
+        self._thread = threading.Thread(target=self._loop, name="event-stream", daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def subscribers(self):
+        with self._lock:
+            return sum(1 for c in self._clients.values() if c.filters is not None)
+
+    def publish(self, records):
+        """イベントを条件に合う購読者の送信バッファに積む"""
+        if not self._clients:
+            return
+        with self._lock:
+            clients = [c for c in self._clients.values() if c.filters is not None and not c.closing]
+            if not clients:
+                return
+            for record in records:
+                line = None
+                for client in clients:
+                    if client.closing or not matches(client.filters, record):
+                        continue
+                    if line is None:
+                        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                    client.wbuf += line
+                    if len(client.wbuf) > self.max_buffer:
+                        # 遅いクライアントは切断する（未送信分は破棄）
+                        client.wbuf.clear()
+                        client.closing = True
+                        self.dropped += 1
+        self._wake()
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b"\0")
+        except BlockingIOError:
+            pass  # すでに起こされている
+
+    def _loop(self):
+        while not self._stopped:
+            with self._lock:
+                for fd, client in list(self._clients.items()):
+                    if client.closing and not client.wbuf:
+                        self._drop(client)
+                        continue
+                    events = selectors.EVENT_READ
+                    if client.wbuf:
+                        events |= selectors.EVENT_WRITE
+                    self._selector.modify(client.sock, events, client)
+
+            for key, mask in self._selector.select():
+                if key.data == "accept":
+                    self._accept()
+                elif key.data == "wake":
+                    try:
+                        while os.read(self._wake_r, 4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    with self._lock:
+                        if key.data.sock.fileno() not in self._clients:
+                            continue
+                        if mask & selectors.EVENT_READ:
+                            self._read(key.data)
+                        if mask & selectors.EVENT_WRITE and key.data.sock.fileno() in self._clients:
+                            self._write(key.data)
+
+    def _accept(self):
+        try:
+            sock, _ = self._sock.accept()
+        except OSError:
+            return
+        sock.setblocking(False)
+        client = _Client(sock)
+        with self._lock:
+            self._clients[sock.fileno()] = client
+            self._selector.register(sock, selectors.EVENT_READ, client)
+
+    def _read(self, client):
+        try:
+            data = client.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._drop(client)
+            return
+        if client.filters is not None:
+            # 購読後にクライアントから送られてくるデータは無視する
+            return
+        client.rbuf += data
+        if b"\n" not in client.rbuf:
+            if len(client.rbuf) > MAX_REQUEST_SIZE:
+                self._reject(client, "subscription request too large")
+            return
+        line = client.rbuf.split(b"\n", 1)[0]
+        client.rbuf = b""
+        try:
+            client.filters = parse_filters(json.loads(line or b"{}"))
+        except ValueError as e:
+            self._reject(client, str(e))
+            return
+        client.wbuf += (json.dumps({"subscribed": client.filters}, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def _reject(self, client, message):
+        client.wbuf += (json.dumps({"error": message}, ensure_ascii=False) + "\n").encode("utf-8")
+        client.closing = True
+
+    def _write(self, client):
+        try:
+            sent = client.sock.send(client.wbuf)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._drop(client)
+            return
+        del client.wbuf[:sent]
+
+    def _drop(self, client):
+        self._clients.pop(client.sock.fileno(), None)
+        try:
+            self._selector.unregister(client.sock)
+        except (KeyError, ValueError):
+            pass
+        client.sock.close()
+
+    def close(self):
+        """受け付けを止めてすべてのクライアントを切断する"""
+        self._stopped = True
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        with self._lock:
+            for client in list(self._clients.values()):
+                self._drop(client)
+        if self._sock is not None:
+            self._selector.unregister(self._sock)
+            self._sock.close()
+            self._sock = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        self._selector.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
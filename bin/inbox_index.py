@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+inbox_index - 受信箱の投函順序ログ（in/.seq）による新着メッセージの検出
+
+投函者（busctl・busd）はメッセージファイルを in/ にrenameした後、そのファイル名を
+1行として in/.seq に追記する。busdは前回読んだ位置から .seq を読み進めるだけで
+新着を見つけられるため、走査の手間は溜まっている投函の数ではなく新着の数で決まる。
+
+次の場合はディレクトリ全体を走査し直す（.seqに載らない投函を取りこぼさないため）:
+- 受信箱を初めて見たとき（busd起動時）
+- .seq が無い、作り直された、切り詰められた、または不正な行がある
+- 前回の全走査から rescan_interval 秒が経った（rename後・追記前に投函者が落ちた場合等）
+
+読み終えた .seq は新しい空のファイルに置き換える。置き換えの前に古い .seq を開いた
+投函者の追記は、次の全走査まで古い .seq を開いたまま読み続けて拾う。
+"""
+
+import os
+import time
+from pathlib import Path
+
+SEQ_NAME = ".seq"
+MESSAGE_SUFFIXES = (".json", ".msg")  # JSONとエンベロープ形式（envelope.py）
+ROTATE_BYTES = 1024 * 1024  # 読み終えた .seq がこの大きさを超えたら作り直す
+
+
+def is_message_name(name):
+    """投函済みメッセージファイル名かどうか（.tmp-* や .seq 等の隠しファイルは除外）"""
+    return name.endswith(MESSAGE_SUFFIXES) and not name.startswith(".") and "/" not in name
+
+
+def append_sequence(inbox, name):
+    """投函したファイル名を受信箱の .seq に追記する（投函者側）
+
+    1回のO_APPENDの書き込みで行全体を書くため、並行する投函者の行は混ざらない。
+    """
+    fd = os.open(os.path.join(inbox, SEQ_NAME), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, f"{name}\n".encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+class InboxIndex:
+    """1つの受信箱の未処理メッセージを .seq から見つける（busd側）
+
+    Args:
+        inbox: 受信箱ディレクトリ（mbox/<name>/in）
+        rescan_interval: この間隔（秒）でディレクトリ全体を走査し直す
+    """
+
+    def __init__(self, inbox, rescan_interval=30.0):
+        self.inbox = Path(inbox)
+        self.seq_path = self.inbox / SEQ_NAME
+        self.rescan_interval = rescan_interval
+        self.offset = 0  # .seq の読み終えた位置（バイト）
+        self.inode = None
+        self.pending = {}  # 未処理のファイル名（到着順。値は使わない）
+        self.need_scan = True
+        self.last_scan = 0.0
+        self.scans = 0  # 全走査の回数
+        # 読んでいる .seq を開いたままにしておく（作り直されたときに同じinode番号が
+        # 再利用されず、inodeの比較で確実に検出できる）
+        self._fp = None
+        self._retired = None  # 置き換えた古い .seq と読み終えた位置 [fp, offset]
+
+    def discover(self):
+        """未処理のメッセージファイルを到着順に返す
+
+        処理済みで削除したファイルは forget() で取り除く。処理に失敗して残したファイルは
+        次回も返される。
+        """
+        st = self._stat()
+        if st is None:
+            self.close()
+        elif st.st_ino != self.inode:
+            # 初めて見た、または作り直された
+            st = self._open()
+        elif st.st_size < self.offset:
+            # 切り詰められた
+            self.offset = 0
+            self.need_scan = True
+        elif self.offset >= ROTATE_BYTES and st.st_size == self.offset:
+            st = self._rotate()
+
+        if st is None or self.need_scan or time.monotonic() - self.last_scan >= self.rescan_interval:
+            # .seq が無い受信箱（追記しない投函者だけが使う）は毎回走査する
+            self._scan()
+            if st is not None:
+                # stat前に追記された行のファイルはrename済みなので走査に含まれている
+                self.offset = st.st_size
+        else:
+            if self._retired is not None:
+                fp, offset = self._retired
+                self._retired[1] = self._read(fp, offset, os.fstat(fp.fileno()).st_size)
+            if st.st_size > self.offset:
+                self.offset = self._read(self._fp, self.offset, st.st_size)
+        return [self.inbox / name for name in self.pending]
+
+    def forget(self, paths):
+        """処理済み（または消えていた）ファイルを未処理から取り除く"""
+        for path in paths:
+            self.pending.pop(Path(path).name, None)
+
+    def close(self):
+        """開いている .seq を閉じる（次のdiscover()では全走査する）"""
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+        self._close_retired()
+        self.inode = None
+
+    def _close_retired(self):
+        if self._retired is not None:
+            self._retired[0].close()
+            self._retired = None
+
+    def _stat(self):
+        try:
+            return os.stat(self.seq_path)
+        except FileNotFoundError:
+            return None
+
+    def _open(self):
+        self.close()
+        try:
+            self._fp = open(self.seq_path, "rb")
+        except FileNotFoundError:
+            return None
+        st = os.fstat(self._fp.fileno())
+        self.inode = st.st_ino
+        self.offset = 0
+        self.need_scan = True
+        return st
+
+    def _scan(self):
+        with os.scandir(self.inbox) as entries:
+            names = sorted(e.name for e in entries if is_message_name(e.name))
+        self.pending = dict.fromkeys(names)
+        # 古い .seq に追記されたファイルもrename済みなので走査に含まれている
+        self._close_retired()
+        self.need_scan = False
+        self.last_scan = time.monotonic()
+        self.scans += 1
+
+    def _read(self, fp, offset, size):
+        """fpのoffsetからsizeまでの行を未処理に加え、読み終えた位置を返す"""
+        fp.seek(offset)
+        data = fp.read(size - offset)
+        # 書き込み途中の行は次回に読む
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].decode("utf-8", "replace").splitlines():
+            if is_message_name(line):
+                self.pending.setdefault(line)
+            else:
+                self.need_scan = True
+        return offset + end
+
+    def _rotate(self):
+        """読み終えた .seq を空の新しいファイルに置き換える
+
+        古い .seq は開いたまま残し、置き換えの直前に開いた投函者が後から追記した行を
+        次の全走査まで読み続ける（全走査せずに引き継ぐ）。
+        """
+        tmp = self.inbox / f"{SEQ_NAME}.new"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.close(fd)
+        os.replace(tmp, self.seq_path)
+        self._close_retired()
+        retired = [self._fp, self.offset]
+        self._fp = None
+        st = self._open()
+        self._retired = retired
+        self.need_scan = False
+        return st
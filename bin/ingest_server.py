@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+ingest_server - busctl からのメッセージを Unix ドメインソケットで直接受け取る
+
+メールボックスへのファイル投函（一時ファイル作成・rename・走査・読み込み・削除）
+の代わりに、ROOT/bus.sock で長さ付きフレームのJSONメッセージを受け付ける。
+
+フレーム形式（要求・応答とも）:
+    4バイトのビッグエンディアン長 + UTF-8のJSON
+
+受け取ったメッセージは取り込みジャーナル（state/ingest.jsonl）に追記して
+fsyncした後に {"ok": true, "id": ...} を返す。同じ待ち受けループで届いた
+複数のメッセージは1回の書き込みとfsyncでまとめて記録する（グループコミット）。
+メインスレッドは drain() でメッセージを取り出して処理し、処理結果を永続化
+した後に done() を呼ぶ。done() されないままbusdが停止した場合は、次回起動時に
+ジャーナルから再投入される。
+
+ジャーナルのレコード:
+    {"seq": n, "msg": {...}}   # 受け取ったメッセージ
+    {"done": n}                # seq n までを処理済み
+処理待ちが無くなった時点でジャーナルは空に切り詰める。処理が途切れない場合でも、
+ジャーナルが compact_bytes を超えたら処理済みのレコードを除いて書き直す。
+"""
+
+import collections
+import json
+import os
+import selectors
+import socket
+import struct
+import threading
+
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME_SIZE = 16 * 1024 * 1024  # 1メッセージの最大サイズ（バイト）
+COMPACT_BYTES = 1024 * 1024  # ジャーナルがこの大きさを超えたら処理済みのレコードを除いて書き直す
+
+
+def encode_frame(obj):
+    """オブジェクトを長さ付きフレームに変換する"""
+    payload = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def read_frame(sock):
+    """ブロッキングソケットからフレームを1つ読む（切断時はNone）"""
+    header = _recv_exact(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"frame too large: {length} bytes")
+    payload = _recv_exact(sock, length)
+    if payload is None:
+        return None
+    return json.loads(payload)
+
+
+def _recv_exact(sock, size):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+class _Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.rbuf = bytearray()
+        self.wbuf = bytearray()
+        self.skip = 0  # 読み捨てる残りのバイト数（大きすぎたフレームの本体）
+
+
+class IngestServer:
+    """bus.sock でメッセージを受け付けるサーバー
+
+    Args:
+        sock_path: ソケットファイルのパス
+        journal_path: 取り込みジャーナルのパス
+        fsync: 応答前にジャーナルをfsyncするか
+        on_message: メッセージを受け取ったときに呼ぶコールバック（メインループを起こす）
+        compact_bytes: ジャーナルを書き直す大きさ（バイト）
+    """
+
+    def __init__(self, sock_path, journal_path, fsync=True, on_message=None, compact_bytes=COMPACT_BYTES):
+        self.sock_path = str(sock_path)
+        self.journal_path = str(journal_path)
+        self.fsync = fsync
+        self.on_message = on_message
+        self.compact_bytes = compact_bytes
+        self._compacted_size = 0  # 前回書き直した直後の大きさ（処理待ちのレコードの分）
+        self._pending = collections.deque()  # (seq, msg)
+        self._lock = threading.Lock()
+        self._journal = None
+        self._last_seq = 0  # ジャーナルに記録した最後のseq
+        self._done_seq = 0  # 処理済みの最後のseq
+        self._sock = None
+        self._selector = selectors.DefaultSelector()
+        self._conns = {}
+        self._thread = None
+        self._stopped = False
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+
+    def start(self):
+        """未処理のメッセージをジャーナルから復元して受け付けを開始する"""
+        self._recover()
+        self._journal = open(self.journal_path, "ab")
+
+        if os.path.exists(self.sock_path):
+            os.unlink(self.sock_path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.sock_path)
+        self._sock.listen(64)
+        self._sock.setblocking(False)
+        self._selector.register(self._sock, selectors.EVENT_READ, "accept")
+        self._selector.register(self._wake_r, selectors.EVENT_READ, "wake")
+        self._thread = threading.Thread(target=self._loop, name="ingest", daemon=True)
+        self._thread.start()
+        return self
+
+    def _recover(self):
+        if not os.path.exists(self.journal_path):
+            return
+        received = {}
+        done = 0
+        valid_size = 0
+        with open(self.journal_path, "rb") as fp:
+            for raw in fp:
+                if not raw.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    break
+                valid_size += len(raw)
+                if "done" in record:
+                    done = max(done, record["done"])
+                elif "seq" in record:
+                    received[record["seq"]] = record["msg"]
+        # 書き込み途中の末尾（応答していないメッセージ）は捨てる
+        os.truncate(self.journal_path, valid_size)
+
+        self._last_seq = max(received, default=done)
+        self._done_seq = done
+        for seq in sorted(received):
+            if seq > done:
+                self._pending.append((seq, received[seq]))
+        if self._pending:
+            print(f"Recovered {len(self._pending)} unprocessed messages from {self.journal_path}")
+
+    def pending(self):
+        """取り出されていないメッセージ数"""
+        return len(self._pending)
+
+    def drain(self):
+        """受け取ったメッセージを到着順にすべて取り出す
+
+        Returns:
+            list: [(seq, msg), ...]
+        """
+        with self._lock:
+            items = list(self._pending)
+            self._pending.clear()
+        return items
+
+    def requeue(self, items):
+        """取り出したが処理できなかったメッセージを先頭に戻す"""
+        with self._lock:
+            self._pending.extendleft(reversed(items))
+
+    def done(self, seq):
+        """seqまでのメッセージを処理済みとして記録する"""
+        with self._lock:
+            if seq <= self._done_seq:
+                return
+            self._done_seq = seq
+            if self._done_seq >= self._last_seq and not self._pending:
+                # 処理待ちが無いのでジャーナルを空にする
+                self._journal.truncate(0)
+                self._compacted_size = 0
+            elif os.fstat(self._journal.fileno()).st_size >= max(self.compact_bytes, 2 * self._compacted_size):
+                self._compact()
+            else:
+                self._journal.write(json.dumps({"done": seq}).encode("utf-8") + b"\n")
+                self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+
+    def _compact(self):
+        """処理済みのレコードを除いたジャーナルを作り、renameで置き換える（_lockを持って呼ぶ）"""
+        tmp = f"{self.journal_path}.tmp"
+        with open(self.journal_path, "rb") as src, open(tmp, "wb") as dst:
+            for raw in src:
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    # 書き込みに失敗した末尾（応答していないメッセージ）
+                    break
+                if record.get("seq", 0) > self._done_seq:
+                    dst.write(raw)
+            dst.flush()
+            if self.fsync:
+                os.fsync(dst.fileno())
+        os.replace(tmp, self.journal_path)
+        self._journal.close()
+        self._journal = open(self.journal_path, "ab")
+        self._compacted_size = os.fstat(self._journal.fileno()).st_size
+
+    def _loop(self):
+        while not self._stopped:
+            for fd, conn in list(self._conns.items()):
+                events = selectors.EVENT_READ | (selectors.EVENT_WRITE if conn.wbuf else 0)
+                self._selector.modify(conn.sock, events, conn)
+
+            received = []  # (conn, msg)
+            for key, mask in self._selector.select():
+                if key.data == "accept":
+                    self._accept()
+                elif key.data == "wake":
+                    try:
+                        while os.read(self._wake_r, 4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    conn = key.data
+                    if mask & selectors.EVENT_READ:
+                        received.extend((conn, msg) for msg in self._read(conn))
+                    if mask & selectors.EVENT_WRITE and conn.sock.fileno() in self._conns:
+                        self._write(conn)
+
+            if received:
+                self._commit(received)
+
+    def _commit(self, received):
+        """受け取ったメッセージをまとめてジャーナルに記録してから応答する"""
+        with self._lock:
+            records = []
+            for conn, msg in received:
+                self._last_seq += 1
+                records.append((self._last_seq, conn, msg))
+            data = b"".join(json.dumps({"seq": seq, "msg": msg}, ensure_ascii=False).encode("utf-8") + b"\n"
+                            for seq, _, msg in records)
+            try:
+                self._journal.write(data)
+                self._journal.flush()
+                if self.fsync:
+                    os.fsync(self._journal.fileno())
+            except OSError as e:
+                self._last_seq -= len(records)
+                for _, conn, msg in records:
+                    self._reply(conn, {"ok": False, "error": f"journal write failed: {e}"})
+                return
+            for seq, _, msg in records:
+                self._pending.append((seq, msg))
+
+        for seq, conn, msg in records:
+            self._reply(conn, {"ok": True, "id": msg.get("id")})
+        if self.on_message is not None:
+            self.on_message()
+
+    def _accept(self):
+        try:
+            sock, _ = self._sock.accept()
+        except OSError:
+            return
+        sock.setblocking(False)
+        conn = _Connection(sock)
+        self._conns[sock.fileno()] = conn
+        self._selector.register(sock, selectors.EVENT_READ, conn)
+
+    def _read(self, conn):
+        """届いたデータから完全なフレームを取り出す"""
+        try:
+            data = conn.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return []
+        except OSError:
+            data = b""
+        if not data:
+            self._drop(conn)
+            return []
+        conn.rbuf += data
+
+        messages = []
+        while True:
+            if conn.skip:
+                skipped = min(conn.skip, len(conn.rbuf))
+                del conn.rbuf[:skipped]
+                conn.skip -= skipped
+                if conn.skip:
+                    break
+            if len(conn.rbuf) < FRAME_HEADER.size:
+                break
+            (length,) = FRAME_HEADER.unpack_from(conn.rbuf)
+            if length > MAX_FRAME_SIZE:
+                # 本体を読み捨て、次のフレームの先頭から読み直す
+                self._reply(conn, {"ok": False, "error": f"frame too large: {length} bytes"})
+                del conn.rbuf[:FRAME_HEADER.size]
+                conn.skip = length
+                continue
+            end = FRAME_HEADER.size + length
+            if len(conn.rbuf) < end:
+                break
+            payload = bytes(conn.rbuf[FRAME_HEADER.size:end])
+            del conn.rbuf[:end]
+            try:
+                msg = json.loads(payload)
+            except ValueError as e:
+                self._reply(conn, {"ok": False, "error": f"invalid JSON: {e}"})
+                continue
+            if not isinstance(msg, dict) or "type" not in msg:
+                self._reply(conn, {"ok": False, "error": "message must be a JSON object with a type"})
+                continue
+            messages.append(msg)
+        return messages
+
+    def _reply(self, conn, obj):
+        if conn.sock.fileno() not in self._conns:
+            return
+        conn.wbuf += encode_frame(obj)
+        self._write(conn)
+
+    def _write(self, conn):
+        try:
+            sent = conn.sock.send(conn.wbuf)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._drop(conn)
+            return
+        del conn.wbuf[:sent]
+
+    def _drop(self, conn):
+        self._conns.pop(conn.sock.fileno(), None)
+        try:
+            self._selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        conn.sock.close()
+
+    def close(self):
+        """受け付けを止める（処理待ちのメッセージはジャーナルに残る）"""
+        self._stopped = True
+        try:
+            os.write(self._wake_w, b"\0")
+        except BlockingIOError:
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        for conn in list(self._conns.values()):
+            self._drop(conn)
+        if self._sock is not None:
+            self._selector.unregister(self._sock)
+            self._sock.close()
+            self._sock = None
+            try:
+                os.unlink(self.sock_path)
+            except FileNotFoundError:
+                pass
+        self._selector.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+mailbox_watcher - mailboxへの投函を検知するウォッチャー
+
+役割:
+- InotifyWatcher: inotify(ctypes経由)で mbox/*/in への .json/.msg 投函を即座に検知
+- PollingWatcher: inotifyが使えない環境向けの適応的ポーリング
+- create_watcher(): 利用可能なバックエンドを選択して返す
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+
+# inotifyイベントマスク（<sys/inotify.h>より）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# inbox用: 投函（rename）と直接書き込みの完了を検知
+INBOX_MASK = IN_MOVED_TO | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_ONLYDIR
+# mbox/ と mbox/<name>/ 用: 新しいmailboxディレクトリの作成を検知
+TREE_MASK = IN_CREATE | IN_MOVED_TO | IN_DELETE_SELF | IN_ONLYDIR
+
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+READ_BUFFER_SIZE = 64 * 1024
+
+MESSAGE_SUFFIXES = (".json", ".msg")  # JSONとエンベロープ形式（envelope.py）
+SEQ_NAME = ".seq"  # 投函順序ログ（inbox_index.py）
+
+
+def _is_message_name(name):
+    """投函済みメッセージファイル名かどうか（.tmp-* 等の隠しファイルは除外）"""
+    return name.endswith(MESSAGE_SUFFIXES) and not name.startswith(".")
+
+
+class PollingWatcher:
+    """適応的ポーリングによるウォッチャー
+
+    メッセージが見つかった直後は min_interval で素早く再走査し、
+    空振りが続くと max_interval まで間隔を倍々に伸ばす。
+    """
+
+    backend = "poll"
+
+    def __init__(self, mbox_dir, min_interval=0.01, max_interval=0.5):
+        self.mbox_dir = Path(mbox_dir)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self._wakeup = threading.Event()
+
+    def wake(self):
+        """他スレッドから wait() を即座に復帰させる"""
+        self._wakeup.set()
+
+    def wait(self, timeout=None, active=False):
+        """次の走査まで待機する
+
+        Args:
+            timeout: 最大待機時間（秒）。Noneなら現在のポーリング間隔
+            active: 直前の走査でメッセージを処理したか
+
+        Returns:
+            bool: 常にTrue（ポーリングでは投函の有無を判別できないため）
+        """
+        if active:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+
+        delay = self.interval if timeout is None else min(self.interval, timeout)
+        self._wakeup.wait(delay)
+        self._wakeup.clear()
+        return True
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """inotifyによるイベント駆動ウォッチャー
+
+    mbox/、mbox/<name>/、mbox/<name>/in を監視し、
+    inboxに .json/.msg がrenameされた時点で wait() から復帰する。
+    """
+
+    backend = "inotify"
+
+    def __init__(self, mbox_dir):
+        self.mbox_dir = Path(mbox_dir)
+        self._libc = _load_libc()
+        fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+        self.fd = fd
+        # wake()用のself-pipe
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._watches = {}  # wd -> Path
+        self._watched_paths = set()
+        self.refresh()
+
+    def _add_watch(self, path, mask):
+        if path in self._watched_paths:
+            return
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(path)), mask)
+        if wd < 0:
+            # ディレクトリが消えた等。次回のrefreshで再試行される
+            return
+        self._watches[wd] = path
+        self._watched_paths.add(path)
+
+    def refresh(self):
+        """mailboxツリーを走査し、未監視のディレクトリにwatchを追加"""
+        self.mbox_dir.mkdir(parents=True, exist_ok=True)
+        self._add_watch(self.mbox_dir, TREE_MASK)
+        for mailbox in self.mbox_dir.iterdir():
+            if not mailbox.is_dir():
+                continue
+            self._add_watch(mailbox, TREE_MASK)
+            inbox = mailbox / "in"
+            if inbox.is_dir():
+                self._add_watch(inbox, INBOX_MASK)
+
+    def _read_events(self):
+        """溜まっているイベントを読み出す"""
+        try:
+            buf = os.read(self.fd, READ_BUFFER_SIZE)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buf):
+            wd, mask, _cookie, name_len = EVENT_HEADER.unpack_from(buf, offset)
+            offset += EVENT_HEADER.size
+            name = buf[offset:offset + name_len].rstrip(b"\0").decode("utf-8", "surrogateescape")
+            offset += name_len
+            events.append((wd, mask, name))
+        return events
+
+    def wait(self, timeout=None, active=False):
+        """投函イベントが届くまで待機する
+
+        Args:
+            timeout: 最大待機時間（秒）。Noneなら無期限
+            active: 未使用（PollingWatcherとのインターフェース互換のため）
+
+        Returns:
+            bool: 投函・mailbox追加・wake()を検知した場合True、タイムアウト時False
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            readable, _, _ = select.select([self.fd, self._wake_r], [], [], remaining)
+            if not readable:
+                return False
+            if self._wake_r in readable:
+                self._drain_wakeups()
+                return True
+            if self._handle_events():
+                return True
+            # 一時ファイルの書き込み等、無関係なイベントだけだった場合は待機を続ける
+
+    def wake(self):
+        """他スレッドから wait() を即座に復帰させる"""
+        try:
+            os.write(self._wake_w, b"\0")
+        except BlockingIOError:
+            pass  # すでに起床要求が溜まっている
+
+    def _drain_wakeups(self):
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _handle_events(self):
+        """読み出したイベントを処理し、走査が必要ならTrueを返す"""
+        woke = False
+        needs_refresh = False
+        for wd, mask, name in self._read_events():
+            if mask & IN_Q_OVERFLOW:
+                # キューが溢れた: 取りこぼしがあり得るので全走査させる
+                woke = needs_refresh = True
+                continue
+            if mask & (IN_IGNORED | IN_DELETE_SELF):
+                path = self._watches.pop(wd, None)
+                self._watched_paths.discard(path)
+                continue
+            if mask & IN_ISDIR:
+                # 新しいmailbox（またはそのin/）が作られた
+                woke = needs_refresh = True
+            elif _is_message_name(name) or name == SEQ_NAME:
+                # 投函者はrenameの後で .seq に追記する。renameで起きた走査が追記より先に
+                # .seq を読んでいても、追記の完了（IN_CLOSE_WRITE）でもう一度起きる
+                woke = True
+
+        if needs_refresh:
+            self.refresh()
+        return woke
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            self.fd = None
+
+
+def _load_libc():
+    """inotify関数を持つlibcをロードする"""
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    # inotifyが無いlibc（macOS等）ではAttributeErrorになる
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+def create_watcher(mbox_dir, min_interval=0.01, max_interval=0.5, backend=None):
+    """利用可能なウォッチャーを返す
+
+    Args:
+        mbox_dir: 監視するmboxディレクトリ
+        min_interval: ポーリング時の最短間隔（秒）
+        max_interval: ポーリング時の最長間隔（秒）
+        backend: "inotify" / "poll" / None（自動選択）
+    """
+    if backend != "poll":
+        try:
+            return InotifyWatcher(mbox_dir)
+        except (OSError, AttributeError) as e:
+            if backend == "inotify":
+                raise
+            print(f"inotify unavailable ({e}), falling back to polling")
+    return PollingWatcher(mbox_dir, min_interval, max_interval)
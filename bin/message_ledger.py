@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+message_ledger - 処理済みメッセージIDの台帳（state/ledger.sqlite）
+
+busdは処理に成功したメッセージのIDを記録し、同じIDのメッセージが再び届いた場合
+（削除前にbusdが落ちた投函ファイル、応答後に再送されたソケットのメッセージ、
+再投函されたbatch等）は副作用（spawn・send-keys等）を実行せずに処理済みとして扱う。
+
+- 直近のIDはメモリ上のLRUで判定し、LRUに無ければSQLiteを引く
+- add() したIDは commit() でまとめてSQLiteに書き込む（busdは走査の終わりに呼ぶ）
+- retention 秒より古いIDは commit() の際に定期的に削除する
+"""
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed (
+    id TEXT PRIMARY KEY,
+    ts REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS processed_ts ON processed (ts);
+"""
+
+PRUNE_INTERVAL = 3600.0  # 古いIDを削除する間隔（秒）
+
+
+class MessageLedger:
+    """処理済みメッセージIDの台帳
+
+    スレッドセーフ: ディスパッチャのワーカーから並行して呼ばれる。
+
+    Args:
+        path: SQLiteファイルのパス
+        cache_size: メモリ上に保持するIDの数
+        retention: IDを保持する期間（秒）
+    """
+
+    def __init__(self, path, cache_size=10000, retention=7 * 86400):
+        self.path = Path(path)
+        self.cache_size = cache_size
+        self.retention = retention
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self._cache = OrderedDict()  # id -> None（最近使った順）
+        self._pending = []  # (id, ts) 未書き込み
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+
+    def close(self):
+        self.db.close()
+
+    def seen(self, msg_id):
+        """IDが処理済みか"""
+        with self._lock:
+            if msg_id in self._cache:
+                self._cache.move_to_end(msg_id)
+                return True
+            row = self.db.execute("SELECT 1 FROM processed WHERE id = ?", (msg_id,)).fetchone()
+            if row is None:
+                return False
+            self._remember(msg_id)
+            return True
+
+    def add(self, msg_id):
+        """IDを処理済みとして記録する（SQLiteへの書き込みはcommit()で行う）"""
+        with self._lock:
+            self._remember(msg_id)
+            self._pending.append((msg_id, time.time()))
+
+    def commit(self):
+        """add()したIDをまとめて書き込み、必要なら古いIDを削除する
+
+        Returns:
+            int: 書き込んだID数
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+            try:
+                with self.db:
+                    self.db.executemany("INSERT OR REPLACE INTO processed VALUES (?, ?)", pending)
+                    now = time.time()
+                    if now - self._last_prune >= PRUNE_INTERVAL:
+                        self.db.execute("DELETE FROM processed WHERE ts < ?", (now - self.retention,))
+                        self._last_prune = now
+            except sqlite3.Error:
+                # 次回のcommit()で書き込み直す
+                self._pending = pending + self._pending
+                raise
+        return len(pending)
+
+    def _remember(self, msg_id):
+        self._cache[msg_id] = None
+        self._cache.move_to_end(msg_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
@@ -30,7 +30,7 @@ def validate_message(msg):
             raise ValidationError(f"Missing required field: {field}")
     
     # Check valid message types
-    valid_types = ['spawn', 'send', 'post', 'log', 'result', 'error', 'instruct']
+    valid_types = ['spawn', 'send', 'post', 'log', 'result', 'error', 'instruct', 'batch']
     if msg['type'] not in valid_types:
         raise ValidationError(f"Invalid message type: {msg['type']}")
     
@@ -39,6 +39,16 @@ def validate_message(msg):
         if 'task_id' not in msg:
             raise ValidationError("Spawn messages must include task_id")
     
+    # Special validation for batch messages (each bundled message must be valid)
+    if msg['type'] == 'batch':
+        messages = msg['data'].get('messages') if isinstance(msg['data'], dict) else None
+        if not isinstance(messages, list) or not messages:
+            raise ValidationError("Batch messages must include a non-empty messages list in data")
+        for inner in messages:
+            if not isinstance(inner, dict):
+                raise ValidationError("Batch messages must contain message objects")
+            validate_message(inner)
+    
     # Special validation for result messages
     if msg['type'] == 'result':
         if 'data' not in msg or 'is_error' not in msg['data']:
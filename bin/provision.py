@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+provision - worktreeへのプロジェクトファイルの配置（CLAUDE.md・requirements.yml・.claude等）
+
+ファイルごとに次の順で安いものを使う:
+
+1. 配置先が同じ内容なら何もしない（内容のハッシュはstatの署名ごとにキャッシュし、
+   変わっていないファイルを読み直さない）
+2. link=True（読み取り専用のフレーム）はハードリンク。コピー元には触れず、stage_dirに
+   内容のハッシュ名で置いた書き込み不可の複製にリンクする（複製は内容ごとに1つ）
+   （root権限ではパーミッションで書き込みを防げないため、ハードリンクは使わない）
+3. reflink（FICLONE ioctl）。Btrfs・XFS等ではデータをコピーせずに複製できる
+4. 通常のコピー
+
+配置先は一時ファイルを作ってrenameで置き換えるため、既存のファイル（ハードリンクを含む）に
+書き込むことはない。
+"""
+
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import stat
+import threading
+from pathlib import Path
+
+FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+# reflinkが使えないことを示すエラー（ファイルシステム単位で以降は試さない）
+REFLINK_UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EPERM}
+HASH_CHUNK = 1024 * 1024
+DIGEST_CACHE_SIZE = 10000  # キャッシュするハッシュの数（超えたら捨てて作り直す）
+
+
+def _signature(st):
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class Provisioner:
+    """ファイルをworktreeに配置する
+
+    スレッドセーフ: spawnパイプラインのワーカーから並行して呼ばれる。
+
+    Args:
+        hardlink: link=True のファイルをハードリンクで配置するか
+        stage_dir: ハードリンク元の複製を置くディレクトリ（Noneならハードリンクは使わない）
+    """
+
+    def __init__(self, hardlink=True, stage_dir=None):
+        self.hardlink = hardlink and stage_dir is not None and os.geteuid() != 0
+        self.stage_dir = Path(stage_dir) if stage_dir is not None else None
+        self.metrics = {"unchanged": 0, "linked": 0, "reflinked": 0, "copied": 0}
+        self._digests = {}  # statの署名 -> 内容のsha256
+        self._reflink = {}  # (コピー元のst_dev, 配置先のst_dev) -> reflinkが使えるか
+        self._lock = threading.Lock()
+
+    def provision(self, src, dest, link=False):
+        """src を dest に配置する
+
+        Returns:
+            str: 使った方法（"unchanged" / "linked" / "reflinked" / "copied"）
+        """
+        src, dest = Path(src), Path(dest)
+        src_st = os.stat(src)
+        method = self._place(src, src_st, dest, link)
+        with self._lock:
+            self.metrics[method] += 1
+        return method
+
+    def provision_tree(self, src_dir, dest_dir):
+        """ディレクトリを配置する（配置先にだけあるファイルは残す。shutil.copytreeと同じ）
+
+        Returns:
+            dict: 方法 -> ファイル数
+        """
+        counts = {}
+        src_dir, dest_dir = Path(src_dir), Path(dest_dir)
+        for dirpath, dirnames, filenames in os.walk(src_dir, followlinks=True):
+            rel = Path(dirpath).relative_to(src_dir)
+            (dest_dir / rel).mkdir(parents=True, exist_ok=True)
+            for name in filenames:
+                method = self.provision(Path(dirpath) / name, dest_dir / rel / name)
+                counts[method] = counts.get(method, 0) + 1
+        return counts
+
+    def digest(self, path, st=None):
+        """内容のsha256（statの署名が同じ間は読み直さない）"""
+        st = st or os.stat(path)
+        key = _signature(st)
+        with self._lock:
+            cached = self._digests.get(key)
+        if cached is not None:
+            return cached
+        h = hashlib.sha256()
+        with open(path, "rb") as fp:
+            for chunk in iter(lambda: fp.read(HASH_CHUNK), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            if len(self._digests) >= DIGEST_CACHE_SIZE:
+                self._digests.clear()
+            self._digests[key] = digest
+        return digest
+
+    def _place(self, src, src_st, dest, link):
+        try:
+            dest_st = os.lstat(dest)
+        except FileNotFoundError:
+            dest_st = None
+        if dest_st is not None and os.path.isfile(dest) and not os.path.islink(dest):
+            if (dest_st.st_dev, dest_st.st_ino) == (src_st.st_dev, src_st.st_ino):
+                return "unchanged"
+            if dest_st.st_size == src_st.st_size and self.digest(dest, dest_st) == self.digest(src, src_st):
+                return "unchanged"
+
+        tmp = dest.with_name(f".tmp-{dest.name}-{os.getpid()}-{threading.get_ident()}")
+        try:
+            if link and self.hardlink and self._link(src, src_st, tmp):
+                method = "linked"
+            else:
+                method = "reflinked" if self._clone(src, src_st, tmp) else "copied"
+                shutil.copystat(src, tmp)
+            os.replace(tmp, dest)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return method
+
+    def _link(self, src, src_st, tmp):
+        """書き込み不可の複製へのハードリンクを作る（できなければFalse）"""
+        try:
+            staged = self.stage_dir / self.digest(src, src_st)
+            if not staged.exists():
+                staged = self._stage(src, src_st)
+            os.link(staged, tmp)
+            return True
+        except OSError:
+            return False
+
+    def _stage(self, src, src_st):
+        """srcの書き込み不可の複製をstage_dirに置く（名前は複製した内容のハッシュ）"""
+        self.stage_dir.mkdir(parents=True, exist_ok=True)
+        part = self.stage_dir / f".tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            self._clone(src, src_st, part)
+            os.chmod(part, stat.S_IMODE(src_st.st_mode) & ~0o222)
+            # 複製中にsrcが書き換えられても、名前と内容が食い違わないようにする
+            staged = self.stage_dir / self.digest(part)
+            os.replace(part, staged)
+        except BaseException:
+            part.unlink(missing_ok=True)
+            raise
+        return staged
+
+    def _clone(self, src, src_st, tmp):
+        """reflinkで複製する。使えなければ通常のコピーをしてFalseを返す"""
+        with open(src, "rb") as fsrc, open(tmp, "xb") as fdst:
+            key = (src_st.st_dev, os.fstat(fdst.fileno()).st_dev)
+            if self._reflink.get(key, True):
+                try:
+                    fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                    self._reflink[key] = True
+                    return True
+                except OSError as e:
+                    if e.errno not in REFLINK_UNSUPPORTED:
+                        raise
+                    self._reflink[key] = False
+            shutil.copyfileobj(fsrc, fdst, HASH_CHUNK)
+        return False
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+reaper - 終了したユニットの後始末（worktree・ブランチ・生ログ）
+
+resultが届いたユニットのうち、保持の方針から外れたものを古い順に片付ける:
+
+- keep: 直近に終了したこの数のユニットは残す
+- keep_age: 終了からこの秒数が経つまでは残す
+- keep_failed: 失敗（status: error）したユニットは残す
+- 子ユニットがまだ動いているユニットは残す（children-status.ymlの書き込み先のため）
+
+後始末はワーカースレッド1本で行う:
+
+1. worktreeにコミットされていない変更があれば残す（busdが置いたファイルの変更は除く）
+2. worktreeをゴミ箱ディレクトリにrenameし、`git worktree prune` で管理情報を消してから削除する
+   （リポジトリのロックはrenameとpruneの間だけ取り、ファイルの削除はロックの外で行う）
+3. `git branch -d` でブランチを消す（マージされていないブランチは残る）
+4. 生ログ（logs/raw/<unit>.raw）をgzipで archive_dir に移す
+"""
+
+import gzip
+import os
+import shutil
+import subprocess
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+FINISHED = ("done", "error")
+# busdがworktreeに置くファイル（消しても作業は失われない）
+PROVISIONED = {"CLAUDE.md", "requirements.yml", ".env.local", ".claude",
+               "task-breakdown.yml", "children-status.yml", ".parent_unit"}
+
+
+def select_reapable(tasks, now_ms, keep=20, keep_age=3600.0, keep_failed=True):
+    """保持の方針から外れた終了済みタスクのIDを古い順に返す
+
+    Args:
+        tasks: タスクのレコードのリスト
+        now_ms: 現在時刻（ミリ秒）
+    """
+    finished = [t for t in tasks if t.get("status") in FINISHED and not t.get("reaped_at")]
+    finished.sort(key=lambda t: t.get("completed_at", 0), reverse=True)
+    active_parents = {t.get("env", {}).get("PARENT_UNIT_ID") for t in tasks
+                      if t.get("status") not in FINISHED}
+    reapable = []
+    for t in finished[keep:]:
+        if now_ms - t.get("completed_at", 0) < keep_age * 1000:
+            continue
+        if keep_failed and t.get("status") == "error":
+            continue
+        if t.get("id") in active_parents:
+            continue
+        reapable.append(t["id"])
+    reapable.reverse()
+    return reapable
+
+
+def git(*args, cwd):
+    """gitを実行して標準出力を返す（失敗はCalledProcessError）"""
+    result = subprocess.run(["git", "-C", str(cwd), *args], text=True,
+                            capture_output=True, check=True)
+    return result.stdout
+
+
+class Reaper:
+    """終了したユニットの後始末をバックグラウンドで行う
+
+    Args:
+        repo: TARGET_REPO
+        trash_dir: 削除前にworktreeを移すディレクトリ（worktreeと同じファイルシステム上）
+        raw_dir: 生ログのディレクトリ（logs/raw）
+        archive_dir: 生ログのアーカイブ先
+        lock: リポジトリのref/worktree操作を直列化するロック
+        on_done: (task_id, 結果のdict) を受け取るコールバック（ワーカーから呼ばれる）
+    """
+
+    def __init__(self, repo, trash_dir, raw_dir, archive_dir, lock=None, on_done=None):
+        self.repo = Path(repo)
+        self.trash_dir = Path(trash_dir)
+        self.raw_dir = Path(raw_dir)
+        self.archive_dir = Path(archive_dir)
+        self.lock = lock or threading.Lock()
+        self.on_done = on_done
+        self.metrics = {"reaped": 0, "kept_worktrees": 0, "kept_branches": 0}
+        self._pending = set()  # 後始末を待っているtask_id
+        self._mutex = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reaper")
+
+    def submit(self, task):
+        """タスクの後始末を予約する（予約済みならFalse）"""
+        task_id = task["id"]
+        with self._mutex:
+            if task_id in self._pending:
+                return False
+            self._pending.add(task_id)
+        self._executor.submit(self._run, dict(task))
+        return True
+
+    def pending(self, task_id):
+        with self._mutex:
+            return task_id in self._pending
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, task):
+        try:
+            result = self.reap(task)
+            if self.on_done:
+                self.on_done(task["id"], result)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            with self._mutex:
+                self._pending.discard(task["id"])
+
+    def reap(self, task):
+        """1ユニット分の後始末（呼び出し元のスレッドで実行）
+
+        Returns:
+            dict: worktree・branch・logそれぞれの結果
+        """
+        task_id = task["id"]
+        result = {"worktree": self._remove_worktree(Path(task["worktree_path"]))}
+        if result["worktree"] in ("removed", "missing") and task.get("branch"):
+            result["branch"] = self._delete_branch(task["branch"])
+        result["log"] = self._archive_log(task_id)
+        with self._mutex:
+            self.metrics["reaped"] += 1
+            if result["worktree"] not in ("removed", "missing"):
+                self.metrics["kept_worktrees"] += 1
+            if result.get("branch", "deleted") != "deleted":
+                self.metrics["kept_branches"] += 1
+        print(f"Reaped {task_id}: " + ", ".join(f"{k} {v}" for k, v in result.items()))
+        return result
+
+    def _remove_worktree(self, path):
+        if not path.exists():
+            return "missing"
+        if not (path / ".git").is_file():
+            # gitリポジトリでない場合の作業ディレクトリ等。中身を失うため残す
+            return "kept (not a git worktree)"
+        try:
+            changes = self._local_changes(path)
+        except subprocess.CalledProcessError as e:
+            return f"kept ({e.stderr.strip() or 'git status failed'})"
+        if changes:
+            return f"kept ({len(changes)} uncommitted changes)"
+
+        self.trash_dir.mkdir(parents=True, exist_ok=True)
+        trash = self.trash_dir / f"{path.name}-{time.time_ns()}"
+        with self.lock:
+            os.rename(path, trash)
+            git("worktree", "prune", cwd=self.repo)
+        shutil.rmtree(trash, ignore_errors=True)
+        return "removed"
+
+    def _local_changes(self, path):
+        """コミットされていない変更（busdが置いたファイルを除く）"""
+        changes = []
+        for entry in git("status", "--porcelain", "-z", "--untracked-files=all", cwd=path).split("\0"):
+            if not entry:
+                continue
+            name = entry[3:]
+            if name.split("/", 1)[0] not in PROVISIONED:
+                changes.append(name)
+        return changes
+
+    def _delete_branch(self, branch):
+        with self.lock:
+            try:
+                git("branch", "-d", branch, cwd=self.repo)
+            except subprocess.CalledProcessError as e:
+                if "not found" in e.stderr:
+                    return "missing"
+                return "kept (not merged)"
+        return "deleted"
+
+    def _archive_log(self, task_id):
+        raw = self.raw_dir / f"{task_id}.raw"
+        if not raw.exists():
+            return "missing"
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        dest = self.archive_dir / f"{task_id}.{time.strftime('%Y%m%d%H%M%S')}.raw.gz"
+        tmp = dest.with_name(f".tmp-{dest.name}")
+        with open(raw, "rb") as src, gzip.open(tmp, "wb") as out:
+            shutil.copyfileobj(src, out)
+        os.replace(tmp, dest)
+        raw.unlink()
+        return "archived"
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+repo_info - TARGET_REPOのgitの状態（現在のブランチ・ローカルブランチ一覧）のキャッシュ
+
+spawnのたびに `rev-parse` / `branch --show-current` / `show-ref` 等を別々に起動する代わりに、
+`git for-each-ref` 1回でローカルブランチをまとめて読み、HEADはファイルを直接読む。
+
+キャッシュは次のファイル・ディレクトリの変更（inode・mtime・サイズ）で無効になる:
+- <git-dir>/HEAD（ブランチの切り替え）
+- <common-dir>/packed-refs
+- <common-dir>/refs/heads 以下のディレクトリ（ブランチの作成・更新・削除）
+"""
+
+import os
+import subprocess
+import threading
+from pathlib import Path
+
+HEAD_REF_PREFIX = "ref: refs/heads/"
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class RepoInfo:
+    """1つのリポジトリのgitの状態のキャッシュ
+
+    スレッドセーフ。属性は refresh() の後に読むこと（各メソッドは自動で refresh() する）。
+
+    Args:
+        repo: リポジトリ（作業ツリー）のパス
+    """
+
+    def __init__(self, repo):
+        self.repo = Path(repo)
+        self.git_dir = None  # HEADのあるディレクトリ（worktreeなら .git/worktrees/<name>）
+        self.common_dir = None  # refsのあるディレクトリ
+        self.is_git = False
+        self.head_branch = None  # HEADが指すブランチ（デタッチドならNone。未コミットでも名前はある）
+        self.head = None  # HEADのコミット（コミットが無ければNone）
+        self.branches = {}  # ローカルブランチ名 -> コミット
+        self.git_calls = 0  # 起動したgitの数
+        self._stamps = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """変更があれば読み直す"""
+        with self._lock:
+            stamps = self._current_stamps()
+            if stamps == self._stamps:
+                return self
+            if self.git_dir is None:
+                # 初回、またはgitリポジトリでなかったところに .git が現れた
+                self._resolve()
+                if self.git_dir is not None:
+                    stamps = self._current_stamps()
+            if self.git_dir is not None:
+                self._load()
+            self._stamps = stamps
+        return self
+
+    def current_branch(self):
+        """ブランチを切り出す元のブランチ（HEADがデタッチドなら最初のブランチ、無ければNone）"""
+        self.refresh()
+        if self.head_branch:
+            return self.head_branch
+        return min(self.branches) if self.branches else None
+
+    def has_branch(self, branch):
+        """ローカルブランチがあるか（コミットの無いブランチは含まない）"""
+        self.refresh()
+        return branch in self.branches
+
+    def has_commits(self):
+        """HEADがコミットを指しているか"""
+        self.refresh()
+        return self.head is not None
+
+    def note_branch(self, branch, base):
+        """自分で base から作ったブランチをキャッシュに反映する
+
+        refresh() から作成までの間に他のプロセスがrefを変えた（ブランチを削除した等）
+        場合と区別できないため、その時点のファイルの状態を基準にはせず、次の呼び出しで
+        読み直させる。
+        """
+        with self._lock:
+            self.branches[branch] = self.branches.get(base)
+            self._stamps = None
+
+    def _git(self, *args):
+        self.git_calls += 1
+        return subprocess.run(["git", "-C", str(self.repo), *args], text=True,
+                              capture_output=True, check=True).stdout
+
+    def _resolve(self):
+        """git-dirとcommon-dirを求める"""
+        try:
+            git_dir, common_dir = self._git("rev-parse", "--git-dir", "--git-common-dir").splitlines()
+        except (subprocess.CalledProcessError, ValueError):
+            self.is_git = False
+            return
+        self.git_dir = (self.repo / git_dir).resolve()
+        self.common_dir = (self.repo / common_dir).resolve()
+        self.is_git = True
+
+    def _current_stamps(self):
+        if self.git_dir is None:
+            return ("no-git", _stamp(self.repo / ".git"))
+        stamps = [_stamp(self.git_dir / "HEAD"), _stamp(self.common_dir / "packed-refs")]
+        for dirpath, dirnames, _ in os.walk(self.common_dir / "refs" / "heads"):
+            dirnames.sort()
+            stamps.append((dirpath, _stamp(dirpath)))
+        return tuple(stamps)
+
+    def _load(self):
+        """ローカルブランチとHEADを読み直す"""
+        branches = {}
+        output = self._git("for-each-ref", "--format=%(objectname) %(refname:strip=2)", "refs/heads")
+        for line in output.splitlines():
+            sha, _, name = line.partition(" ")
+            branches[name] = sha
+        try:
+            head = (self.git_dir / "HEAD").read_text().strip()
+        except OSError:
+            head = ""
+        if head.startswith(HEAD_REF_PREFIX):
+            self.head_branch = head[len(HEAD_REF_PREFIX):]
+            self.head = branches.get(self.head_branch)
+        else:
+            self.head_branch = None
+            self.head = head or None
+        self.branches = branches
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+retry_queue - 処理に失敗した投函の再試行スケジュールとデッドレター（mbox/<name>/dead/）
+
+失敗した投函ファイルは RetryQueue が失敗回数を数え、指数的に伸びる間隔
+（base_delay, 2*base_delay, 4*base_delay, ... 最大 max_delay）が経つまで再試行しない。
+再試行の時刻は最小ヒープで管理し、busdは次の時刻までの待ち時間を next_delay() で得る。
+
+max_attempts 回失敗した投函は bury() で mbox/<name>/dead/ に移し、同じ名前に
+".error" を付けたファイルにエラーを書き残す。`busctl dlq list/replay` で確認・再投函できる。
+"""
+
+import heapq
+import json
+import os
+import time
+import traceback
+from pathlib import Path
+
+import envelope
+from inbox_index import append_sequence, is_message_name
+
+DEAD_DIR = "dead"  # mbox/<name>/dead
+ERROR_SUFFIX = ".error"  # デッドレターのエラー情報（<投函ファイル名>.error）
+
+
+class RetryQueue:
+    """投函ごとの失敗回数と次の再試行時刻
+
+    Args:
+        base_delay: 1回目の失敗後の待ち時間（秒）
+        max_delay: 待ち時間の上限（秒）
+        max_attempts: この回数失敗したらデッドレターに移す
+    """
+
+    def __init__(self, base_delay=1.0, max_delay=300.0, max_attempts=5):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self._attempts = {}  # key -> 失敗回数
+        self._due = {}  # key -> 再試行できる時刻（time.monotonic()）
+        self._heap = []  # (時刻, key)。_dueと食い違う要素は取り消された予約
+
+    def ready(self, key, now=None):
+        """再試行を待っていない（処理してよい）か"""
+        due = self._due.get(key)
+        return due is None or due <= (time.monotonic() if now is None else now)
+
+    def failed(self, key, now=None):
+        """失敗を記録して次の再試行を予約する
+
+        Returns:
+            (int, float|None): 失敗回数と再試行までの秒数（上限に達した場合はNone）
+        """
+        attempts = self._attempts.get(key, 0) + 1
+        if attempts >= self.max_attempts:
+            self.forget(key)
+            return attempts, None
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        due = (time.monotonic() if now is None else now) + delay
+        self._attempts[key] = attempts
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, key))
+        return attempts, delay
+
+    def defer(self, key, delay, now=None):
+        """失敗回数に数えずに、delay秒後の再試行を予約する（宛先の準備待ち等）"""
+        due = (time.monotonic() if now is None else now) + delay
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, key))
+
+    def forget(self, key):
+        """成功した（またはデッドレターに移した）投函の記録を消す"""
+        self._attempts.pop(key, None)
+        self._due.pop(key, None)
+
+    def attempts(self, key):
+        return self._attempts.get(key, 0)
+
+    def next_delay(self, now=None):
+        """次の再試行までの秒数（予約が無ければNone）"""
+        heap = self._heap
+        while heap and self._due.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        return max(0.0, heap[0][0] - (time.monotonic() if now is None else now))
+
+    def __len__(self):
+        return len(self._due)
+
+
+def bury(path, error, attempts):
+    """投函ファイルをデッドレター（mbox/<name>/dead/）に移し、エラーを書き残す
+
+    Returns:
+        Path: 移した先のパス
+    """
+    path = Path(path)
+    dead = path.parent.parent / DEAD_DIR
+    dead.mkdir(parents=True, exist_ok=True)
+    info = {
+        "mailbox": path.parent.parent.name,
+        "file": path.name,
+        "attempts": attempts,
+        "failed_at": int(time.time() * 1000),
+        "error": f"{type(error).__name__}: {error}",
+        "traceback": "".join(traceback.format_exception(error)),
+    }
+    tmp = dead / f".tmp-{path.name}{ERROR_SUFFIX}"
+    tmp.write_text(json.dumps(info, ensure_ascii=False, indent=2))
+    os.replace(tmp, dead / f"{path.name}{ERROR_SUFFIX}")
+    os.replace(path, dead / path.name)
+    return dead / path.name
+
+
+def list_dead(mbox):
+    """デッドレターの一覧（メールボックス名・ファイル名順）
+
+    Returns:
+        list: エラー情報のdict（path, mailbox, file, attempts, error等。読めればtypeとid）
+    """
+    entries = []
+    for dead in sorted(Path(mbox).glob(f"*/{DEAD_DIR}")):
+        for path in sorted(dead.iterdir()):
+            if not is_message_name(path.name):
+                continue
+            try:
+                info = json.loads(path.with_name(path.name + ERROR_SUFFIX).read_text())
+            except (OSError, ValueError):
+                info = {}
+            entry = {"mailbox": dead.parent.name, "file": path.name, "attempts": None, "error": None}
+            entry.update(info)
+            entry["path"] = path
+            try:
+                raw = path.read_bytes()
+                msg = envelope.decode(raw) if envelope.is_envelope(raw) else json.loads(raw)
+                entry["type"] = msg.get("type")
+                entry["id"] = msg.get("id")
+            except (ValueError, AttributeError):
+                # 読めないこと自体が失敗の理由である場合
+                entry["type"] = entry["id"] = None
+            entries.append(entry)
+    return entries
+
+
+def replay(path):
+    """デッドレターを元のメールボックスのin/に戻し、エラー情報を消す
+
+    Returns:
+        Path: 戻した先のパス
+    """
+    path = Path(path)
+    inbox = path.parent.parent / "in"
+    inbox.mkdir(parents=True, exist_ok=True)
+    os.replace(path, inbox / path.name)
+    append_sequence(inbox, path.name)
+    path.with_name(path.name + ERROR_SUFFIX).unlink(missing_ok=True)
+    return inbox / path.name
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+spawn_pipeline - spawnをワーカープールで段階的に実行するパイプライン
+
+各spawnは SpawnJob（ユニットごとの状態機械）として管理される:
+
+    queued -> preparing -> launching -> starting -> ready
+                 |             |           |
+                 +-------------+-----------+--> failed
+
+- preparing: worktree作成・ファイル配置（ワーカー上で並列実行）
+- launching: tmuxペインの確保とコマンド送信（レイアウト操作のため直列化）
+- starting:  Claude Codeの起動待ち。初期メッセージは遅延タイマーで送信
+- ready:     初期メッセージ送信済み
+
+メインループは drain() で launching を終えた（または失敗した）ジョブを受け取り、
+タスク状態へ反映する。ready/failedになったジョブは jobs から外す。
+"""
+
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SpawnInProgress(Exception):
+    """宛先のユニットがまだ起動中（初期メッセージを送る前）"""
+
+
+class SpawnJob:
+    """1ユニット分のspawn状態機械"""
+
+    QUEUED = "queued"
+    PREPARING = "preparing"
+    LAUNCHING = "launching"
+    STARTING = "starting"
+    READY = "ready"
+    FAILED = "failed"
+
+    TRANSITIONS = {
+        QUEUED: {PREPARING, FAILED},
+        PREPARING: {LAUNCHING, FAILED},
+        LAUNCHING: {STARTING, FAILED},
+        STARTING: {READY, FAILED},
+        READY: set(),
+        FAILED: set(),
+    }
+
+    def __init__(self, msg):
+        self.msg = msg
+        self.task_id = msg["task_id"]
+        self.state = self.QUEUED
+        self.history = [(self.QUEUED, time.time())]
+        self.context = None  # preparing段階の結果（worktree_path等）
+        self.pane = None
+        self.error = None
+
+    def advance(self, state):
+        """状態を遷移させる（不正な遷移はValueError）"""
+        if state not in self.TRANSITIONS[self.state]:
+            raise ValueError(f"Invalid spawn transition for {self.task_id}: {self.state} -> {state}")
+        self.state = state
+        self.history.append((state, time.time()))
+
+    def fail(self, error):
+        """失敗状態に遷移させる"""
+        self.error = error
+        if self.state != self.FAILED:
+            self.state = self.FAILED
+            self.history.append((self.FAILED, time.time()))
+
+    @property
+    def active(self):
+        """まだ処理中（ready/failed以外）かどうか"""
+        return self.state not in (self.READY, self.FAILED)
+
+
+class SpawnPipeline:
+    """spawnをワーカープールで実行し、メインループをブロックしないパイプライン
+
+    Args:
+        prepare: msg -> context。worktree作成等（並列実行される）
+        launch: context -> pane。tmuxペインの起動（直列実行される）
+        greet: (context, pane) -> None。初期メッセージ送信（startup_delay秒後）
+        workers: ワーカースレッド数
+        startup_delay: launch完了から greet までの待機時間（秒）
+        on_complete: ジョブがlaunch完了/失敗した時に呼ばれる（メインループの起床用）
+    """
+
+    def __init__(self, prepare, launch, greet, workers=4, startup_delay=5.0, on_complete=None):
+        self.prepare = prepare
+        self.launch = launch
+        self.greet = greet
+        self.startup_delay = startup_delay
+        self.on_complete = on_complete
+        self.jobs = {}  # task_id -> 処理中のSpawnJob
+        self._jobs_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="spawn")
+        self._launch_lock = threading.Lock()
+        self._completed = queue.SimpleQueue()
+        self._timers = set()
+        self._timers_lock = threading.Lock()
+
+    def submit(self, msg):
+        """spawnメッセージを投入する。同じtask_idが処理中なら既存ジョブを返す"""
+        task_id = msg["task_id"]
+        with self._jobs_lock:
+            job = self.jobs.get(task_id)
+            if job is not None and job.active:
+                print(f"Spawn for {task_id} already in progress ({job.state})")
+                return job
+            job = SpawnJob(msg)
+            self.jobs[task_id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def active_job(self, task_id):
+        """task_idの処理中（初期メッセージを送る前）のジョブ。無ければNone"""
+        with self._jobs_lock:
+            job = self.jobs.get(task_id)
+        return job if job is not None and job.active else None
+
+    def _forget(self, job):
+        """ready/failedになったジョブをjobsから外す"""
+        with self._jobs_lock:
+            if self.jobs.get(job.task_id) is job:
+                del self.jobs[job.task_id]
+
+    def _run(self, job):
+        try:
+            job.advance(SpawnJob.PREPARING)
+            job.context = self.prepare(job.msg)
+
+            job.advance(SpawnJob.LAUNCHING)
+            with self._launch_lock:
+                job.pane = self.launch(job.context)
+            if not job.pane:
+                raise RuntimeError(f"Failed to create tmux pane for task {job.task_id}")
+
+            job.advance(SpawnJob.STARTING)
+            self._schedule_greeting(job)
+        except Exception as e:
+            print(f"ERROR: spawn of {job.task_id} failed during {job.state}: {e}")
+            traceback.print_exc()
+            job.fail(e)
+            self._forget(job)
+
+        self._completed.put(job)
+        if self.on_complete:
+            self.on_complete()
+
+    def _schedule_greeting(self, job):
+        """Claude Codeの起動を待ってから初期メッセージを送る遅延タイマー"""
+        timer = threading.Timer(self.startup_delay, self._greet, args=(job,))
+        timer.daemon = True
+        with self._timers_lock:
+            self._timers.add(timer)
+        timer.start()
+
+    def _greet(self, job):
+        try:
+            self.greet(job.context, job.pane)
+            job.advance(SpawnJob.READY)
+        except Exception as e:
+            print(f"ERROR sending initial message to {job.task_id}: {e}")
+            job.fail(e)
+        finally:
+            self._forget(job)
+            with self._timers_lock:
+                self._timers = {t for t in self._timers if t.is_alive() and t is not threading.current_thread()}
+
+    def drain(self):
+        """launch完了または失敗したジョブを取り出す（メインスレッドから呼ぶ）"""
+        finished = []
+        while True:
+            try:
+                finished.append(self._completed.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def pending(self):
+        """処理中のジョブ数"""
+        with self._jobs_lock:
+            return sum(1 for job in self.jobs.values() if job.active)
+
+    def shutdown(self, wait=False):
+        """ワーカーとタイマーを停止する"""
+        with self._timers_lock:
+            for timer in self._timers:
+                timer.cancel()
+            self._timers.clear()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
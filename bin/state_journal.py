@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+state_journal - 状態変更の追記専用ジャーナル（write-ahead journal）
+
+tasks/pane_map を変更のたびに丸ごと書き直す代わりに、変更されたエントリだけを
+1行1レコードで追記する。定期的にスナップショット（tasks.json / panes.json）へ
+集約（compaction）し、ジャーナルを空にする。
+
+レコード形式:
+    {"k": "task" | "pane", "id": <key>, "v": <値>}   # v が null なら削除
+
+レコードは変更後の値そのものを持つため、再生は冪等。スナップショット書き込み後、
+ジャーナルを空にする前にクラッシュしても、再生し直せば同じ状態になる。
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+
+
+class StateJournal:
+    """追記専用ジャーナル
+
+    Args:
+        path: ジャーナルファイルのパス
+        fsync: 追記のたびにfsyncするか
+    """
+
+    def __init__(self, path, fsync=False):
+        self.path = Path(path)
+        self.fsync = fsync
+        self.entries = 0  # 最後のreset以降に追記したレコード数
+        self.lock = threading.RLock()
+
+    def append(self, records):
+        """レコードをまとめて1回のwriteで追記する"""
+        if not records:
+            return
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as fp:
+                fp.write(data)
+                if self.fsync:
+                    fp.flush()
+                    os.fsync(fp.fileno())
+            self.entries += len(records)
+
+    def replay(self):
+        """ジャーナルのレコードを順に返す
+
+        書き込み途中でクラッシュした末尾の壊れた行は読み飛ばし、
+        以降の追記が正しく始まるようにファイルを切り詰める。
+        """
+        if not self.path.exists():
+            return []
+
+        records = []
+        good_offset = 0
+        with self.lock:
+            with open(self.path, "rb") as fp:
+                for raw in fp:
+                    if not raw.endswith(b"\n"):
+                        break
+                    try:
+                        records.append(json.loads(raw))
+                    except ValueError:
+                        break
+                    good_offset += len(raw)
+
+            if good_offset != self.path.stat().st_size:
+                print(f"Truncating torn journal tail at offset {good_offset}: {self.path}")
+                os.truncate(self.path, good_offset)
+            self.entries = len(records)
+        return records
+
+    def reset(self):
+        """スナップショットへの集約後にジャーナルを空にする"""
+        with self.lock:
+            with open(self.path, "w", encoding="utf-8") as fp:
+                if self.fsync:
+                    os.fsync(fp.fileno())
+            self.entries = 0
+
+
+def apply_records(records, tasks, pane_map):
+    """ジャーナルのレコードを tasks / pane_map に適用する"""
+    for record in records:
+        kind = record.get("k")
+        key = record.get("id")
+        value = record.get("v")
+        target = tasks if kind == "task" else pane_map if kind == "pane" else None
+        if target is None or key is None:
+            continue
+        if value is None:
+            target.pop(key, None)
+        else:
+            target[key] = value
+
+
+def write_snapshot(path, data, fsync=False):
+    """スナップショットを一時ファイル経由でアトミックに書き込む"""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "w", encoding="utf-8") as fp:
+        fp.write(json.dumps(data, ensure_ascii=False, indent=2))
+        if fsync:
+            fp.flush()
+            os.fsync(fp.fileno())
+    os.replace(tmp, path)
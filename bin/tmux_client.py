@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+tmux_client - tmux制御モード（tmux -C）の常駐接続
+
+tmuxコマンドごとに /bin/sh と tmux クライアントをforkする代わりに、
+1本の制御モード接続の標準入力へコマンドを書き込み、
+%begin/%end（失敗時は%error）で囲まれた応答を読み取る。
+"""
+
+import queue
+import subprocess
+import threading
+
+DEFAULT_TIMEOUT = 10.0  # 応答待ちの最大時間（秒）
+
+# 制御クライアントがウィンドウサイズに影響せず、ペイン出力も受け取らないようにする
+CONTROL_CLIENT_FLAGS = "ignore-size,no-output"
+
+
+class TmuxCommandError(subprocess.CalledProcessError):
+    """tmuxコマンドが%errorを返した
+
+    subprocess経由の呼び出しと同じく stderr にエラーメッセージを持つ。
+    """
+
+    def __init__(self, cmd, message):
+        super().__init__(1, cmd, output="", stderr=message)
+
+    def __str__(self):
+        return f"tmux command failed: {self.cmd}: {self.stderr}"
+
+
+class TmuxConnectionError(Exception):
+    """制御モード接続が利用できない（コマンドは送信されていない）"""
+    pass
+
+
+def quote(arg):
+    """tmuxのコマンド言語向けに引数をクォートする
+
+    ダブルクォート内では \\ " $ をエスケープし、改行や制御文字は
+    tmuxのエスケープ表記（\\n や \\ooo）に変換する。これにより
+    1コマンドが必ず1行に収まる。
+    """
+    out = ['"']
+    for ch in str(arg):
+        if ch in '\\"$':
+            out.append("\\" + ch)
+        elif ch == "\n":
+            out.append("\\n")
+        elif ch == "\r":
+            out.append("\\r")
+        elif ch == "\t":
+            out.append("\\t")
+        elif ord(ch) < 0x20 or ch == "\x7f":
+            out.append("\\%03o" % ord(ch))
+        else:
+            out.append(ch)
+    out.append('"')
+    return "".join(out)
+
+
+def format_command(args):
+    """引数リストを制御モードに送る1コマンド文字列に変換"""
+    return " ".join(quote(a) for a in args)
+
+
+def format_batch(commands):
+    """複数コマンドを1行のコマンドリスト（cmd1 ; cmd2 ; ...）に変換"""
+    return " ; ".join(format_command(c) for c in commands)
+
+
+def _escape_argv(arg):
+    """argv経由の場合、末尾の ; はコマンド区切りと解釈されるためエスケープする"""
+    arg = str(arg)
+    if arg.endswith(";"):
+        return arg[:-1] + "\\;"
+    return arg
+
+
+def batch_argv(commands, tmux_bin="tmux"):
+    """複数コマンドを1回のtmux起動で実行するargvを返す（tmux cmd1 \\; cmd2 ...）"""
+    argv = [tmux_bin]
+    for i, command in enumerate(commands):
+        if i:
+            argv.append(";")
+        argv.extend(_escape_argv(a) for a in command)
+    return argv
+
+
+class TmuxClient:
+    """tmux制御モードの常駐接続
+
+    スレッドセーフ: コマンドの送信と応答の読み取りはロックで直列化される。
+
+    Args:
+        session: 接続するtmuxセッション名
+        timeout: 応答待ちの最大時間（秒）
+    """
+
+    def __init__(self, session, timeout=DEFAULT_TIMEOUT, tmux_bin="tmux"):
+        self.session = session
+        self.timeout = timeout
+        self.tmux_bin = tmux_bin
+        self._proc = None
+        self._lines = queue.Queue()
+        self._lock = threading.Lock()
+        self._reader = None
+
+    @property
+    def alive(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self):
+        """制御モードでセッションにアタッチする"""
+        self._proc = subprocess.Popen(
+            [self.tmux_bin, "-C", "attach-session", "-t", self.session, "-f", CONTROL_CLIENT_FLAGS],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding="utf-8", errors="replace", bufsize=1)
+        self._reader = threading.Thread(target=self._read_loop, name="tmux-control", daemon=True)
+        self._reader.start()
+
+        # attach自体の応答ブロックを読み捨てる
+        with self._lock:
+            self._read_blocks(1, "attach-session")
+        return self
+
+    def _read_loop(self):
+        for line in self._proc.stdout:
+            self._lines.put(line.rstrip("\n"))
+        self._lines.put(None)  # EOF
+
+    def _next_line(self, cmd):
+        try:
+            line = self._lines.get(timeout=self.timeout)
+        except queue.Empty:
+            self.close()
+            raise TmuxCommandError(cmd, f"timed out after {self.timeout}s waiting for tmux")
+        if line is None:
+            self._proc = None
+            raise TmuxCommandError(cmd, "tmux control connection closed")
+        return line
+
+    def _read_blocks(self, count, cmd):
+        """%begin〜%end/%errorの応答ブロックをcount個読む
+
+        コマンドリストの途中でエラーになると以降のコマンドは実行されないため、
+        %errorを受け取った時点でTmuxCommandErrorを送出する。
+
+        Returns:
+            list: 各ブロックの出力（末尾の改行なし）
+        """
+        outputs = []
+        while len(outputs) < count:
+            line = self._next_line(cmd)
+            if not line.startswith("%begin "):
+                # %session-changed等の通知は無視する
+                continue
+            number = line.split(" ")[2]
+            body = []
+            while True:
+                line = self._next_line(cmd)
+                parts = line.split(" ")
+                if parts[0] in ("%end", "%error") and len(parts) >= 3 and parts[2] == number:
+                    break
+                body.append(line)
+            text = "\n".join(body)
+            if parts[0] == "%error":
+                raise TmuxCommandError(cmd, text)
+            outputs.append(text)
+        return outputs
+
+    def _send(self, line):
+        if not self.alive:
+            raise TmuxConnectionError("tmux control connection is not running")
+        try:
+            self._proc.stdin.write(line + "\n")
+            self._proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            self._proc = None
+            raise TmuxConnectionError(f"tmux control connection lost: {e}")
+
+    def run(self, *args):
+        """tmuxコマンドを1つ実行して出力を返す
+
+        Raises:
+            TmuxCommandError: tmuxがエラーを返した
+            TmuxConnectionError: 接続が無い（コマンドは未送信）
+        """
+        return self.run_many([args])[0].strip()
+
+    def run_many(self, commands):
+        """複数のtmuxコマンドを1行のコマンドリストとして送信する
+
+        Returns:
+            list: コマンドごとの出力
+
+        Raises:
+            TmuxCommandError: いずれかのコマンドが失敗した（以降のコマンドは実行されない）
+            TmuxConnectionError: 接続が無い（コマンドは未送信）
+        """
+        line = format_batch(commands)
+        with self._lock:
+            self._send(line)
+            return self._read_blocks(len(commands), line)
+
+    def close(self):
+        """接続を閉じる（セッション自体は残る）"""
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            proc.kill()
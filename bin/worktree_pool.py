@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+worktree_pool - 事前にチェックアウトしておくgit worktreeのプール
+
+大きなTARGET_REPOでは `git worktree add` のチェックアウトに数秒〜数十秒かかる。
+プールはバックグラウンドで size 個のworktreeを（デタッチドHEADで）用意しておき、
+spawnが来たら claim() でそのうち1つに `git switch -c <branch> <base>` して
+`git worktree move` で所定の場所に移すだけにする。ベースが進んでいても switch は
+差分のファイルだけを書き換える。
+
+- 補充はワーカースレッド1本で行い、リポジトリのロック（lock）は `worktree add --no-checkout`
+  の間だけ取る。ファイルの書き出し（reset --hard）はロックの外で行う
+- 前回の起動で残ったプールのworktreeは、変更が無ければそのまま使う
+- metrics にヒット（プールから渡せた）とミス（通常のworktree作成が必要）を数える
+"""
+
+import os
+import shutil
+import subprocess
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+def git(*args, cwd):
+    """gitを実行して標準出力を返す（失敗はCalledProcessError）"""
+    result = subprocess.run(["git", "-C", str(cwd), *args], text=True,
+                            capture_output=True, check=True)
+    return result.stdout.strip()
+
+
+class WorktreePool:
+    """デタッチドHEADでチェックアウト済みのworktreeのプール
+
+    Args:
+        repo: TARGET_REPO
+        pool_dir: プールのworktreeを置くディレクトリ（repoと同じファイルシステム上）
+        size: 用意しておくworktreeの数
+        lock: リポジトリのref/worktree操作を直列化するロック（claim()の呼び出し側が保持する）
+        base: プールのworktreeをチェックアウトするコミット
+        branch_exists: branch -> bool。ローカルブランチの有無（省略時はgitに問い合わせる）
+    """
+
+    def __init__(self, repo, pool_dir, size=2, lock=None, base="HEAD", branch_exists=None):
+        self.repo = Path(repo)
+        self.pool_dir = Path(pool_dir)
+        self.size = size
+        self.lock = lock or threading.Lock()
+        self.base = base
+        self.branch_exists = branch_exists or self._branch_exists
+        self.metrics = {"hits": 0, "misses": 0}
+        self._ready = deque()  # 使えるworktreeのパス
+        self._mutex = threading.Lock()  # _ready・_filling・_future・_closed・_serial・metrics
+        self._filling = False
+        self._future = None  # 実行中または最後の補充
+        self._closed = False
+        self._adopted = False
+        self._serial = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="worktree-pool")
+
+    def start(self):
+        """バックグラウンドで補充を始める"""
+        self.refill()
+        return self
+
+    def refill(self):
+        """足りない分の補充を予約する（補充中なら何もしない）"""
+        with self._mutex:
+            if self._filling or self._closed:
+                return
+            self._filling = True
+            self._future = self._executor.submit(self._fill_in_background)
+
+    def wait(self, timeout=None):
+        """予約済みの補充が終わるまで待つ"""
+        with self._mutex:
+            future = self._future
+        if future is not None:
+            future.result(timeout)
+
+    def ready(self):
+        """すぐに渡せるworktreeの数"""
+        with self._mutex:
+            return len(self._ready)
+
+    def claim(self, dest, branch, base_branch):
+        """プールのworktreeを branch に切り替えて dest に移す
+
+        呼び出し側が lock を保持していること。プールが空の場合や branch が既に
+        存在する場合は何もせずFalseを返す（呼び出し側で通常どおり作成する）。
+
+        Returns:
+            bool: destにworktreeを用意できたか
+        """
+        try:
+            path = self._take(branch)
+            if path is None:
+                return False
+            try:
+                git("switch", "-q", "-c", branch, base_branch, cwd=path)
+                git("worktree", "move", str(path), str(dest), cwd=self.repo)
+            except subprocess.CalledProcessError as e:
+                print(f"Pooled worktree {path} unusable: {e.stderr.strip()}")
+                self._discard(path)
+                if self._branch_exists(branch):
+                    git("branch", "-D", branch, cwd=self.repo)
+                with self._mutex:
+                    self.metrics["misses"] += 1
+                return False
+            with self._mutex:
+                self.metrics["hits"] += 1
+            print(f"Took pooled worktree for {branch}: {dest}")
+            return True
+        finally:
+            self.refill()
+
+    def shutdown(self, wait=False):
+        """補充を止める（用意済みのworktreeは次回の起動で使う）"""
+        with self._mutex:
+            self._closed = True
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def fill(self):
+        """size 個になるまでworktreeを用意する（呼び出し元のスレッドで実行）"""
+        if not self._adopted:
+            self._adopted = True
+            self._adopt()
+        while self.ready() < self.size:
+            self._ready_append(self._create())
+
+    def _fill_in_background(self):
+        try:
+            self.fill()
+        except Exception:
+            # 補充できなくても通常のworktree作成で動く
+            traceback.print_exc()
+        finally:
+            with self._mutex:
+                self._filling = False
+
+    def _take(self, branch):
+        """ブランチが未作成ならプールからworktreeを1つ取り出す（無ければミス）"""
+        exists = self.branch_exists(branch)
+        with self._mutex:
+            if self._ready and not exists:
+                return self._ready.popleft()
+            self.metrics["misses"] += 1
+            return None
+
+    def _ready_append(self, path):
+        with self._mutex:
+            self._ready.append(path)
+
+    def _create(self):
+        """新しいworktreeを作ってチェックアウトする"""
+        with self._mutex:
+            self._serial += 1
+            path = self.pool_dir / f"{os.getpid()}-{self._serial}"
+            while path.exists():  # 前回の起動で残ったものと重ならないように
+                self._serial += 1
+                path = self.pool_dir / f"{os.getpid()}-{self._serial}"
+        self.pool_dir.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            git("worktree", "add", "-q", "--detach", "--no-checkout", str(path), self.base, cwd=self.repo)
+        try:
+            git("reset", "-q", "--hard", cwd=path)
+        except subprocess.CalledProcessError:
+            self._discard_locked(path)
+            raise
+        return path
+
+    def _adopt(self):
+        """前回の起動で残ったworktreeを、変更が無ければプールに入れる"""
+        if not self.pool_dir.is_dir():
+            return
+        for path in sorted(self.pool_dir.iterdir()):
+            try:
+                clean = (path / ".git").is_file() and git("status", "--porcelain", cwd=path) == ""
+            except subprocess.CalledProcessError:
+                clean = False
+            if clean:
+                self._ready_append(path)
+            else:
+                self._discard_locked(path)
+
+    def _discard_locked(self, path):
+        with self.lock:
+            self._discard(path)
+
+    def _discard(self, path):
+        """プールのworktreeを取り除く（lockを保持して呼ぶ）"""
+        try:
+            git("worktree", "remove", "--force", str(path), cwd=self.repo)
+        except subprocess.CalledProcessError:
+            shutil.rmtree(path, ignore_errors=True)
+            git("worktree", "prune", cwd=self.repo)
+
+    def _branch_exists(self, branch):
+        try:
+            git("show-ref", "--verify", "--quiet", f"refs/heads/{branch}", cwd=self.repo)
+            return True
+        except subprocess.CalledProcessError:
+            return False
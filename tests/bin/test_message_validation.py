@@ -120,6 +120,31 @@ class TestMessageValidation(unittest.TestCase):
             validate_message(msg)
         self.assertIn("Spawn messages must include task_id", str(cm.exception))
 
+    def test_batch_message_validates_each_message(self):
+        """Test that batch messages are validated message by message"""
+        log = {
+            "id": "20231101T123456.789Z-abc123",
+            "ts": 1698842096789,
+            "from": "impl:T001",
+            "to": "pmai",
+            "type": "log",
+            "task_id": "T001",
+            "data": {"msg": "Task started"}
+        }
+        msg = dict(log, id="20231101T123456.790Z-def456", type="batch", data={"messages": [log]})
+        self.assertTrue(validate_message(msg))
+
+        # A result without is_error inside the batch
+        msg["data"]["messages"].append(dict(log, type="result", data={"summary": "Done"}))
+        with self.assertRaises(ValidationError) as cm:
+            validate_message(msg)
+        self.assertIn("Result messages must include is_error", str(cm.exception))
+
+        msg["data"] = {"messages": []}
+        with self.assertRaises(ValidationError) as cm:
+            validate_message(msg)
+        self.assertIn("non-empty messages list", str(cm.exception))
+
 
 if __name__ == "__main__":
     unittest.main(verbosity=2)
\ No newline at end of file
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Unit tests for blobstore.py and blob references in busd"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+from blobstore import BlobStore, is_ref, resolve, spill
+
+
+def message(data, msg_type="result", task_id="T001"):
+    return {"id": "m1", "ts": 1, "from": f"unit:{task_id}", "to": "pmai",
+            "type": msg_type, "task_id": task_id, "data": data}
+
+
+class TestBlobStore(unittest.TestCase):
+    """Test cases for the content-addressed blob store"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.store = BlobStore(self.test_dir / "blobs")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_put_is_content_addressed(self):
+        digest = self.store.put(b"payload")
+        self.assertEqual(self.store.put(b"payload"), digest)
+        self.assertEqual(self.store.path(digest), self.test_dir / "blobs" / digest[:2] / digest[2:])
+        self.assertEqual(self.store.get(digest), b"payload")
+        with self.assertRaises(KeyError):
+            self.store.get("0" * 64)
+        with self.assertRaises(KeyError):
+            self.store.get("../../etc/passwd")
+
+    def test_spill_and_resolve(self):
+        data = {"is_error": False, "summary": "ok", "output": "x" * 100, "diff": "ü" * 40}
+        spilled, count = spill(data, self.store, min_size=64)
+        self.assertEqual(count, 2)
+        self.assertEqual(spilled["summary"], "ok")
+        self.assertTrue(is_ref(spilled["output"]))
+        self.assertEqual(spilled["diff"]["size"], 80)  # UTF-8 bytes
+        self.assertEqual(resolve(spilled, self.store), data)
+        self.assertIs(spill({"msg": "small"}, self.store, min_size=64)[0]["msg"], "small")
+
+    def test_spill_keeps_preview_and_structured_values(self):
+        data = {"failures": [{"test": f"test_{i}", "ok": False} for i in range(10)], "log": "a" * 300}
+        spilled, count = spill(data, self.store, min_size=64, preview=10)
+        self.assertEqual(count, 2)
+        self.assertEqual(spilled["log"]["preview"], "a" * 10)
+        self.assertEqual(spilled["failures"]["type"], "json")
+        self.assertEqual(resolve(spilled, self.store), data)
+        # Already spilled values are left alone
+        self.assertEqual(spill(spilled, self.store, min_size=64)[1], 0)
+
+    def test_find_by_prefix(self):
+        digest = self.store.put(b"payload")
+        self.assertEqual(self.store.find(digest[:6].upper()), digest)
+        self.assertEqual(self.store.find(digest), digest)
+        for prefix in (digest[:5], "zzzzzz", "000000"):
+            with self.assertRaises(KeyError):
+                self.store.find(prefix)
+
+
+class TestBusdBlobs(unittest.TestCase):
+    """Test that busd keeps blob references in bus.jsonl and task state"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.patches = [
+            patch('bin.busd.BUS_LOG', self.test_dir / "bus.jsonl"),
+            patch('bin.busd.JOURNAL_FILE', self.test_dir / "journal.jsonl"),
+            patch('bin.busd.BLOBS', self.test_dir / "blobs"),
+            patch('bin.busd.BLOB_MIN_SIZE', 1024),
+            patch('bin.busd.tasks', {"T001": {"id": "T001", "status": "running", "env": {}}}),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_result_state_holds_references(self):
+        output = "x" * 100000
+        bin.busd.handle_post(message({"is_error": False, "summary": "done", "output": output}))
+        bin.busd.handle_post(message({"is_error": False, "summary": "again", "output": output}))
+        bin.busd._get_bus_log().flush()
+        bin.busd.flush_tasks()
+
+        result = bin.busd.tasks["T001"]["result"]
+        self.assertEqual(result["summary"], "again")
+        self.assertEqual(result["output"]["size"], 100000)
+        self.assertEqual(result["output"]["preview"], "x" * 200)
+        self.assertLess((self.test_dir / "journal.jsonl").stat().st_size, 2048)
+        self.assertEqual(len(list((self.test_dir / "blobs").glob("*/*"))), 1)  # Stored once
+
+        fetched = subprocess.run([sys.executable, "bin/busctl.py", "blob", "get", result["output"]["$blob"][:8]],
+                                 env=dict(os.environ, BUSCTL_ROOT=str(self.test_dir)),
+                                 capture_output=True, text=True, check=True)
+        self.assertEqual(fetched.stdout, output)
+
+    def test_parent_is_notified_with_the_full_summary(self):
+        bin.busd.tasks["T001"]["env"] = {"PARENT_UNIT_ID": "T000"}
+        summary = "Fixed the failing tests. " * 200
+        with patch('bin.busd.update_children_status') as update_children_status, \
+                patch('bin.busd.notify_parent_unit') as notify_parent_unit:
+            bin.busd.handle_post(message({"is_error": True, "summary": summary, "message": summary}))
+        bin.busd._get_bus_log().flush()
+
+        self.assertTrue(is_ref(bin.busd.tasks["T001"]["result"]["summary"]))
+        update_children_status.assert_called_once_with("T000", "T001", "error", summary)
+        notify_parent_unit.assert_called_once_with("T000", "T001", "error", summary)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""Unit tests for bus_log.py"""
+
+import gzip
+import json
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+from bus_log import BusLogWriter, load_manifest, parse_fsync_policy, read_bus_log
+
+
+class TestBusLogWriter(unittest.TestCase):
+    """Test cases for BusLogWriter"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.path = self.test_dir / "bus.jsonl"
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_lines_are_buffered_until_flush(self):
+        writer = BusLogWriter(self.path)
+        for i in range(3):
+            writer.append({"id": i})
+        self.assertFalse(self.path.exists())
+
+        self.assertEqual(writer.flush(), 3)
+        self.assertEqual([json.loads(l)["id"] for l in self.path.read_text().splitlines()], [0, 1, 2])
+        self.assertEqual(writer.flush(), 0)
+        writer.close()
+
+    def test_fsync_policies(self):
+        for policy, expected in (("never", 0), ("batch", 3)):
+            writer = BusLogWriter(self.path, fsync=parse_fsync_policy(policy))
+            with patch('bus_log.os.fsync') as fsync:
+                for i in range(3):
+                    writer.append({"id": i})
+                    writer.flush()
+                self.assertEqual(fsync.call_count, expected, policy)
+            writer._close()
+
+    def test_interval_fsync(self):
+        writer = BusLogWriter(self.path, fsync=parse_fsync_policy("60000"))
+        with patch('bus_log.os.fsync') as fsync:
+            for i in range(3):
+                writer.append({"id": i})
+                writer.flush()
+            self.assertEqual(fsync.call_count, 0)
+            writer._last_fsync -= 61
+            writer.append({"id": 3})
+            writer.flush()
+            self.assertEqual(fsync.call_count, 1)
+        writer._close()
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            parse_fsync_policy("sometimes")
+
+    def test_reopen_after_rotation(self):
+        writer = BusLogWriter(self.path)
+        writer.append({"id": "before"})
+        writer.flush()
+        rotated = self.test_dir / "bus.jsonl.1"
+        self.path.rename(rotated)
+
+        writer.request_reopen()
+        writer.append({"id": "after"})
+        writer.close()
+
+        self.assertIn("before", rotated.read_text())
+        self.assertEqual(json.loads(self.path.read_text())["id"], "after")
+
+
+class TestBusLogSegments(unittest.TestCase):
+    """Test cases for segment rotation and reading across segments"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.path = self.test_dir / "bus.jsonl"
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, writer, start, count, task_id):
+        for ts in range(start, start + count):
+            writer.append({"id": f"m{ts}", "ts": ts, "task_id": task_id})
+        writer.flush()
+
+    def test_rotates_by_size_into_compressed_segments(self):
+        writer = BusLogWriter(self.path, max_bytes=200)
+        self._write(writer, 0, 5, "T001")
+        self._write(writer, 5, 5, "T002")
+        self._write(writer, 10, 1, "T003")
+        writer.close()
+
+        segments = load_manifest(self.path)
+        self.assertEqual([s["file"] for s in segments], ["bus.000001.jsonl.gz", "bus.000002.jsonl.gz"])
+        self.assertEqual((segments[0]["first_ts"], segments[0]["last_ts"], segments[0]["count"]), (0, 4, 5))
+        self.assertEqual(segments[1]["task_ids"], ["T002"])
+        self.assertFalse((self.test_dir / "bus.000001.jsonl").exists())
+        self.assertEqual(json.loads(self.path.read_text())["id"], "m10")
+
+        # The reader spans all segments in order
+        self.assertEqual([r["ts"] for r in read_bus_log(self.path)], list(range(11)))
+        self.assertEqual([r["ts"] for r in read_bus_log(self.path, task_id="T002")], list(range(5, 10)))
+
+    def test_rotates_by_age(self):
+        writer = BusLogWriter(self.path, max_age=3600)
+        self._write(writer, 0, 2, "T001")
+        self.assertEqual(load_manifest(self.path), [])
+        writer._stats.opened_at -= 3601
+        self._write(writer, 2, 1, "T001")
+        writer.close()
+        self.assertEqual(load_manifest(self.path)[0]["count"], 3)
+
+    def test_recent_queries_skip_old_segments(self):
+        writer = BusLogWriter(self.path, max_bytes=200)
+        self._write(writer, 0, 5, "T001")
+        self._write(writer, 5, 2, "T001")
+        writer.close()
+
+        opened = []
+        real_open = gzip.open
+        with patch('bus_log.gzip.open', side_effect=lambda *a, **k: opened.append(a[0]) or real_open(*a, **k)):
+            self.assertEqual([r["ts"] for r in read_bus_log(self.path, since=5)], [5, 6])
+        self.assertEqual(opened, [])
+
+    def test_restart_keeps_stats_of_existing_file(self):
+        writer = BusLogWriter(self.path)
+        self._write(writer, 0, 3, "T001")
+        writer.close()
+
+        writer = BusLogWriter(self.path)
+        self._write(writer, 3, 1, "T002")
+        writer.rotate()
+        writer.close()
+        segment = load_manifest(self.path)[0]
+        self.assertEqual((segment["first_ts"], segment["count"], segment["task_ids"]), (0, 4, ["T001", "T002"]))
+
+
+class TestBusdBusLog(unittest.TestCase):
+    """Test that a mailbox sweep writes bus.jsonl in one batch"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.inbox = self.test_dir / "mbox" / "bus" / "in"
+        self.inbox.mkdir(parents=True)
+        self.patches = [
+            patch('bin.busd.MBOX', self.test_dir / "mbox"),
+            patch('bin.busd.BUS_LOG', self.test_dir / "bus.jsonl"),
+            patch('bin.busd.JOURNAL_FILE', self.test_dir / "journal.jsonl"),
+            patch('bin.busd.tasks', {}),
+            patch('bin.busd._in_flight', {}),
+            patch('bin.busd._finished', []),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_sweep_writes_once_and_then_removes_messages(self):
+        for i in range(5):
+            msg = {"id": f"m{i}", "ts": i, "from": "impl:T001", "to": "bus",
+                   "type": "log", "task_id": "T001", "data": {"msg": str(i)}}
+            (self.inbox / f"{i:04d}-m{i}.json").write_text(json.dumps(msg))
+
+        writer = bin.busd._get_bus_log()
+        with patch.object(writer, 'flush', wraps=writer.flush) as flush:
+            self.assertEqual(bin.busd.process_mailbox_once(), 5)
+        self.assertEqual(flush.call_count, 1)
+
+        lines = (self.test_dir / "bus.jsonl").read_text().splitlines()
+        self.assertEqual([json.loads(l)["id"] for l in lines], [f"m{i}" for i in range(5)])
+        self.assertEqual(list(self.inbox.iterdir()), [])
+
+    def test_messages_are_kept_when_the_log_cannot_be_written(self):
+        msg = {"id": "m0", "ts": 0, "from": "impl:T001", "to": "bus",
+               "type": "log", "task_id": "T001", "data": {"msg": "x"}}
+        (self.inbox / "0000-m0.json").write_text(json.dumps(msg))
+
+        writer = bin.busd._get_bus_log()
+        with patch.object(writer, 'flush', side_effect=OSError("disk full")):
+            self.assertEqual(bin.busd.process_mailbox_once(), 0)
+        self.assertEqual(len(list(self.inbox.iterdir())), 1)
+
+        # The next sweep writes the kept result without handling the message again
+        self.assertEqual(bin.busd.process_mailbox_once(), 1)
+        self.assertEqual(len((self.test_dir / "bus.jsonl").read_text().splitlines()), 1)
+        self.assertEqual(list(self.inbox.iterdir()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -127,6 +127,34 @@ class TestBusctl(unittest.TestCase):
         self.assertEqual(msg['data']['env']['CUSTOM_VAR'], 'test_value')
         self.assertEqual(msg['data']['env']['UNIT_ID'], 'root')  # still auto-detected
     
+    def test_spawn_from_breakdown_passes_paths(self):
+        """Test that paths: in task-breakdown.yml reach busd as a sparse checkout hint"""
+        project_dir = Path(self.test_dir) / "test-project-paths"
+        project_dir.mkdir()
+        (project_dir / "requirements.yml").write_text("project: Test Project\n")
+        breakdown = {"tasks": [{"id": "api", "paths": ["services/api", "libs/common"]},
+                               {"id": "web", "paths": "apps/web"},
+                               {"id": "docs"}]}
+        with open(project_dir / "task-breakdown.yml", "w") as f:
+            yaml.dump(breakdown, f)
+        
+        original_cwd = os.getcwd()
+        try:
+            os.chdir(project_dir)
+            cmd = [sys.executable, str(Path(original_cwd) / "bin" / "busctl.py"), "spawn", "--from-breakdown"]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            self.assertEqual(result.returncode, 0)
+        finally:
+            os.chdir(original_cwd)
+        
+        paths = {}
+        for path in (self.mbox_dir / "bus" / "in").glob("*.json"):
+            msg = json.loads(path.read_text())
+            paths[msg['task_id']] = msg['data'].get('paths')
+        self.assertEqual(paths, {"root-api": ["services/api", "libs/common"],
+                                 "root-web": ["apps/web"],
+                                 "root-docs": None})
+    
     def test_send_command(self):
         """Test send command"""
         # Create destination mailbox
@@ -230,6 +258,40 @@ class TestBusctl(unittest.TestCase):
         self.assertNotEqual(result.returncode, 0)
         self.assertIn("is_error", result.stderr)
     
+    def test_batch_command(self):
+        """Test batch command writes one envelope with the messages in order"""
+        specs = "\n".join([
+            json.dumps({"type": "log", "data": {"msg": "step 1"}}),
+            "",
+            json.dumps({"type": "log", "task": "T002", "data": {"msg": "step 2"}}),
+            json.dumps({"type": "result", "data": {"is_error": False, "summary": "Done"}}),
+        ])
+        cmd = [sys.executable, "bin/busctl.py", "batch", "--from", "impl:T001", "--task", "T001"]
+        result = subprocess.run(cmd, input=specs, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        
+        files = list((self.mbox_dir / "pmai" / "in").glob("*.json"))
+        self.assertEqual(len(files), 1)
+        with open(files[0], 'r') as f:
+            msg = json.load(f)
+        
+        self.assertEqual(msg['type'], 'batch')
+        messages = msg['data']['messages']
+        self.assertEqual([m['type'] for m in messages], ['log', 'log', 'result'])
+        self.assertEqual([m['task_id'] for m in messages], ['T001', 'T002', 'T001'])
+        self.assertEqual(messages[1]['data']['msg'], 'step 2')
+        self.assertTrue(all(m['from'] == 'impl:T001' and m['to'] == 'pmai' for m in messages))
+        self.assertEqual(len({m['id'] for m in messages}), 3)
+    
+    def test_batch_command_rejects_invalid_line(self):
+        """Test batch command sends nothing when any line is invalid"""
+        specs = json.dumps({"type": "log", "data": {"msg": "ok"}}) + "\n" + '{"type": "log"\n'
+        cmd = [sys.executable, "bin/busctl.py", "batch", "--from", "impl:T001", "--task", "T001"]
+        result = subprocess.run(cmd, input=specs, capture_output=True, text=True)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("line 2", result.stderr)
+        self.assertEqual(list((self.mbox_dir / "pmai" / "in").glob("*.json")), [])
+    
     def test_missing_required_arguments(self):
         """Test commands fail with missing required arguments"""
         # spawn without requirements.yml
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""Unit tests for busctl --serve and the bin/shim/busctl client"""
+
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+import busctl
+from ingest_server import IngestServer
+
+BIN = Path(__file__).parent.parent.parent / "bin"
+
+
+def post_argv(n, msg_type="log", data=None):
+    return ["post", "--from", "unit:root", "--type", msg_type, "--task", "root",
+            "--data", data or f'{{"msg": "{n}"}}']
+
+
+class TestNetstrings(unittest.TestCase):
+    """Test cases for the FIFO record format"""
+
+    def test_take_netstrings(self):
+        buf = bytearray(b"4:post,0:,3:ab")
+        self.assertEqual(busctl.take_netstrings(buf), [b"post", b""])
+        self.assertEqual(buf, bytearray(b"3:ab"))  # Incomplete, kept for the next read
+        buf += b"c,"
+        self.assertEqual(busctl.take_netstrings(buf), [b"abc"])
+        self.assertEqual(buf, bytearray())
+
+    def test_rejects_garbage(self):
+        for data in (b"x:abc,", b"3:abcd,", b"-1:,"):
+            with self.assertRaises(ValueError):
+                busctl.take_netstrings(bytearray(data))
+
+
+class TestServe(unittest.TestCase):
+    """Test cases for posting through the shim and the helper"""
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.server = IngestServer(self.root / "bus.sock", self.root / "ingest.jsonl", fsync=False).start()
+        self.fifo = self.root / "root.fifo"
+        self.env = dict(os.environ, BUSCTL_ROOT=str(self.root), BUSCTL_FIFO=str(self.fifo))
+        self.helper = subprocess.Popen([sys.executable, str(BIN / "busctl"), "--serve", str(self.fifo)],
+                                       env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        deadline = time.monotonic() + 10
+        while not (self.root / "root.pid").exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def tearDown(self):
+        if self.helper.poll() is None:
+            self.helper.terminate()
+            self.helper.wait()
+        self.helper.stderr.close()
+        self.server.close()
+        shutil.rmtree(self.root)
+
+    def _shim(self, argv):
+        return subprocess.run(["sh", str(BIN / "shim" / "busctl")] + argv, env=self.env,
+                              capture_output=True, text=True)
+
+    def _drain(self, count):
+        received = []
+        deadline = time.monotonic() + 5
+        while len(received) < count and time.monotonic() < deadline:
+            received += [msg for _, msg in self.server.drain()]
+            time.sleep(0.01)
+        return received
+
+    def test_posts_are_forwarded_in_order(self):
+        self._shim(post_argv(1))
+        result = self._shim(post_argv(2, data='{"msg": "quotes \\" commas, colons: % ünïcode"}'))
+        self.assertEqual(result.returncode, 0)
+        self._shim(post_argv(3, "result", data='{"is_error": false}'))
+
+        received = self._drain(3)
+        self.assertEqual([msg["data"] for msg in received],
+                         [{"msg": "1"}, {"msg": 'quotes " commas, colons: % ünïcode'}, {"is_error": False}])
+        self.assertTrue(all(msg["from"] == "unit:root" and msg["to"] == "pmai" for msg in received))
+
+    def test_results_stay_in_order_with_logs(self):
+        self.helper.send_signal(signal.SIGSTOP)  # Logs wait in the FIFO
+        try:
+            for n in range(3):
+                self._shim(post_argv(n))
+            self.assertEqual(self._shim(post_argv(3, "result", data='{"is_error": false}')).returncode, 0)
+            self.assertEqual(self.server.drain(), [])
+        finally:
+            self.helper.send_signal(signal.SIGCONT)
+        self.assertEqual([msg["type"] for msg in self._drain(4)], ["log"] * 3 + ["result"])
+
+    def test_invalid_result_fails_in_the_shim(self):
+        result = self._shim(post_argv(1, "result", data='{"summary": "no is_error"}'))
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("is_error", result.stderr)
+        self._shim(post_argv(2))
+        self.assertEqual([msg["data"] for msg in self._drain(1)], [{"msg": "2"}])
+
+    def test_irregular_command_lines_run_busctl(self):
+        for argv in (post_argv(1, data="not json"), post_argv(2)[:-2]):  # Missing --data
+            result = self._shim(argv)
+            self.assertNotEqual(result.returncode, 0, argv)
+            self.assertTrue(result.stderr, argv)
+
+        result = self._shim(["post", "--from=unit:root"] + post_argv(3)[3:])
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual([msg["data"] for msg in self._drain(1)], [{"msg": "3"}])
+        self.assertFalse((self.root / "root.errors").exists())  # None of these reached the helper
+
+    def test_rejected_post_is_reported_on_the_next_call(self):
+        self.assertEqual(self._shim(post_argv(1, data='{"msg": }')).returncode, 0)  # Looks like an object
+        deadline = time.monotonic() + 5
+        while not (self.root / "root.errors").exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        result = self._shim(post_argv(2))
+        self.assertEqual(result.returncode, 0)
+        self.assertIn("an earlier post was not delivered: Invalid JSON in --data", result.stderr)
+        self.assertEqual([msg["data"] for msg in self._drain(1)], [{"msg": "2"}])
+        self.assertEqual(self._shim(post_argv(3)).stderr, "")
+
+        self.helper.terminate()
+        self.helper.wait()
+        self.assertIn("Invalid JSON", self.helper.stderr.read().decode())
+        self.assertFalse(self.fifo.exists())
+
+    def test_shim_does_not_block_when_nothing_reads_the_fifo(self):
+        self.helper.kill()
+        self.helper.wait()
+        self.assertTrue(self.fifo.exists())  # Left behind by the killed helper
+        with subprocess.Popen(["sleep", "30"]) as stranger:
+            try:
+                # The pid was reused by a process that does not read the FIFO
+                (self.root / "root.pid").write_text(f"{stranger.pid}\n")
+                subprocess.run(["sh", str(BIN / "shim" / "busctl")] + post_argv(1), env=self.env,
+                               capture_output=True, timeout=10)
+            finally:
+                stranger.kill()
+
+    def test_shim_runs_busctl_without_a_helper(self):
+        self.helper.terminate()
+        self.helper.wait()
+        result = self._shim(post_argv(1))
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual([msg["data"] for msg in self._drain(1)], [{"msg": "1"}])
+
+
+class TestBusdHelpers(unittest.TestCase):
+    """Test cases for how busd starts helpers for panes"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.patches = [
+            patch('bin.busd.ROOT', self.test_dir),
+            patch('bin.busd.STATE', self.test_dir / "state"),
+            patch('bin.busd.LOGS', self.test_dir / "logs"),
+            patch('bin.busd.BUSCTL_SERVE_DIR', self.test_dir / "state" / "busctl"),
+            patch('bin.busd.busctl_servers', {}),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for task_id in list(bin.busd.busctl_servers):
+            bin.busd.stop_busctl_server(task_id)
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_no_helper_without_socket(self):
+        with patch('bin.busd.ingest_server', None):
+            self.assertIsNone(bin.busd.start_busctl_server("root"))
+        self.assertEqual(bin.busd.busctl_servers, {})
+
+    def test_bootstrap_uses_shim(self):
+        with patch('bin.busd.ingest_server', object()):
+            fifo = bin.busd.start_busctl_server("root")
+        self.assertEqual(fifo, self.test_dir / "state" / "busctl" / "root.fifo")
+        self.assertIn("root", bin.busd.busctl_servers)
+
+        with patch('bin.busd.CLAUDE_CMD', 'echo "$BUSCTL_FIFO"; command -v busctl'):
+            script = bin.busd.write_bootstrap_script("root", self.test_dir, busctl_fifo=fifo)
+        result = subprocess.run(["sh", "-c", f". '{script}'"], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.splitlines(), [str(fifo), str(BIN.resolve() / "shim" / "busctl")])
+
+
+if __name__ == '__main__':
+    unittest.main()
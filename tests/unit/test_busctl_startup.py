@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Startup benchmark for the busctl entry point
+
+Agents call `busctl post` for every log line and result, so the cost of one
+invocation is mostly interpreter startup and imports. These tests keep that
+cost from creeping back up.
+
+The wall time budget applies to what busctl adds on top of a bare interpreter
+start (`python -c pass`), which is the part busctl controls. Override it with
+BUSCTL_POST_BUDGET_MS on slow machines. Messages go to a live ingest socket,
+as they do while busd is running.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+# Add bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import busctl
+from ingest_server import IngestServer
+
+BUSCTL = Path(__file__).parent.parent.parent / "bin" / "busctl"
+RUNS = 30
+BUDGET_MS = float(os.environ.get("BUSCTL_POST_BUDGET_MS", "30"))
+
+POST_ARGS = ["post", "--from", "unit:root", "--type", "log", "--task", "root",
+             "--data", '{"msg": "benchmark"}']
+
+
+def wall_ms(cmd, env):
+    start = time.perf_counter()
+    subprocess.run(cmd, env=env, check=True, stdout=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+
+def best_wall_ms(baseline_cmd, cmd, env):
+    """Best wall times of baseline_cmd and cmd over RUNS alternating runs, in milliseconds
+
+    The runs alternate so that load from elsewhere on the machine slows both
+    commands alike; the fastest run of each is the least disturbed.
+    """
+    baseline, samples = [], []
+    for _ in range(RUNS):
+        baseline.append(wall_ms(baseline_cmd, env))
+        samples.append(wall_ms(cmd, env))
+    return min(baseline), min(samples)
+
+
+class TestBusctlStartup(unittest.TestCase):
+    """Test cases for busctl post startup cost"""
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.server = IngestServer(self.root / "bus.sock", self.root / "ingest.jsonl", fsync=False).start()
+        self.env = dict(os.environ, BUSCTL_ROOT=str(self.root),
+                        PYTHONPYCACHEPREFIX=str(self.root / "pycache"))
+        # Cache bytecode like an installed busctl would have
+        self.env.pop("PYTHONDONTWRITEBYTECODE", None)
+        subprocess.run([sys.executable, str(BUSCTL)] + POST_ARGS, env=self.env, check=True)
+        self.server.drain()
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.root)
+
+    def test_post_loads_only_what_it_needs(self):
+        """busctl post runs in one interpreter and skips spawn-only imports"""
+        result = subprocess.run([sys.executable, "-X", "importtime", str(BUSCTL)] + POST_ARGS,
+                                env=self.env, capture_output=True, text=True, check=True)
+        modules = {line.rsplit("|", 1)[-1].strip() for line in result.stderr.splitlines()
+                   if line.startswith("import time:")}
+
+        self.assertIn("busctl", modules)  # Imported by the shim, not run as a second process
+        for heavy in ("argparse", "yaml", "subprocess", "tempfile", "random"):
+            self.assertNotIn(heavy, modules)
+        self.assertEqual(len(self.server.drain()), 1)
+
+    def test_post_wall_time(self):
+        """busctl post stays within its startup budget"""
+        baseline, post = best_wall_ms([sys.executable, "-c", "pass"],
+                                      [sys.executable, str(BUSCTL)] + POST_ARGS, self.env)
+        print(f"\nbusctl post: {post:.1f} ms best of {RUNS} "
+              f"({post - baseline:.1f} ms over a bare interpreter at {baseline:.1f} ms)",
+              file=sys.stderr)
+
+        self.assertLess(post - baseline, BUDGET_MS)
+        self.assertEqual(len(self.server.drain()), RUNS)
+
+
+class TestParseFast(unittest.TestCase):
+    """Test cases for the argparse-free command line fast path"""
+
+    def test_matches_argparse(self):
+        for argv in (POST_ARGS, ["send", "--to", "unit:root", "--type", "instruct", "--data", "{}"]):
+            self.assertEqual(vars(busctl.parse_fast(argv)), vars(busctl.create_parser().parse_args(argv)))
+
+    def test_defers_to_argparse(self):
+        for argv in ([], ["spawn"], ["post", "--help"],
+                     POST_ARGS[:-2],  # Missing --data
+                     ["post", "--fr", "unit:root"] + POST_ARGS[3:],  # Abbreviation
+                     POST_ARGS[:-1] + ["-1"],
+                     POST_ARGS[:-2] + ["--task", "root"]):  # Repeated option
+            self.assertIsNone(busctl.parse_fast(argv), argv)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Test that busd unpacks busctl batch envelopes in order"""
+
+import io
+import json
+import shutil
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+from retry_queue import RetryQueue
+
+
+def message(n, msg_type="log", task_id="T001", data=None):
+    return {"id": f"m{n}", "ts": n, "from": f"unit:{task_id}", "to": "pmai",
+            "type": msg_type, "task_id": task_id, "data": data or {"msg": str(n)}}
+
+
+def batch(*messages):
+    return dict(message(0, "batch"), id="b1", data={"messages": list(messages)})
+
+
+class TestBusdBatch(unittest.TestCase):
+    """Test cases for batch envelopes in the mailbox sweep"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.inbox = self.test_dir / "mbox" / "pmai" / "in"
+        self.inbox.mkdir(parents=True)
+        self.patches = [
+            patch('bin.busd.MBOX', self.test_dir / "mbox"),
+            patch('bin.busd.BUS_LOG', self.test_dir / "bus.jsonl"),
+            patch('bin.busd.JOURNAL_FILE', self.test_dir / "journal.jsonl"),
+            patch('bin.busd.tasks', {"T001": {"id": "T001", "status": "running", "env": {}}}),
+            patch('bin.busd._inbox_indexes', {}),
+            patch('bin.busd.retry_queue', RetryQueue(base_delay=0, max_attempts=3)),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for index in bin.busd._inbox_indexes.values():
+            index.close()
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def _logged_ids(self):
+        return [json.loads(l)["id"] for l in (self.test_dir / "bus.jsonl").read_text().splitlines()]
+
+    def test_messages_are_processed_in_order(self):
+        envelope = batch(message(1), message(2),
+                         message(3, "result", data={"is_error": False, "summary": "done"}))
+        (self.inbox / "0001.json").write_text(json.dumps(envelope))
+
+        self.assertEqual(bin.busd.process_mailbox_once(), 1)
+        self.assertEqual(self._logged_ids(), ["m1", "m2", "m3"])
+        self.assertEqual(bin.busd.tasks["T001"]["status"], "done")
+        self.assertEqual(list(self.inbox.glob("*.json")), [])
+
+    def test_failed_message_keeps_the_rest_for_retry(self):
+        (self.inbox / "0001.json").write_text(json.dumps(batch(message(1), message(2), message(3))))
+        real_handle_post = bin.busd.handle_post
+
+        def fail_on_m2(msg):
+            if msg["id"] == "m2":
+                raise RuntimeError("boom")
+            real_handle_post(msg)
+
+        with patch('bin.busd.handle_post', side_effect=fail_on_m2):
+            self.assertEqual(bin.busd.process_mailbox_once(), 0)
+        self.assertEqual(self._logged_ids(), ["m1"])
+
+        # Progress is saved in the same file, which waits for its retry
+        remaining = json.loads((self.inbox / "0001.json").read_text())
+        self.assertEqual(remaining["id"], "b1")
+        self.assertEqual([m["id"] for m in remaining["data"]["messages"]], ["m2", "m3"])
+        self.assertEqual(bin.busd.retry_queue.attempts(self.inbox / "0001.json"), 1)
+        self.assertFalse((self.test_dir / "mbox" / "bus" / "in").exists())
+
+        self.assertEqual(bin.busd.process_mailbox_once(), 1)
+        self.assertEqual(self._logged_ids(), ["m1", "m2", "m3"])
+        self.assertEqual(list(self.inbox.glob("*.json")), [])
+
+    def test_poison_message_moves_batch_to_dead_letters(self):
+        spawn = message(2, "spawn", data={"goal": "x"})
+        del spawn["task_id"]
+        (self.inbox / "0001.json").write_text(json.dumps(batch(message(1), spawn, message(3))))
+
+        err = io.StringIO()
+        with redirect_stdout(io.StringIO()), redirect_stderr(err):
+            for _ in range(5):
+                bin.busd.process_mailbox_once()
+
+        self.assertEqual(err.getvalue().count("Traceback"), 1)
+        self.assertEqual(self._logged_ids(), ["m1"])
+        self.assertEqual(list(self.test_dir.glob("mbox/*/in/*.json")), [])
+        dead = self.test_dir / "mbox" / "pmai" / "dead"
+        self.assertEqual([m["id"] for m in json.loads((dead / "0001.json").read_text())["data"]["messages"]],
+                         ["m2", "m3"])
+        self.assertEqual(json.loads((dead / "0001.json.error").read_text())["attempts"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
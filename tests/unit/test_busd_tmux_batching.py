@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Test that busd batches tmux commands during pane setup"""
+
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+import bin.busd
+
+# subprocess.run is patched module-wide during the tests
+_real_run = subprocess.run
+
+
+class FakeTmux:
+    """Records tmux invocations made through subprocess.run"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, argv, **kwargs):
+        if argv[0] != "tmux":
+            raise AssertionError(f"Unexpected command: {argv}")
+        self.calls.append(argv)
+        if argv[1] == "list-windows":
+            stdout = "MAIN\n"
+        elif argv[1] == "list-panes":
+            stdout = "0\n1\n2\n"
+        elif argv[1] == "split-window":
+            stdout = "3\n"
+        else:
+            stdout = "%7\n"
+        return subprocess.CompletedProcess(argv, 0, stdout=stdout, stderr="")
+
+
+class TestTmuxBatching(unittest.TestCase):
+    """Count tmux invocations per spawn"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.worktree = self.test_dir / "project-root-api"
+        self.worktree.mkdir()
+        self.fake = FakeTmux()
+        self.patches = [
+            patch('bin.busd.tmux_client', None),
+            patch('bin.busd.ROOT', self.test_dir / ".ai-app-studio"),
+            patch('bin.busd.STATE', self.test_dir / "state"),
+            patch('bin.busd.LOGS', self.test_dir / "logs"),
+            patch('bin.busd.PANES_FILE', self.test_dir / "state" / "panes.json"),
+            patch('bin.busd.JOURNAL_FILE', self.test_dir / "state" / "journal.jsonl"),
+            patch('bin.busd.pane_map', {}),
+            patch('bin.busd.child_count', 1),
+            patch('bin.busd.subprocess.run', self.fake),
+        ]
+        for p in self.patches:
+            p.start()
+        (self.test_dir / "state").mkdir()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_pane_setup_is_a_single_tmux_invocation(self):
+        env = {f"VAR{i}": f"value {i}" for i in range(10)}
+        pane = bin.busd._execute_in_pane("cc:MAIN.3", self.worktree, "root-api", "goal", env)
+
+        self.assertEqual(pane, "%7")
+        self.assertEqual(len(self.fake.calls), 1)
+        argv = self.fake.calls[0]
+        self.assertEqual(argv.count(";"), 2)
+        self.assertIn("pipe-pane", argv)
+
+    def test_spawn_child_invocation_count(self):
+        env = {"UNIT_ID": "root-api", "PARENT_UNIT_ID": "root", "EXTRA": "x"}
+        pane = bin.busd.spawn_child("root-api", self.worktree, env=env, send_initial=False)
+
+        self.assertEqual(pane, "%7")
+        # list-windows, list-panes, split-window, and one batched pane setup
+        self.assertEqual([argv[1] for argv in self.fake.calls],
+                         ["list-windows", "list-panes", "split-window", "send-keys"])
+        self.assertEqual(bin.busd.pane_map["root-api"], "%7")
+
+    def test_send_text_is_a_single_tmux_invocation(self):
+        bin.busd.send_text("%7", "echo done;")
+        self.assertEqual(len(self.fake.calls), 1)
+        # A trailing semicolon must not be taken as a command separator
+        self.assertIn("echo done\\;", self.fake.calls[0])
+
+    def test_bootstrap_script_sets_environment(self):
+        env = {"UNIT_ID": "root-api", "QUOTED": 'it\'s "$HOME"', "bad-name": "skip"}
+        with patch('bin.busd.CLAUDE_CMD', 'echo "$TASK_ID|$UNIT_ID|$QUOTED|$BUSCTL_ROOT"'):
+            script = bin.busd.write_bootstrap_script("root-api", self.worktree, env=env)
+
+        result = _real_run(["bash", "-c", f". '{script}' && pwd"],
+                           capture_output=True, text=True, check=True)
+        lines = result.stdout.splitlines()
+        self.assertEqual(lines[0], f'root-api|root-api|it\'s "$HOME"|{self.test_dir / ".ai-app-studio"}')
+        self.assertEqual(lines[1], str(self.worktree))
+        self.assertNotIn("bad-name", script.read_text())
+
+
+if __name__ == '__main__':
+    unittest.main()
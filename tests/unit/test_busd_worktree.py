@@ -173,6 +173,35 @@ class TestBusdWorktree(unittest.TestCase):
         # Check that new branch is based on current branch (develop)
         develop_file = worktree_path / "develop.txt"
         self.assertTrue(develop_file.exists(), "Branch should be created from current branch")
+    
+    def test_ensure_worktree_with_paths_checks_out_only_those_paths(self):
+        """Test that a unit with paths gets a sparse (cone mode) worktree"""
+        for name in ("services/api/app.py", "services/web/app.js", "libs/common/util.py", ".claude/settings.json"):
+            (self.target_repo / name).parent.mkdir(parents=True, exist_ok=True)
+            (self.target_repo / name).write_text(name)
+        subprocess.run(['git', 'add', '.'], cwd=self.target_repo, capture_output=True)
+        subprocess.run(['git', 'commit', '-m', 'Monorepo'], cwd=self.target_repo, capture_output=True)
+        
+        worktree_path = bin.busd.ensure_worktree("T007", "feat/T007", ["./services/api/", "../outside"])
+        
+        self.assertTrue((worktree_path / "services" / "api" / "app.py").exists())
+        self.assertFalse((worktree_path / "services" / "web").exists(), "Paths outside the cone are not checked out")
+        self.assertFalse((worktree_path / "libs").exists())
+        self.assertTrue((worktree_path / "README.md").exists(), "Top-level files are always checked out")
+        self.assertTrue((worktree_path / ".claude" / "settings.json").exists())
+        status = subprocess.run(['git', 'status', '--porcelain'], cwd=worktree_path,
+                                capture_output=True, text=True)
+        self.assertEqual(status.stdout, "")
+        branch = subprocess.run(['git', 'branch', '--show-current'], cwd=worktree_path,
+                                capture_output=True, text=True)
+        self.assertEqual(branch.stdout.strip(), "feat/T007")
+    
+    def test_sparse_cone(self):
+        """Test normalization of the paths hint"""
+        self.assertIsNone(bin.busd.sparse_cone(None))
+        self.assertIsNone(bin.busd.sparse_cone(["/etc", "a/../.."]))
+        self.assertEqual(bin.busd.sparse_cone("src/"), [".claude", "src"])
+        self.assertEqual(bin.busd.sparse_cone(["./b", "a/x", "b"]), [".claude", "a/x", "b"])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""Unit tests for bus_index.py and busq.py"""
+
+import json
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+from bus_index import BusIndex
+from bus_log import BusLogWriter, read_at
+from busq import parse_time, query
+
+
+def event(ts, task_id, msg_type="log"):
+    return {"id": f"m{ts}", "ts": ts, "from": f"unit:{task_id}", "to": "bus",
+            "type": msg_type, "task_id": task_id, "data": {"msg": f"event {ts}"}}
+
+
+class TestBusIndex(unittest.TestCase):
+    """Test cases for the sidecar index"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.path = self.test_dir / "bus.jsonl"
+        self.index = BusIndex(self.path)
+        self.writer = BusLogWriter(self.path, max_bytes=2000, on_flush=self.index.add)
+
+    def tearDown(self):
+        self.writer.close()
+        self.index.close()
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, start, count):
+        for ts in range(start, start + count):
+            task_id = "root-api" if ts % 3 == 0 else "root-web"
+            self.writer.append(event(ts, task_id, "result" if ts % 10 == 0 else "log"))
+            if ts % 4 == 0:
+                self.writer.flush()
+        self.writer.flush()
+
+    def test_writer_updates_index_incrementally(self):
+        self._write(0, 60)
+        self.writer.close()
+        self.assertGreater(self.writer.seq, 2)  # Spans compressed segments and the live file
+
+        locations = self.index.lookup(task_id="root-api")
+        self.assertEqual([r["ts"] for r in read_at(self.path, locations)], list(range(0, 60, 3)))
+        self.assertEqual(self.index.count(msg_type="result"), 6)
+
+        locations = self.index.lookup(since=20, until=24)
+        self.assertEqual([r["ts"] for r in read_at(self.path, locations)], [20, 21, 22, 23, 24])
+
+    def test_sync_catches_up_with_unindexed_records(self):
+        self.writer.on_flush = None
+        self._write(0, 40)
+        self.writer.close()
+        self.assertEqual(self.index.count(), 0)
+
+        self.assertEqual(self.index.sync(), 40)
+        self.assertEqual(self.index.sync(), 0)
+        self.assertEqual([r["ts"] for r in read_at(self.path, self.index.lookup(task_id="root-web", limit=3))],
+                         [1, 2, 4])
+
+    def test_sync_skips_partial_line(self):
+        with open(self.path, "w") as fp:
+            fp.write(json.dumps(event(1, "T001")) + "\n" + '{"ts": 2, "task')
+        self.assertEqual(self.index.sync(), 1)
+        with open(self.path, "a") as fp:
+            fp.write('_id": "T001"}\n')
+        self.assertEqual(self.index.sync(), 1)
+        self.assertEqual(self.index.count(task_id="T001"), 2)
+
+    def test_truncated_live_file_is_reindexed(self):
+        self.path.write_text("".join(json.dumps(event(ts, "T001")) + "\n" for ts in range(5)))
+        self.index.sync()
+        self.path.write_text(json.dumps(event(9, "T002")) + "\n")
+        self.index.sync()
+        self.assertEqual(self.index.count(), 1)
+        self.assertEqual(list(read_at(self.path, self.index.lookup()))[0]["ts"], 9)
+
+    def test_replaced_live_file_is_reindexed(self):
+        self._write(0, 5)
+        self.index.sync()
+        # logrotate moves bus.jsonl away; the new file outgrows the old one before the next sync
+        self.path.rename(self.test_dir / "bus.jsonl.1")
+        self.writer.request_reopen()
+        self._write(100, 8)
+        self.index.sync()
+
+        self.assertEqual([r["ts"] for r in read_at(self.path, self.index.lookup())], list(range(100, 108)))
+        self.assertEqual(self.index.sync(), 0)
+
+
+class TestBusq(unittest.TestCase):
+    """Test cases for busq queries"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.path = self.test_dir / "bus.jsonl"
+        self.path.write_text("".join(json.dumps(event(ts, "T001" if ts % 2 else "T002")) + "\n"
+                                     for ts in range(10)))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_query_newest(self):
+        records = query(self.path, task_id="T001", limit=2, newest=True)
+        self.assertEqual([r["ts"] for r in records], [9, 7])
+
+    def test_parse_time(self):
+        now = datetime(2024, 5, 1, 15, 0, 0).timestamp()
+        self.assertEqual(parse_time("1714550000000", now), 1714550000000)
+        self.assertEqual(parse_time("10m", now), int((now - 600) * 1000))
+        self.assertEqual(parse_time("14:05", now), int(datetime(2024, 5, 1, 14, 5).timestamp() * 1000))
+        self.assertEqual(parse_time("2024-05-01T14:00", now), int(datetime(2024, 5, 1, 14, 0).timestamp() * 1000))
+
+
+class TestBusdIndexing(unittest.TestCase):
+    """Test that busd indexes posts as it writes them"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.inbox = self.test_dir / "mbox" / "bus" / "in"
+        self.inbox.mkdir(parents=True)
+        self.patches = [
+            patch('bin.busd.MBOX', self.test_dir / "mbox"),
+            patch('bin.busd.BUS_LOG', self.test_dir / "bus.jsonl"),
+            patch('bin.busd.JOURNAL_FILE', self.test_dir / "journal.jsonl"),
+            patch('bin.busd.tasks', {}),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_posts_are_indexed(self):
+        for ts in range(3):
+            (self.inbox / f"{ts:04d}.json").write_text(json.dumps(event(ts, "root-api")))
+        bin.busd.process_mailbox_once()
+
+        index = bin.busd._get_bus_index()
+        self.assertEqual(index.count(task_id="root-api"), 3)
+        records = query(self.test_dir / "bus.jsonl", task_id="root-api", sync=False)
+        self.assertEqual([r["id"] for r in records], ["m0", "m1", "m2"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""Unit tests for dispatcher.py and the parallel mailbox sweep in busd"""
+
+import json
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+from dispatcher import ShardedDispatcher
+
+
+class TestShardedDispatcher(unittest.TestCase):
+    """Test cases for ShardedDispatcher"""
+
+    def setUp(self):
+        self.dispatcher = None
+
+    def tearDown(self):
+        if self.dispatcher is not None:
+            self.dispatcher.shutdown(wait=True)
+
+    def _dispatcher(self, handler, workers=4):
+        self.dispatcher = ShardedDispatcher(handler, lambda msg: msg["to"], workers=workers)
+        return self.dispatcher
+
+    def _run(self, dispatcher, messages):
+        for n, msg in enumerate(messages):
+            dispatcher.submit(msg, n)
+        self.assertTrue(dispatcher.join(timeout=10))
+        return [error for _, error in sorted(dispatcher.drain(), key=lambda item: item[0])]
+
+    def test_order_is_kept_per_destination_under_concurrency(self):
+        seen = {}
+        running, peak = [0], [0]
+        lock = threading.Lock()
+
+        def handler(msg):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(random.uniform(0, 0.003))
+            with lock:
+                seen.setdefault(msg["to"], []).append(msg["n"])
+                running[0] -= 1
+
+        destinations = [f"T{i:03d}" for i in range(8)]
+        messages = [{"to": random.choice(destinations), "n": n} for n in range(200)]
+        results = self._run(self._dispatcher(handler), messages)
+
+        self.assertEqual(results, [None] * len(messages))
+        self.assertGreater(peak[0], 1)  # Destinations really ran concurrently
+        for dest in destinations:
+            self.assertEqual(seen.get(dest, []), [m["n"] for m in messages if m["to"] == dest])
+
+    def test_slow_destination_does_not_block_others(self):
+        others_done = threading.Event()
+        finished = []
+
+        def handler(msg):
+            if msg["to"] == "slow":
+                # Only returns once every other message has been handled
+                self.assertTrue(others_done.wait(timeout=5))
+            finished.append(msg["n"])
+            if len(finished) == 6:
+                others_done.set()
+
+        messages = [{"to": "slow", "n": 0}] + [{"to": f"T{n % 3}", "n": n} for n in range(1, 7)]
+        results = self._run(self._dispatcher(handler, workers=2), messages)
+        self.assertEqual(results, [None] * len(messages))
+        self.assertEqual(finished[-1], 0)
+
+    def test_submit_does_not_wait_for_the_message(self):
+        release = threading.Event()
+        dispatcher = self._dispatcher(lambda msg: release.wait(timeout=5), workers=1)
+        dispatcher.submit({"to": "a"}, "first")
+        dispatcher.submit({"to": "a"}, "second")
+        self.assertEqual(dispatcher.pending(), 2)
+        self.assertEqual(dispatcher.drain(), [])
+
+        release.set()
+        self.assertTrue(dispatcher.join(timeout=5))
+        self.assertEqual(dispatcher.drain(), [("first", None), ("second", None)])
+
+    def test_failures_are_returned_per_message(self):
+        def handler(msg):
+            if msg["n"] == 1:
+                raise RuntimeError("boom")
+
+        results = self._run(self._dispatcher(handler), [{"to": "a", "n": n} for n in range(3)])
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[1], RuntimeError)
+        self.assertIsNone(results[2])  # Later messages for the destination still run
+
+
+class TestBusdDispatch(unittest.TestCase):
+    """Test the mailbox sweep with the dispatcher enabled"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.units = [f"T{i:03d}" for i in range(6)]
+        self.patches = [
+            patch('bin.busd.MBOX', self.test_dir / "mbox"),
+            patch('bin.busd.BUS_LOG', self.test_dir / "bus.jsonl"),
+            patch('bin.busd.JOURNAL_FILE', self.test_dir / "journal.jsonl"),
+            patch('bin.busd.pane_map', {unit: f"%{i}" for i, unit in enumerate(self.units)}),
+            patch('bin.busd.tasks', {unit: {"id": unit, "status": "running", "env": {}} for unit in self.units}),
+            patch('bin.busd.dispatcher',
+                  ShardedDispatcher(bin.busd.dispatch_message, bin.busd.dispatch_key, workers=4)),
+            patch('bin.busd._in_flight', {}),
+            patch('bin.busd._received', {}),
+            patch('bin.busd._finished', []),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        bin.busd.dispatcher.shutdown(wait=True)
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_dispatch_key(self):
+        self.assertEqual(bin.busd.dispatch_key({"type": "send", "to": "impl:T001"}), "T001")
+        self.assertEqual(bin.busd.dispatch_key({"type": "instruct", "to": "T002"}), "T002")
+        self.assertEqual(bin.busd.dispatch_key({"type": "result", "from": "unit:T003", "task_id": "T003"}), "T003")
+
+    def test_sends_keep_per_pane_order(self):
+        inboxes = [self.test_dir / "mbox" / name / "in" for name in ("bus", "pmai")]
+        for inbox in inboxes:
+            inbox.mkdir(parents=True)
+        expected = {}
+        for n in range(60):
+            unit = random.choice(self.units)
+            msg = {"id": f"m{n}", "ts": n, "from": "pmai", "to": f"impl:{unit}",
+                   "type": "send", "data": {"text": str(n)}}
+            (inboxes[0] / f"{n:04d}.json").write_text(json.dumps(msg))
+            expected.setdefault(bin.busd.pane_map[unit], []).append(str(n))
+        result = {"id": "r1", "ts": 1, "from": "unit:T000", "to": "pmai", "type": "result",
+                  "task_id": "T000", "data": {"is_error": False, "summary": "done"}}
+        (inboxes[1] / "0001.json").write_text(json.dumps(result))
+
+        sent = {}
+
+        def send_text(pane, text):
+            time.sleep(random.uniform(0, 0.002))
+            sent.setdefault(pane, []).append(text)
+
+        with patch('bin.busd.send_text', side_effect=send_text):
+            processed = bin.busd.process_mailbox_once()
+            self.assertTrue(bin.busd.dispatcher.join(timeout=10))
+            processed += bin.busd.process_mailbox_once()
+        self.assertEqual(processed, 61)
+
+        self.assertEqual(sent, expected)
+        self.assertEqual(bin.busd.tasks["T000"]["status"], "done")
+        self.assertEqual(list((self.test_dir / "mbox").glob("*/in/*.json")), [])
+
+    def test_slow_pane_does_not_hold_back_other_files(self):
+        inbox = self.test_dir / "mbox" / "bus" / "in"
+        inbox.mkdir(parents=True)
+        for n, unit in enumerate(self.units):
+            msg = {"id": f"m{n}", "ts": n, "from": "pmai", "to": f"impl:{unit}",
+                   "type": "send", "data": {"text": str(n)}}
+            (inbox / f"{n:04d}.json").write_text(json.dumps(msg))
+
+        release = threading.Event()
+        sent = []
+
+        def send_text(pane, text):
+            if pane == "%0":
+                self.assertTrue(release.wait(timeout=5))
+            sent.append(text)
+
+        with patch('bin.busd.send_text', side_effect=send_text):
+            processed = bin.busd.process_mailbox_once()
+            deadline = time.monotonic() + 5
+            while bin.busd.dispatcher.pending() > 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            # The sweep commits the other panes while the first one is still busy
+            processed += bin.busd.process_mailbox_once()
+            self.assertEqual(processed, 5)
+            self.assertEqual([f.name for f in inbox.glob("*.json")], ["0000.json"])
+
+            release.set()
+            self.assertTrue(bin.busd.dispatcher.join(timeout=5))
+            self.assertEqual(bin.busd.process_mailbox_once(), 1)
+
+        self.assertEqual(sorted(sent), [str(n) for n in range(6)])  # Sent once each
+        self.assertEqual(list(inbox.glob("*.json")), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
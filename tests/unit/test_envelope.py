@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Unit tests for envelope.py and large payloads in busd"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+import busctl
+import envelope
+from blobstore import BlobStore
+
+
+def message(data, msg_type="result", task_id="T001"):
+    return {"id": "m1", "ts": 1, "from": f"unit:{task_id}", "to": "pmai",
+            "type": msg_type, "task_id": task_id, "data": data}
+
+
+class TestEnvelope(unittest.TestCase):
+    """Test cases for the envelope format"""
+
+    def test_round_trip(self):
+        for data in ({"msg": "short ünïcode"}, {"is_error": False, "output": "line\n" * 5000}):
+            raw = envelope.encode(message(data))
+            self.assertTrue(envelope.is_envelope(raw))
+            self.assertEqual(envelope.decode(raw), message(data))
+
+    def test_large_payload_is_compressed(self):
+        raw = envelope.encode(message({"output": "PASSED test_x\n" * 10000}))
+        header = json.loads(raw.split(b"\n")[1])
+        self.assertEqual(header["payload"]["encoding"], "zlib")
+        self.assertLess(len(raw), 10000)
+        self.assertNotIn("data", header)
+
+    def test_rejects_damaged_envelopes(self):
+        raw = envelope.encode(message({"msg": "x"}))
+        for damaged in (raw[:-1], raw.replace(b"BUSENV1", b"BUSENV9"), b"{}"):
+            with self.assertRaises(ValueError):
+                envelope.decode(damaged)
+
+
+class TestBusctlFormat(unittest.TestCase):
+    """Test cases for how busctl chooses the mailbox file format"""
+
+    def test_large_data_uses_envelope(self):
+        content, suffix = busctl.encode_message(message({"output": "x" * busctl.ENVELOPE_MIN_SIZE}))
+        self.assertEqual(suffix, ".msg")
+        self.assertEqual(envelope.decode(content)["data"]["output"], "x" * busctl.ENVELOPE_MIN_SIZE)
+
+        content, suffix = busctl.encode_message(message({"msg": "small"}))
+        self.assertEqual(suffix, ".json")
+        with patch.dict(os.environ, {"BUSCTL_FORMAT": "envelope"}):
+            self.assertEqual(busctl.encode_message(message({"msg": "small"}))[1], ".msg")
+
+
+class TestBusdLargePayloads(unittest.TestCase):
+    """Test that busd reads envelopes and keeps large fields out of bus.jsonl"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.patches = [
+            patch('bin.busd.MBOX', self.test_dir / "mbox"),
+            patch('bin.busd.BUS_LOG', self.test_dir / "bus.jsonl"),
+            patch('bin.busd.JOURNAL_FILE', self.test_dir / "journal.jsonl"),
+            patch('bin.busd.BLOBS', self.test_dir / "blobs"),
+            patch('bin.busd.BLOB_MIN_SIZE', 1024),
+            patch('bin.busd.tasks', {"T001": {"id": "T001", "status": "running", "env": {}}}),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_envelope_with_large_output(self):
+        output = "".join(f"PASSED test_{i}\n" for i in range(500))
+        with patch.dict(os.environ, {"BUSCTL_FORMAT": "envelope"}):
+            busctl.atomic_write_json(self.test_dir / "mbox" / "pmai" / "in",
+                                     message({"is_error": False, "summary": "done", "output": output}))
+
+        self.assertEqual(bin.busd.process_mailbox_once(), 1)
+        line = (self.test_dir / "bus.jsonl").read_text()
+        self.assertLess(len(line), 512)
+        logged = json.loads(line)["data"]
+        self.assertEqual(logged["summary"], "done")
+        self.assertEqual(BlobStore(self.test_dir / "blobs").get(logged["output"]["$blob"]).decode(), output)
+        self.assertEqual(bin.busd.tasks["T001"]["result"], logged)
+        self.assertEqual(list((self.test_dir / "mbox" / "pmai" / "in").glob("*.msg")), [])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
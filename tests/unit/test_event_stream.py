@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""Unit tests for event_stream.py and busq --follow"""
+
+import json
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+from busq import follow
+from event_stream import EventStreamServer, matches, parse_filters
+
+
+def event(n, task_id, msg_type="log", sender=None):
+    return {"id": f"m{n}", "ts": n, "from": sender or f"unit:{task_id}", "to": "bus",
+            "type": msg_type, "task_id": task_id, "data": {"msg": str(n)}}
+
+
+class Subscriber:
+    """Minimal client that subscribes and collects events"""
+
+    def __init__(self, path, filters):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(str(path))
+        self.sock.sendall((json.dumps(filters) + "\n").encode())
+        self.lines = self.sock.makefile("r")
+        self.ack = json.loads(self.lines.readline())
+
+    def read(self, count):
+        self.sock.settimeout(5)
+        return [json.loads(self.lines.readline()) for _ in range(count)]
+
+    def close(self):
+        self.lines.close()
+        self.sock.close()
+
+
+class TestFilters(unittest.TestCase):
+    """Test cases for subscription filters"""
+
+    def test_matches(self):
+        filters = parse_filters({"task_prefix": "root-api", "type": ["result", "error"]})
+        self.assertTrue(matches(filters, event(1, "root-api-users", "result")))
+        self.assertFalse(matches(filters, event(2, "root-api-users", "log")))
+        self.assertFalse(matches(filters, event(3, "root-web", "result")))
+        self.assertTrue(matches(parse_filters({}), event(4, "x")))
+        self.assertTrue(matches(parse_filters({"from": "unit:root"}), event(5, "root-api", sender="unit:root")))
+
+    def test_invalid_filters(self):
+        for request in ([], {"type": 3}, {"colour": "red"}):
+            with self.assertRaises(ValueError):
+                parse_filters(request)
+
+
+class TestEventStreamServer(unittest.TestCase):
+    """Test cases for the subscription socket"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.path = self.test_dir / "events.sock"
+        self.server = EventStreamServer(self.path).start()
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.test_dir)
+
+    def _wait_for_subscribers(self, count):
+        deadline = time.monotonic() + 5
+        while self.server.subscribers < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_pushes_only_matching_events(self):
+        api = Subscriber(self.path, {"task_prefix": "root-api"})
+        results = Subscriber(self.path, {"type": "result"})
+        self.assertEqual(api.ack, {"subscribed": {"task_prefix": "root-api"}})
+        self._wait_for_subscribers(2)
+
+        self.server.publish([event(1, "root-api", "log"), event(2, "root-web", "result"),
+                             event(3, "root-api-db", "result")])
+
+        self.assertEqual([e["id"] for e in api.read(2)], ["m1", "m3"])
+        self.assertEqual([e["id"] for e in results.read(2)], ["m2", "m3"])
+        api.close()
+        results.close()
+
+    def test_rejects_invalid_subscription(self):
+        sub = Subscriber(self.path, {"type": 3})
+        self.assertIn("error", sub.ack)
+        self.assertEqual(sub.lines.readline(), "")  # Disconnected
+        sub.close()
+
+    def test_slow_client_is_dropped(self):
+        self.server.max_buffer = 4096
+        slow = Subscriber(self.path, {})
+        self._wait_for_subscribers(1)
+        # Never read: the kernel socket buffer fills up, then the server buffer
+        for n in range(2000):
+            self.server.publish([event(n, "root", "log")])
+        self.assertGreaterEqual(self.server.dropped, 1)
+        slow.close()
+
+    def test_busq_follow(self):
+        received = []
+
+        def consume():
+            for record in follow(self.path, {"task_id": "root"}):
+                received.append(record)
+                break
+
+        thread = threading.Thread(target=consume)
+        thread.start()
+        self._wait_for_subscribers(1)
+        self.server.publish([event(1, "root-api"), event(2, "root")])
+        thread.join(timeout=5)
+        self.assertEqual([e["id"] for e in received], ["m2"])
+
+
+class TestBusdPublishing(unittest.TestCase):
+    """Test that busd publishes posts after writing them"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.inbox = self.test_dir / "mbox" / "bus" / "in"
+        self.inbox.mkdir(parents=True)
+        self.server = EventStreamServer(self.test_dir / "events.sock").start()
+        self.patches = [
+            patch('bin.busd.MBOX', self.test_dir / "mbox"),
+            patch('bin.busd.BUS_LOG', self.test_dir / "bus.jsonl"),
+            patch('bin.busd.JOURNAL_FILE', self.test_dir / "journal.jsonl"),
+            patch('bin.busd.tasks', {}),
+            patch('bin.busd.event_server', self.server),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        self.server.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_processed_posts_are_streamed(self):
+        sub = Subscriber(self.test_dir / "events.sock", {"type": "result"})
+        deadline = time.monotonic() + 5
+        while self.server.subscribers < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        (self.inbox / "0001.json").write_text(json.dumps(event(1, "root-api", "log")))
+        (self.inbox / "0002.json").write_text(json.dumps(event(2, "root-api", "result")))
+        bin.busd.process_mailbox_once()
+
+        self.assertEqual(sub.read(1)[0]["id"], "m2")
+        sub.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Unit tests for inbox_index.py and .seq based discovery in busd"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+import busctl
+from inbox_index import InboxIndex, append_sequence
+
+
+class TestInboxIndex(unittest.TestCase):
+    """Test cases for InboxIndex"""
+
+    def setUp(self):
+        self.inbox = Path(tempfile.mkdtemp())
+        self.index = InboxIndex(self.inbox, rescan_interval=3600)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.inbox)
+
+    def deliver(self, name, sequence=True):
+        (self.inbox / name).write_text("{}")
+        if sequence:
+            append_sequence(self.inbox, name)
+
+    def names(self):
+        return [p.name for p in self.index.discover()]
+
+    def test_reads_new_entries_without_scanning(self):
+        self.deliver("0001.json")
+        self.assertEqual(self.names(), ["0001.json"])
+        self.assertEqual(self.index.scans, 1)  # First sight of the inbox
+
+        self.deliver("0003.json")
+        self.deliver("0002.msg")
+        self.deliver("0004.json", sequence=False)
+        (self.inbox / ".tmp-0005.json").write_text("{}")
+        self.assertEqual(self.names(), ["0001.json", "0003.json", "0002.msg"])  # Arrival order
+        self.assertEqual(self.index.scans, 1)
+
+        for name in ("0001.json", "0003.json"):
+            (self.inbox / name).unlink()
+        self.index.forget([self.inbox / "0001.json", self.inbox / "0003.json"])
+        self.assertEqual(self.names(), ["0002.msg"])
+
+        # The periodic rescan picks up files that never made it into .seq
+        self.index.rescan_interval = 0
+        self.assertEqual(self.names(), ["0002.msg", "0004.json"])
+        self.assertEqual(self.index.scans, 2)
+
+    def test_incomplete_line_is_read_later(self):
+        self.deliver("0001.json")
+        self.names()
+        (self.inbox / "0002.json").write_text("{}")
+        with open(self.inbox / ".seq", "ab") as fp:
+            fp.write(b"0002.js")
+        self.assertEqual(self.names(), ["0001.json"])
+        with open(self.inbox / ".seq", "ab") as fp:
+            fp.write(b"on\n")
+        self.assertEqual(self.names(), ["0001.json", "0002.json"])
+        self.assertEqual(self.index.scans, 1)
+
+    def test_rescans_after_gaps(self):
+        self.deliver("0001.json")
+        self.names()
+        self.deliver("0002.json", sequence=False)
+
+        # A recreated .seq, or a line busd cannot use, triggers a full scan
+        (self.inbox / ".seq").unlink()
+        append_sequence(self.inbox, "0003.json")
+        (self.inbox / "0003.json").write_text("{}")
+        self.assertEqual(self.names(), ["0001.json", "0002.json", "0003.json"])
+        self.assertEqual(self.index.scans, 2)
+
+        self.deliver("0004.json", sequence=False)
+        append_sequence(self.inbox, "../escape")
+        self.names()
+        self.assertEqual(self.names(), ["0001.json", "0002.json", "0003.json", "0004.json"])
+        self.assertEqual(self.index.scans, 3)
+
+    def test_inbox_without_seq_is_scanned_every_time(self):
+        self.deliver("0001.json", sequence=False)
+        self.assertEqual(self.names(), ["0001.json"])
+        self.deliver("0002.json", sequence=False)
+        self.assertEqual(self.names(), ["0001.json", "0002.json"])
+        self.assertEqual(self.index.scans, 2)
+
+    def test_rotates_a_consumed_seq(self):
+        self.deliver("0001.json")
+        self.names()
+        with patch('inbox_index.ROTATE_BYTES', 10):
+            self.deliver("0002.json")
+            self.names()
+            inode = os.stat(self.inbox / ".seq").st_ino
+            self.assertEqual(self.names(), ["0001.json", "0002.json"])
+        self.assertEqual(os.stat(self.inbox / ".seq").st_size, 0)
+        self.assertNotEqual(os.stat(self.inbox / ".seq").st_ino, inode)
+
+        self.deliver("0003.json")
+        self.assertEqual(self.names(), ["0001.json", "0002.json", "0003.json"])
+
+    def test_rotation_hands_over_late_appends(self):
+        self.deliver("0001.json")
+        self.names()
+        # A producer opens .seq just before busd replaces it and appends afterwards
+        late = os.open(self.inbox / ".seq", os.O_WRONLY | os.O_APPEND)
+        with patch('inbox_index.ROTATE_BYTES', 10):
+            self.assertEqual(self.names(), ["0001.json"])
+        (self.inbox / "0002.json").write_text("{}")
+        os.write(late, b"0002.json\n")
+        os.close(late)
+
+        self.assertEqual(self.names(), ["0001.json", "0002.json"])
+        self.assertEqual(self.index.scans, 1)  # Rotating does not rescan the inbox
+
+
+class TestBusdSequenceDiscovery(unittest.TestCase):
+    """Test that the busd sweep follows .seq instead of listing inboxes"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.inbox = self.test_dir / "mbox" / "pmai" / "in"
+        self.patches = [
+            patch('bin.busd.MBOX', self.test_dir / "mbox"),
+            patch('bin.busd.BUS_LOG', self.test_dir / "bus.jsonl"),
+            patch('bin.busd.JOURNAL_FILE', self.test_dir / "journal.jsonl"),
+            patch('bin.busd.tasks', {}),
+            patch('bin.busd._inbox_indexes', {}),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for index in bin.busd._inbox_indexes.values():
+            index.close()
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def post(self, n):
+        busctl.atomic_write_json(self.inbox, {"id": f"m{n}", "ts": n, "from": "unit:T001", "to": "pmai",
+                                              "type": "log", "task_id": "T001", "data": {"msg": str(n)}})
+
+    def test_sweeps_scan_only_at_startup(self):
+        self.post(1)
+        self.assertEqual(bin.busd.process_mailbox_once(), 1)
+        for n in range(2, 6):
+            self.post(n)
+        self.assertEqual(bin.busd.process_mailbox_once(), 4)
+        self.assertEqual(bin.busd.process_mailbox_once(), 0)
+
+        self.assertEqual(bin.busd._inbox_indexes[self.inbox].scans, 1)
+        logged = [json.loads(l)["id"] for l in (self.test_dir / "bus.jsonl").read_text().splitlines()]
+        self.assertEqual(logged, ["m1", "m2", "m3", "m4", "m5"])
+        self.assertEqual(list(self.inbox.glob("*.json")), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""Unit tests for ingest_server.py and the busctl socket transport"""
+
+import json
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+import busctl
+from dispatcher import ShardedDispatcher
+from ingest_server import IngestServer, encode_frame, read_frame
+
+
+def message(n, msg_type="log", task_id="T001"):
+    return {"id": f"m{n}", "ts": n, "from": f"unit:{task_id}", "to": "pmai",
+            "type": msg_type, "task_id": task_id, "data": {"msg": str(n)}}
+
+
+class TestIngestServer(unittest.TestCase):
+    """Test cases for IngestServer"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.sock_path = self.test_dir / "bus.sock"
+        self.journal = self.test_dir / "ingest.jsonl"
+        self.server = self._start()
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.test_dir)
+
+    def _start(self):
+        return IngestServer(self.sock_path, self.journal, fsync=False).start()
+
+    def _send(self, *frames):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(5)
+            sock.connect(str(self.sock_path))
+            sock.sendall(b"".join(frames))
+            return [read_frame(sock) for _ in frames]
+
+    def test_acknowledges_after_journaling(self):
+        replies = self._send(encode_frame(message(1)), encode_frame(message(2)))
+        self.assertEqual(replies, [{"ok": True, "id": "m1"}, {"ok": True, "id": "m2"}])
+
+        journaled = [json.loads(l)["msg"]["id"] for l in self.journal.read_text().splitlines()]
+        self.assertEqual(journaled, ["m1", "m2"])
+        self.assertEqual([msg["id"] for _, msg in self.server.drain()], ["m1", "m2"])
+
+    def test_done_truncates_journal(self):
+        self._send(encode_frame(message(1)))
+        items = self.server.drain()
+        self.server.done(items[-1][0])
+        self.assertEqual(self.journal.read_text(), "")
+
+    def test_journal_is_compacted_under_steady_traffic(self):
+        self.server.close()
+        self.server = IngestServer(self.sock_path, self.journal, fsync=False, compact_bytes=2048).start()
+        for n in range(1, 101):
+            # The newest message is always still waiting, so the journal is never emptied
+            self._send(encode_frame(message(n)))
+            items = self.server.drain()
+            if len(items) > 1:
+                self.server.done(items[0][0])
+            self.server.requeue(items[-1:])
+            self.assertLess(self.journal.stat().st_size, 4096)
+
+        self.server.close()
+        self.server = self._start()
+        self.assertEqual([msg["id"] for _, msg in self.server.drain()], ["m100"])
+
+    def test_unprocessed_messages_survive_restart(self):
+        self._send(encode_frame(message(1)), encode_frame(message(2)), encode_frame(message(3)))
+        items = self.server.drain()
+        self.server.requeue(items[1:])
+        self.server.done(items[0][0])
+        self.server.close()
+        with open(self.journal, "a") as fp:
+            fp.write('{"seq": 4, "msg": {"id"')  # Torn, never acknowledged
+
+        self.server = self._start()
+        self.assertEqual([msg["id"] for _, msg in self.server.drain()], ["m2", "m3"])
+        # New messages continue the sequence
+        self._send(encode_frame(message(5)))
+        self.assertEqual(self.server.drain()[0][0], 4)
+
+    def test_rejects_invalid_frames(self):
+        bad = b"not json"
+        replies = self._send(len(bad).to_bytes(4, "big") + bad, encode_frame([1, 2]))
+        self.assertFalse(replies[0]["ok"])
+        self.assertFalse(replies[1]["ok"])
+        self.assertEqual(self.server.drain(), [])
+
+    def test_skips_oversized_frame(self):
+        oversized = encode_frame(message(1, task_id="T" * 200))
+        with patch('ingest_server.MAX_FRAME_SIZE', 200):
+            replies = self._send(oversized, encode_frame(message(2)))
+        self.assertEqual(replies[0], {"ok": False, "error": f"frame too large: {len(oversized) - 4} bytes"})
+        self.assertEqual(replies[1], {"ok": True, "id": "m2"})
+        self.assertEqual([msg["id"] for _, msg in self.server.drain()], ["m2"])
+
+
+class TestBusctlTransport(unittest.TestCase):
+    """Test cases for busctl's socket-first delivery"""
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_delivers_over_socket(self):
+        server = IngestServer(self.root / "bus.sock", self.root / "ingest.jsonl", fsync=False).start()
+        try:
+            self.assertIsNone(busctl.deliver(self.root, "pmai", message(1)))
+            self.assertEqual(server.drain()[0][1]["id"], "m1")
+        finally:
+            server.close()
+        self.assertFalse((self.root / "mbox").exists())
+
+    def test_falls_back_to_mailbox(self):
+        # Stale socket left behind by a busd that is no longer running
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(str(self.root / "bus.sock"))
+        stale.close()
+
+        with patch('sys.stderr'):
+            path = busctl.deliver(self.root, "pmai", message(1))
+        self.assertEqual(path.parent, self.root / "mbox" / "pmai" / "in")
+        self.assertEqual(json.loads(path.read_text())["id"], "m1")
+
+    def test_file_transport_forced(self):
+        server = IngestServer(self.root / "bus.sock", self.root / "ingest.jsonl", fsync=False).start()
+        try:
+            with patch.dict('os.environ', {"BUSCTL_TRANSPORT": "file"}):
+                self.assertIsNotNone(busctl.deliver(self.root, "pmai", message(1)))
+            self.assertEqual(server.drain(), [])
+        finally:
+            server.close()
+
+
+class TestBusdIngest(unittest.TestCase):
+    """Test that busd processes socket messages in its mailbox sweep"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        (self.test_dir / "mbox").mkdir()
+        self.server = IngestServer(self.test_dir / "bus.sock", self.test_dir / "ingest.jsonl",
+                                   fsync=False).start()
+        self.patches = [
+            patch('bin.busd.MBOX', self.test_dir / "mbox"),
+            patch('bin.busd.BUS_LOG', self.test_dir / "bus.jsonl"),
+            patch('bin.busd.JOURNAL_FILE', self.test_dir / "journal.jsonl"),
+            patch('bin.busd.tasks', {"T001": {"id": "T001", "status": "running", "env": {}}}),
+            patch('bin.busd.ingest_server', self.server),
+            patch('bin.busd._received', {}),
+            patch('bin.busd._finished', []),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        self.server.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_socket_messages_are_processed_then_released(self):
+        busctl.deliver(self.test_dir, "pmai", message(1))
+        result = message(2, "result")
+        result["data"] = {"is_error": False, "summary": "done"}
+        busctl.deliver(self.test_dir, "pmai", result)
+
+        self.assertEqual(bin.busd.process_mailbox_once(), 2)
+        lines = (self.test_dir / "bus.jsonl").read_text().splitlines()
+        self.assertEqual([json.loads(l)["id"] for l in lines], ["m1", "m2"])
+        self.assertEqual(bin.busd.tasks["T001"]["status"], "done")
+        self.assertEqual((self.test_dir / "ingest.jsonl").read_text(), "")
+
+    def test_failed_message_is_moved_to_mailbox(self):
+        busctl.deliver(self.test_dir, "pmai", message(1))
+        with patch('bin.busd.handle_post', side_effect=RuntimeError("boom")):
+            bin.busd.process_mailbox_once()
+
+        requeued = list((self.test_dir / "mbox" / "bus" / "in").glob("*.json"))
+        self.assertEqual(len(requeued), 1)
+        self.assertEqual(json.loads(requeued[0].read_text())["id"], "m1")
+        self.assertEqual(self.server.pending(), 0)
+
+    def test_release_waits_for_earlier_messages(self):
+        release = threading.Event()
+        handle_post = bin.busd.handle_post
+
+        def slow_post(msg):
+            if msg["task_id"] == "T001":
+                self.assertTrue(release.wait(timeout=5))
+            handle_post(msg)
+
+        dispatcher = ShardedDispatcher(bin.busd.dispatch_message, bin.busd.dispatch_key, workers=2)
+        self.addCleanup(dispatcher.shutdown, wait=True)
+        busctl.deliver(self.test_dir, "pmai", message(1))
+        busctl.deliver(self.test_dir, "pmai", message(2, task_id="T002"))
+        with patch('bin.busd.dispatcher', dispatcher), patch('bin.busd.handle_post', side_effect=slow_post):
+            processed = bin.busd.process_mailbox_once()
+            deadline = time.monotonic() + 5
+            while dispatcher.pending() > 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            processed += bin.busd.process_mailbox_once()
+            # m2 is done, but m1 is still running and keeps both in the journal
+            self.assertEqual(processed, 1)
+            self.assertNotEqual((self.test_dir / "ingest.jsonl").read_text(), "")
+
+            release.set()
+            self.assertTrue(dispatcher.join(timeout=5))
+            self.assertEqual(bin.busd.process_mailbox_once(), 1)
+
+        self.assertEqual((self.test_dir / "ingest.jsonl").read_text(), "")
+        self.assertEqual(bin.busd._received, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Unit tests for mailbox_watcher.py"""
+
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+# Add bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+from mailbox_watcher import InotifyWatcher, PollingWatcher, create_watcher
+
+
+def _deliver(inbox, name, content='{"type": "log"}'):
+    """Write a message the same way busctl does (temp file + rename)"""
+    inbox.mkdir(parents=True, exist_ok=True)
+    tmp = inbox / f".tmp-{name}"
+    tmp.write_text(content)
+    tmp.rename(inbox / name)
+
+
+class TestInotifyWatcher(unittest.TestCase):
+    """Test cases for the inotify backend"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.mbox = Path(self.test_dir) / "mbox"
+        (self.mbox / "bus" / "in").mkdir(parents=True)
+        try:
+            self.watcher = InotifyWatcher(self.mbox)
+        except (OSError, AttributeError) as e:
+            shutil.rmtree(self.test_dir)
+            self.skipTest(f"inotify not available: {e}")
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_times_out_when_idle(self):
+        """wait() returns False when nothing is delivered"""
+        self.assertFalse(self.watcher.wait(0.05))
+
+    def test_wakes_on_renamed_message(self):
+        """A .json renamed into an inbox wakes the watcher"""
+        _deliver(self.mbox / "bus" / "in", "20250101T000000.000Z-abc.json")
+        self.assertTrue(self.watcher.wait(1.0))
+
+    def test_wakes_promptly_from_another_thread(self):
+        """Delivery latency is far below the old 500 ms polling interval"""
+        inbox = self.mbox / "bus" / "in"
+        timer = threading.Timer(0.05, _deliver, args=(inbox, "msg.json"))
+        start = time.monotonic()
+        timer.start()
+        self.assertTrue(self.watcher.wait(2.0))
+        elapsed = time.monotonic() - start
+        timer.join()
+        self.assertLess(elapsed, 0.25)
+
+    def test_wakes_on_sequence_append(self):
+        """Appending to .seq after the rename wakes the watcher again"""
+        with open(self.mbox / "bus" / "in" / ".seq", "ab") as fp:
+            fp.write(b"msg.json\n")
+        self.assertTrue(self.watcher.wait(1.0))
+
+    def test_ignores_temp_files(self):
+        """Writing the .tmp-* file alone does not wake the watcher"""
+        (self.mbox / "bus" / "in" / ".tmp-msg.json").write_text("{}")
+        self.assertFalse(self.watcher.wait(0.05))
+
+    def test_watches_new_mailboxes(self):
+        """Inboxes created after startup are picked up"""
+        (self.mbox / "unit-root-api" / "in").mkdir(parents=True)
+        # Directory creation itself wakes the watcher so the caller rescans
+        self.assertTrue(self.watcher.wait(1.0))
+        while self.watcher.wait(0.05):
+            pass
+
+        _deliver(self.mbox / "unit-root-api" / "in", "msg.json")
+        self.assertTrue(self.watcher.wait(1.0))
+
+
+class TestPollingWatcher(unittest.TestCase):
+    """Test cases for the adaptive polling fallback"""
+
+    def test_backs_off_when_idle_and_resets_on_activity(self):
+        watcher = PollingWatcher("/nonexistent", min_interval=0.001, max_interval=0.004)
+        for _ in range(5):
+            watcher.wait()
+        self.assertEqual(watcher.interval, 0.004)
+
+        watcher.wait(active=True)
+        self.assertEqual(watcher.interval, 0.001)
+
+    def test_create_watcher_honours_poll_backend(self):
+        watcher = create_watcher("/nonexistent", backend="poll")
+        self.assertIsInstance(watcher, PollingWatcher)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Unit tests for message_ledger.py and redelivery handling in busd"""
+
+import json
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+from message_ledger import MessageLedger
+from retry_queue import RetryQueue
+
+
+def message(n, msg_type="log", task_id="T001", data=None):
+    return {"id": f"m{n}", "ts": n, "from": f"unit:{task_id}", "to": "pmai",
+            "type": msg_type, "task_id": task_id, "data": data or {"msg": str(n)}}
+
+
+class TestMessageLedger(unittest.TestCase):
+    """Test cases for MessageLedger"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.path = self.test_dir / "ledger.sqlite"
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_ids_survive_a_restart(self):
+        ledger = MessageLedger(self.path, cache_size=2)
+        ledger.add("m1")
+        self.assertTrue(ledger.seen("m1"))
+        self.assertFalse(ledger.seen("m2"))
+        self.assertEqual(ledger.commit(), 1)
+        ledger.close()
+
+        ledger = MessageLedger(self.path, cache_size=2)
+        self.assertTrue(ledger.seen("m1"))
+        for n in range(3, 6):
+            ledger.add(f"m{n}")
+        self.assertEqual(len(ledger._cache), 2)  # Bounded, older ids are looked up on disk
+        ledger.commit()
+        self.assertTrue(ledger.seen("m3"))
+        ledger.close()
+
+    def test_old_ids_are_pruned(self):
+        ledger = MessageLedger(self.path, retention=3600)
+        with ledger.db:
+            ledger.db.execute("INSERT INTO processed VALUES ('old', 0)")
+        ledger.add("new")
+        ledger.commit()
+        self.assertEqual([row[0] for row in ledger.db.execute("SELECT id FROM processed")], ["new"])
+        ledger.close()
+
+
+class TestBusdRedelivery(unittest.TestCase):
+    """Test that busd acknowledges redelivered messages without side effects"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.inbox = self.test_dir / "mbox" / "pmai" / "in"
+        self.inbox.mkdir(parents=True)
+        self.ledger = MessageLedger(self.test_dir / "ledger.sqlite")
+        self.patches = [
+            patch('bin.busd.MBOX', self.test_dir / "mbox"),
+            patch('bin.busd.BUS_LOG', self.test_dir / "bus.jsonl"),
+            patch('bin.busd.JOURNAL_FILE', self.test_dir / "journal.jsonl"),
+            patch('bin.busd.tasks', {"T001": {"id": "T001", "status": "running", "env": {}}}),
+            patch('bin.busd.pane_map', {}),
+            patch('bin.busd._inbox_indexes', {}),
+            patch('bin.busd.ledger', self.ledger),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        self.ledger.close()
+        shutil.rmtree(self.test_dir)
+
+    def deliver(self, name, msg):
+        (self.inbox / name).write_text(json.dumps(msg))
+
+    def logged_ids(self):
+        return [json.loads(l)["id"] for l in (self.test_dir / "bus.jsonl").read_text().splitlines()]
+
+    def test_duplicates_are_acknowledged_once(self):
+        self.deliver("0001.json", message(1))
+        self.deliver("0002.json", message(1))
+        self.assertEqual(bin.busd.process_mailbox_once(), 2)
+
+        # busd stopped before removing the file: the restarted daemon skips it
+        self.ledger.close()
+        self.ledger = MessageLedger(self.test_dir / "ledger.sqlite")
+        self.deliver("0003.json", message(1))
+        with patch('bin.busd.ledger', self.ledger):
+            self.assertEqual(bin.busd.process_mailbox_once(), 1)
+
+        self.assertEqual(self.logged_ids(), ["m1"])
+        self.assertEqual(list(self.inbox.glob("*.json")), [])
+
+    def test_requeued_batch_is_not_mistaken_for_a_duplicate(self):
+        self.deliver("0001.json", dict(message(0, "batch"), id="b1",
+                                       data={"messages": [message(1), message(2)]}))
+        real_handle_post = bin.busd.handle_post
+
+        def fail_on_m2(msg):
+            if msg["id"] == "m2":
+                raise RuntimeError("boom")
+            real_handle_post(msg)
+
+        with patch('bin.busd.retry_queue', RetryQueue(base_delay=0)):
+            with patch('bin.busd.handle_post', side_effect=fail_on_m2):
+                bin.busd.process_mailbox_once()
+            remaining = json.loads((self.inbox / "0001.json").read_text())
+            self.assertEqual(remaining["id"], "b1")  # Kept for its retry, not recorded as processed
+
+            self.assertEqual(bin.busd.process_mailbox_once(), 1)
+        self.assertEqual(self.logged_ids(), ["m1", "m2"])
+
+    def test_spawn_retry_reuses_the_pane(self):
+        spawn = dict(message(1, "spawn", task_id="T002"), data={"goal": "g"})
+        self.deliver("0001.json", spawn)
+        calls = []
+
+        def spawn_child(task_id, *args, **kwargs):
+            calls.append(task_id)
+            bin.busd.pane_map[task_id] = "%9"
+            raise RuntimeError("tmux went away after the pane was created")
+
+        ctx = {"task_id": "T002", "worktree_path": self.test_dir / "work" / "T002",
+               "branch": "feat/T002", "frame": "", "goal": "g", "env": {}}
+        with patch('bin.busd.spawn_pipeline', None), \
+                patch('bin.busd.retry_queue', RetryQueue(base_delay=0)), \
+                patch('bin.busd._prepare_spawn', return_value=ctx), \
+                patch('bin.busd.spawn_child', side_effect=spawn_child):
+            self.assertEqual(bin.busd.process_mailbox_once(), 0)
+            self.assertEqual(bin.busd.tasks["T002"]["status"], "spawning")
+            self.assertEqual(bin.busd.process_mailbox_once(), 1)
+
+        self.assertEqual(calls, ["T002"])
+        self.assertEqual(bin.busd.tasks["T002"]["status"], "running")
+        self.assertEqual(bin.busd.tasks["T002"]["spawn_id"], "m1")
+        self.assertEqual(list(self.inbox.glob("*.json")), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
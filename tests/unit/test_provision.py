@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Unit tests for provision.py and project file provisioning in busd"""
+
+import errno
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+from provision import Provisioner
+
+
+def no_reflink(fd, request, arg):
+    raise OSError(errno.EOPNOTSUPP, "Operation not supported")
+
+
+class TestProvisioner(unittest.TestCase):
+    """Test cases for Provisioner"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.src = self.test_dir / "src"
+        self.dest = self.test_dir / "dest"
+        (self.src / "commands").mkdir(parents=True)
+        self.dest.mkdir()
+        (self.src / "settings.json").write_text('{"a": 1}')
+        (self.src / "commands" / "review.md").write_text("review")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_unchanged_files_are_left_alone(self):
+        provisioner = Provisioner()
+        with patch('provision.fcntl.ioctl', side_effect=no_reflink) as ioctl:
+            self.assertEqual(provisioner.provision_tree(self.src, self.dest), {"copied": 2})
+            self.assertEqual(provisioner.provision_tree(self.src, self.dest), {"unchanged": 2})
+            (self.src / "settings.json").write_text('{"a": 2}')
+            self.assertEqual(provisioner.provision_tree(self.src, self.dest), {"copied": 1, "unchanged": 1})
+        self.assertEqual(ioctl.call_count, 1)  # Not retried on the same filesystem
+        self.assertEqual((self.dest / "settings.json").read_text(), '{"a": 2}')
+        self.assertEqual((self.dest / "commands" / "review.md").read_text(), "review")
+        self.assertEqual(sorted(p.name for p in self.dest.iterdir()), ["commands", "settings.json"])
+
+    def test_reflink_is_used_when_supported(self):
+        def fake_reflink(fd, request, arg):
+            os.write(fd, os.pread(arg, 1 << 20, 0))
+
+        with patch('provision.fcntl.ioctl', side_effect=fake_reflink):
+            method = Provisioner().provision(self.src / "settings.json", self.dest / "settings.json")
+        self.assertEqual(method, "reflinked")
+        self.assertEqual((self.dest / "settings.json").read_text(), '{"a": 1}')
+
+    def test_frames_are_hard_linked_to_a_read_only_copy(self):
+        frame = self.src / "settings.json"
+        mode = os.stat(frame).st_mode
+        with patch('provision.os.geteuid', return_value=1000):
+            provisioner = Provisioner(stage_dir=self.test_dir / "staged")
+        self.assertEqual(provisioner.provision(frame, self.dest / "CLAUDE.md", link=True), "linked")
+        self.assertEqual(provisioner.provision(frame, self.dest / "AGENTS.md", link=True), "linked")
+        self.assertEqual(provisioner.provision(frame, self.dest / "CLAUDE.md", link=True), "unchanged")
+
+        self.assertEqual(os.stat(frame).st_mode, mode)  # The source is left alone
+        staged, = (self.test_dir / "staged").iterdir()
+        self.assertTrue((self.dest / "CLAUDE.md").samefile(staged))
+        self.assertTrue((self.dest / "AGENTS.md").samefile(staged))
+        self.assertFalse(os.stat(staged).st_mode & 0o222)
+
+        frame.write_text('{"a": 2}')
+        self.assertEqual(provisioner.provision(frame, self.dest / "CLAUDE.md", link=True), "linked")
+        self.assertEqual((self.dest / "CLAUDE.md").read_text(), '{"a": 2}')
+        self.assertEqual((self.dest / "AGENTS.md").read_text(), '{"a": 1}')
+
+    def test_no_hard_links_as_root(self):
+        with patch('provision.os.geteuid', return_value=0):
+            provisioner = Provisioner()
+        method = provisioner.provision(self.src / "settings.json", self.dest / "CLAUDE.md", link=True)
+        self.assertIn(method, ("reflinked", "copied"))
+        self.assertFalse((self.dest / "CLAUDE.md").samefile(self.src / "settings.json"))
+
+    def test_replaces_instead_of_writing_through(self):
+        shared = self.test_dir / "shared"
+        shared.write_text("shared")
+        os.link(shared, self.dest / "settings.json")
+        Provisioner().provision(self.src / "settings.json", self.dest / "settings.json")
+        self.assertEqual(shared.read_text(), "shared")
+        self.assertEqual((self.dest / "settings.json").read_text(), '{"a": 1}')
+
+
+class TestBusdCopyProjectFiles(unittest.TestCase):
+    """Test that copy_project_files provisions the shared project files"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.repo = self.test_dir / "repo"
+        (self.repo / ".claude").mkdir(parents=True)
+        (self.repo / "requirements.yml").write_text("project: x\n")
+        (self.repo / ".env.local").write_text("KEY=1\n")
+        (self.repo / ".claude" / "settings.json").write_text("{}")
+        self.studio = self.test_dir / "studio"
+        (self.studio / "frames" / "unit").mkdir(parents=True)
+        (self.studio / "frames" / "unit" / "CLAUDE.md").write_text("# Unit frame")
+        self.patches = [
+            patch('bin.busd.TARGET_REPO', self.repo),
+            patch('bin.busd.AI_APP_STUDIO_ROOT', self.studio),
+            patch('bin.busd._provisioner', Provisioner(hardlink=False)),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_second_sync_copies_nothing(self):
+        worktree = self.test_dir / "repo-T001"
+        worktree.mkdir()
+        bin.busd.copy_project_files(worktree, unit_id="T001")
+        bin.busd.copy_project_files(worktree, unit_id="T001")
+
+        self.assertEqual((worktree / "CLAUDE.md").read_text(), "# Unit frame")
+        self.assertEqual((worktree / ".env.local").read_text(), "KEY=1\n")
+        self.assertEqual((worktree / ".claude" / "settings.json").read_text(), "{}")
+        metrics = bin.busd._provisioner.metrics
+        self.assertEqual(metrics["unchanged"], 4)
+        self.assertEqual(metrics["copied"] + metrics["reflinked"], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
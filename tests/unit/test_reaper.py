@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""Unit tests for reaper.py and reaping finished units in busd"""
+
+import gzip
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+from reaper import Reaper, select_reapable
+
+HOUR_MS = 3600 * 1000
+
+
+def git(*args, cwd):
+    return subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True, check=True).stdout
+
+
+def init_repo(path):
+    path.mkdir()
+    git("init", "-q", "-b", "main", cwd=path)
+    git("config", "user.name", "Test", cwd=path)
+    git("config", "user.email", "test@example.com", cwd=path)
+    (path / "README.md").write_text("# Test Repo")
+    git("add", ".", cwd=path)
+    git("commit", "-q", "-m", "Initial commit", cwd=path)
+
+
+def finished(task_id, hours_ago, status="done", now=100 * HOUR_MS, **fields):
+    return {"id": task_id, "status": status, "completed_at": now - hours_ago * HOUR_MS, **fields}
+
+
+class TestSelectReapable(unittest.TestCase):
+    """Test cases for the retention policy"""
+
+    now = 100 * HOUR_MS
+
+    def test_keeps_newest_and_recent_units(self):
+        tasks = [finished(f"T00{n}", hours_ago=n) for n in range(1, 6)]
+        self.assertEqual(select_reapable(tasks, self.now, keep=2, keep_age=0), ["T005", "T004", "T003"])
+        self.assertEqual(select_reapable(tasks, self.now, keep=0, keep_age=3.5 * 3600), ["T005", "T004"])
+
+    def test_keeps_failed_running_and_reaped_units(self):
+        tasks = [
+            finished("T001", hours_ago=6, status="error"),
+            finished("T002", hours_ago=5),
+            finished("T003", hours_ago=5, reaped_at=1),
+            {"id": "T002-1", "status": "running", "env": {"PARENT_UNIT_ID": "T002"}},
+            finished("T004", hours_ago=5),
+        ]
+        self.assertEqual(select_reapable(tasks, self.now, keep=0, keep_age=0), ["T004"])
+        self.assertEqual(select_reapable(tasks, self.now, keep=0, keep_age=0, keep_failed=False),
+                         ["T001", "T004"])
+
+
+class TestReaper(unittest.TestCase):
+    """Test cases for Reaper against a real repository"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.repo = self.test_dir / "repo"
+        init_repo(self.repo)
+        self.raw = self.test_dir / "logs" / "raw"
+        self.raw.mkdir(parents=True)
+        self.reaper = Reaper(self.repo, self.test_dir / "trash", self.raw, self.raw / "archive")
+
+    def tearDown(self):
+        self.reaper.shutdown(wait=True)
+        shutil.rmtree(self.test_dir)
+
+    def add_worktree(self, task_id):
+        path = self.test_dir / f"repo-{task_id}"
+        git("worktree", "add", "-q", "-b", f"feat/{task_id}", str(path), cwd=self.repo)
+        (path / "CLAUDE.md").write_text("# Unit frame")  # Provisioned by busd
+        (path / ".claude").mkdir()
+        (path / ".claude" / "settings.json").write_text("{}")
+        return {"id": task_id, "worktree_path": str(path), "branch": f"feat/{task_id}"}
+
+    def test_removes_clean_worktree_branch_and_archives_log(self):
+        task = self.add_worktree("T001")
+        (self.raw / "T001.raw").write_bytes(b"pane output\n")
+
+        result = self.reaper.reap(task)
+
+        self.assertEqual(result, {"worktree": "removed", "branch": "deleted", "log": "archived"})
+        self.assertFalse(Path(task["worktree_path"]).exists())
+        self.assertNotIn("repo-T001", git("worktree", "list", cwd=self.repo))
+        self.assertEqual(git("branch", "--list", "feat/T001", cwd=self.repo), "")
+        self.assertEqual(list((self.test_dir / "trash").iterdir()), [])
+        self.assertFalse((self.raw / "T001.raw").exists())
+        archived, = (self.raw / "archive").glob("T001.*.raw.gz")
+        self.assertEqual(gzip.decompress(archived.read_bytes()), b"pane output\n")
+
+    def test_keeps_uncommitted_work_and_unmerged_branches(self):
+        dirty = self.add_worktree("T001")
+        (Path(dirty["worktree_path"]) / "app.py").write_text("print('wip')\n")
+        unmerged = self.add_worktree("T002")
+        (Path(unmerged["worktree_path"]) / "app.py").write_text("print('done')\n")
+        git("add", "app.py", cwd=unmerged["worktree_path"])
+        git("commit", "-q", "-m", "Add app", cwd=unmerged["worktree_path"])
+
+        self.assertEqual(self.reaper.reap(dirty)["worktree"], "kept (1 uncommitted changes)")
+        self.assertEqual(self.reaper.reap(unmerged)["branch"], "kept (not merged)")
+
+        self.assertTrue((Path(dirty["worktree_path"]) / "app.py").exists())
+        self.assertIn("feat/T001", git("branch", "--list", "feat/T001", cwd=self.repo))
+        self.assertFalse(Path(unmerged["worktree_path"]).exists())
+        self.assertIn("feat/T002", git("branch", "--list", "feat/T002", cwd=self.repo))
+        self.assertEqual(self.reaper.metrics, {"reaped": 2, "kept_worktrees": 1, "kept_branches": 1})
+
+
+class TestBusdMaybeReap(unittest.TestCase):
+    """Test that busd closes panes and reaps units outside the retention policy"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.repo = self.test_dir / "target_repo"
+        init_repo(self.repo)
+        self.logs = self.test_dir / "logs"
+        (self.logs / "raw").mkdir(parents=True)
+        now = int(bin.busd.time.time() * 1000)
+        self.patches = [
+            patch('bin.busd.TARGET_REPO', self.repo),
+            patch('bin.busd.LOGS', self.logs),
+            patch('bin.busd.worktree_pool', None),
+            patch('bin.busd._repo_info', None),
+            patch('bin.busd.REAP_KEEP', 1),
+            patch('bin.busd.REAP_KEEP_AGE', 0),
+            patch('bin.busd.tasks', {}),
+            patch('bin.busd.pane_map', {"T001": "cc:T001.0", "T002": "cc:T002.0"}),
+            patch('bin.busd.save_pane_map'),
+            patch('bin.busd.tmux'),
+        ]
+        for p in self.patches:
+            p.start()
+        for n, task_id in enumerate(("T001", "T002"), start=1):
+            path = bin.busd.ensure_worktree(task_id, f"feat/{task_id}")
+            bin.busd.tasks[task_id] = {"id": task_id, "status": "done", "completed_at": now - n * 1000,
+                                       "worktree_path": str(path), "branch": f"feat/{task_id}"}
+        bin.busd.tasks["PMAI"] = {"id": "PMAI", "status": "done", "completed_at": 0,
+                                  "worktree_path": str(self.repo), "branch": "main"}
+
+    def tearDown(self):
+        if bin.busd.reaper is not None:
+            bin.busd.reaper.shutdown(wait=True)
+            bin.busd.reaper = None
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_reaps_all_but_the_newest_unit(self):
+        bin.busd.start_reaper()
+        self.assertEqual(bin.busd.maybe_reap(force=True), ["T002"])
+        bin.busd.reaper.shutdown(wait=True)
+
+        bin.busd.tmux.assert_called_once_with("kill-pane", "-t", "cc:T002.0", check=False)
+        self.assertEqual(bin.busd.pane_map, {"T001": "cc:T001.0"})
+        self.assertFalse((self.test_dir / "target_repo-T002").exists())
+        self.assertTrue((self.test_dir / "target_repo-T001").exists())
+        self.assertTrue(self.repo.exists())
+        self.assertEqual(bin.busd.tasks["T002"]["reaped"]["worktree"], "removed")
+        self.assertIn("reaped_at", bin.busd.tasks["T002"])
+        self.assertNotIn("reaped_at", bin.busd.tasks["PMAI"])
+
+
+class TestBusdCompactionWithReaper(unittest.TestCase):
+    """Test that compacting the state does not race with reaped units being recorded"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.patches = [
+            patch('bin.busd.TASKS_FILE', self.test_dir / "tasks.json"),
+            patch('bin.busd.PANES_FILE', self.test_dir / "panes.json"),
+            patch('bin.busd.JOURNAL_FILE', self.test_dir / "journal.jsonl"),
+            patch('bin.busd.tasks', {"T001": {"id": "T001", "status": "done"}}),
+            patch('bin.busd.pane_map', {}),
+            patch('bin.busd._dirty_tasks', set()),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_snapshot_is_a_copy_and_later_changes_are_journaled(self):
+        write_snapshot = bin.busd.write_snapshot
+
+        def reaped_while_writing(path, value, fsync=False):
+            if path == bin.busd.TASKS_FILE:
+                # The reaper records a unit while the snapshot is being written
+                bin.busd._reaped("T001", {"worktree": "removed"})
+            write_snapshot(path, value, fsync=fsync)
+
+        with patch('bin.busd.write_snapshot', side_effect=reaped_while_writing):
+            bin.busd.compact_state()
+
+        snapshot, = json.loads((self.test_dir / "tasks.json").read_text())
+        self.assertNotIn("reaped_at", snapshot)
+        self.assertEqual(bin.busd.flush_tasks(), 1)
+        record, = (json.loads(line) for line in (self.test_dir / "journal.jsonl").read_text().splitlines())
+        self.assertEqual(record["v"]["reaped"], {"worktree": "removed"})
+
+
+if __name__ == '__main__':
+    unittest.main()
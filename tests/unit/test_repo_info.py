@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Unit tests for repo_info.py and cached git facts in busd"""
+
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+from repo_info import RepoInfo
+
+
+def git(*args, cwd):
+    return subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True, check=True).stdout
+
+
+def init_repo(path, commit=True):
+    path.mkdir()
+    git("init", "-q", "-b", "main", cwd=path)
+    git("config", "user.name", "Test", cwd=path)
+    git("config", "user.email", "test@example.com", cwd=path)
+    if commit:
+        (path / "README.md").write_text("# Test Repo")
+        git("add", ".", cwd=path)
+        git("commit", "-q", "-m", "Initial commit", cwd=path)
+
+
+class TestRepoInfo(unittest.TestCase):
+    """Test cases for RepoInfo"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.repo = self.test_dir / "repo"
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_reads_git_only_after_changes(self):
+        init_repo(self.repo)
+        info = RepoInfo(self.repo)
+        self.assertEqual(info.current_branch(), "main")
+        self.assertTrue(info.has_commits())
+        self.assertFalse(info.has_branch("feat/T001"))
+        self.assertEqual(info.git_calls, 2)  # rev-parse and for-each-ref
+
+        git("branch", "feat/T001", cwd=self.repo)
+        self.assertTrue(info.has_branch("feat/T001"))
+        git("checkout", "-q", "feat/T001", cwd=self.repo)
+        self.assertEqual(info.current_branch(), "feat/T001")
+        git("checkout", "-q", "--detach", cwd=self.repo)
+        self.assertEqual(info.current_branch(), "feat/T001")  # First branch by name
+        self.assertEqual(info.head, info.branches["main"])
+        calls = info.git_calls
+
+        for _ in range(3):
+            info.refresh()
+        self.assertEqual(info.git_calls, calls)
+
+    def test_empty_and_missing_repositories(self):
+        self.repo.mkdir()
+        info = RepoInfo(self.repo)
+        self.assertFalse(info.refresh().is_git)
+        info.refresh()
+        self.assertEqual(info.git_calls, 1)
+
+        git("init", "-q", "-b", "main", cwd=self.repo)
+        self.assertTrue(info.refresh().is_git)
+        self.assertEqual(info.current_branch(), "main")
+        self.assertFalse(info.has_commits())
+        self.assertFalse(info.has_branch("main"))
+
+
+class TestBusdRepoInfo(unittest.TestCase):
+    """Test that ensure_worktree reads repository facts from the cache"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.repo = self.test_dir / "target_repo"
+        init_repo(self.repo)
+        self.patches = [
+            patch('bin.busd.TARGET_REPO', self.repo),
+            patch('bin.busd.worktree_pool', None),
+            patch('bin.busd._repo_info', None),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_spawns_run_one_git_command_each(self):
+        with patch('bin.busd.sh', wraps=bin.busd.sh) as sh:
+            for n in range(1, 4):
+                bin.busd.ensure_worktree(f"T00{n}", f"feat/T00{n}")
+        self.assertEqual([call.args[0].split()[3:5] for call in sh.call_args_list],
+                         [["worktree", "add"]] * 3)
+        # rev-parse once, then for-each-ref before each spawn (after busd created a branch)
+        self.assertEqual(bin.busd._repo_info.git_calls, 4)
+        for n in range(1, 4):
+            self.assertEqual(git("branch", "--show-current", cwd=self.test_dir / f"target_repo-T00{n}").strip(),
+                             f"feat/T00{n}")
+
+        # Branches created outside busd are still noticed
+        git("branch", "feat/T004", cwd=self.repo)
+        git("commit", "-q", "--allow-empty", "-m", "Advance main", cwd=self.repo)
+        path = bin.busd.ensure_worktree("T004", "feat/T004")
+        self.assertEqual(git("branch", "--show-current", cwd=path).strip(), "feat/T004")
+        self.assertEqual(bin.busd._repo_info.git_calls, 5)
+
+    def test_branch_deleted_while_spawning_is_noticed(self):
+        info = bin.busd._get_repo_info()
+        bin.busd.ensure_worktree("T001", "feat/T001")
+        git("worktree", "remove", str(self.test_dir / "target_repo-T001"), cwd=self.repo)
+        git("branch", "-D", "feat/T001", cwd=self.repo)
+        # busd creates another branch right after the deletion, without a reload in between
+        info.note_branch("feat/T002", "main")
+
+        self.assertFalse(info.has_branch("feat/T001"))
+        self.assertTrue(info.has_branch("main"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Unit tests for retry_queue.py, retries in busd and busctl dlq"""
+
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+from retry_queue import RetryQueue
+
+BUSCTL = Path(__file__).parent.parent.parent / "bin" / "busctl.py"
+
+
+def message(n, task_id="T001"):
+    return {"id": f"m{n}", "ts": n, "from": f"unit:{task_id}", "to": "pmai",
+            "type": "log", "task_id": task_id, "data": {"msg": str(n)}}
+
+
+class TestRetryQueue(unittest.TestCase):
+    """Test cases for RetryQueue"""
+
+    def test_backoff_doubles_up_to_the_limit(self):
+        queue = RetryQueue(base_delay=1, max_delay=5, max_attempts=5)
+        delays = [queue.failed("a", now=0)[1] for _ in range(4)]
+        self.assertEqual(delays, [1, 2, 4, 5])
+        self.assertFalse(queue.ready("a", now=4.9))
+        self.assertTrue(queue.ready("a", now=5))
+        self.assertEqual(queue.failed("a", now=5), (5, None))  # Give up
+        self.assertTrue(queue.ready("a", now=5))
+        self.assertEqual(len(queue), 0)
+
+    def test_next_delay_comes_from_the_earliest_retry(self):
+        queue = RetryQueue(base_delay=10)
+        self.assertIsNone(queue.next_delay())
+        queue.failed("a", now=0)
+        queue.failed("b", now=3)
+        self.assertEqual(queue.next_delay(now=1), 9)
+        queue.forget("a")
+        self.assertEqual(queue.next_delay(now=1), 12)
+        queue.forget("b")
+        self.assertIsNone(queue.next_delay(now=1))
+
+
+class TestBusdRetries(unittest.TestCase):
+    """Test retries and dead letters in the mailbox sweep"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.inbox = self.test_dir / "mbox" / "pmai" / "in"
+        self.inbox.mkdir(parents=True)
+        self.patches = [
+            patch('bin.busd.MBOX', self.test_dir / "mbox"),
+            patch('bin.busd.BUS_LOG', self.test_dir / "bus.jsonl"),
+            patch('bin.busd.JOURNAL_FILE', self.test_dir / "journal.jsonl"),
+            patch('bin.busd.tasks', {}),
+            patch('bin.busd._inbox_indexes', {}),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for index in bin.busd._inbox_indexes.values():
+            index.close()
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def sweep(self, queue):
+        out, err = io.StringIO(), io.StringIO()
+        with patch('bin.busd.retry_queue', queue), redirect_stdout(out), redirect_stderr(err):
+            processed = bin.busd.process_mailbox_once()
+        return processed, err.getvalue()
+
+    def test_failed_message_waits_for_its_retry(self):
+        (self.inbox / "0001.json").write_text("{not json")
+        (self.inbox / "0002.json").write_text(json.dumps(message(2)))
+        queue = RetryQueue(base_delay=60)
+
+        self.assertEqual(self.sweep(queue)[0], 1)  # The newer message is not held up
+        self.assertEqual(queue.attempts(self.inbox / "0001.json"), 1)
+        self.sweep(queue)
+        self.assertEqual(queue.attempts(self.inbox / "0001.json"), 1)  # Not retried before it is due
+        self.assertGreater(queue.next_delay(), 50)
+
+    def test_poison_message_moves_to_dead_letters(self):
+        (self.inbox / "0001.json").write_text("{not json")
+        queue = RetryQueue(base_delay=0, max_attempts=3)
+        tracebacks = [self.sweep(queue)[1].count("Traceback") for _ in range(3)]
+
+        self.assertEqual(tracebacks, [1, 0, 0])  # Full traceback only on the first failure
+        self.assertEqual(list(self.inbox.glob("*.json")), [])
+        dead = self.test_dir / "mbox" / "pmai" / "dead"
+        info = json.loads((dead / "0001.json.error").read_text())
+        self.assertEqual(info["attempts"], 3)
+        self.assertIn("JSONDecodeError", info["error"])
+        self.assertEqual((dead / "0001.json").read_text(), "{not json")
+
+        env = dict(os.environ, BUSCTL_ROOT=str(self.test_dir))
+        listed = subprocess.run([sys.executable, str(BUSCTL), "dlq", "list"], env=env,
+                                capture_output=True, text=True, check=True).stdout
+        self.assertTrue(listed.startswith("pmai/0001.json\t"))
+        self.assertIn("attempts=3", listed)
+
+        (dead / "0001.json").write_text(json.dumps(message(1)))  # Fixed by hand
+        subprocess.run([sys.executable, str(BUSCTL), "dlq", "replay", "pmai/0001.json"], env=env,
+                       capture_output=True, check=True)
+        self.assertEqual(list(dead.iterdir()), [])
+        self.assertIn("0001.json\n", (self.inbox / ".seq").read_text())
+        self.assertEqual(self.sweep(queue)[0], 1)
+
+        result = subprocess.run([sys.executable, str(BUSCTL), "dlq", "replay", "pmai/0001.json"], env=env,
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("not in the dead letter mailboxes", result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""Unit tests for spawn_pipeline.py and spawns in busd"""
+
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+from retry_queue import RetryQueue
+from spawn_pipeline import SpawnJob, SpawnPipeline
+
+
+def _spawn_msg(task_id):
+    return {"id": f"msg-{task_id}", "type": "spawn", "task_id": task_id, "data": {}}
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestSpawnJob(unittest.TestCase):
+    """Test cases for the per-unit state machine"""
+
+    def test_valid_transitions(self):
+        job = SpawnJob(_spawn_msg("T001"))
+        for state in (SpawnJob.PREPARING, SpawnJob.LAUNCHING, SpawnJob.STARTING, SpawnJob.READY):
+            job.advance(state)
+        self.assertEqual(job.state, SpawnJob.READY)
+        self.assertFalse(job.active)
+        self.assertEqual([s for s, _ in job.history][-1], SpawnJob.READY)
+
+    def test_invalid_transition_raises(self):
+        job = SpawnJob(_spawn_msg("T001"))
+        with self.assertRaises(ValueError):
+            job.advance(SpawnJob.STARTING)
+
+
+class TestSpawnPipeline(unittest.TestCase):
+    """Test cases for SpawnPipeline"""
+
+    def setUp(self):
+        self.greeted = []
+        self.launch_active = 0
+        self.max_launch_active = 0
+        self.lock = threading.Lock()
+
+    def _prepare(self, msg):
+        time.sleep(0.2)
+        return {"task_id": msg["task_id"]}
+
+    def _launch(self, ctx):
+        with self.lock:
+            self.launch_active += 1
+            self.max_launch_active = max(self.max_launch_active, self.launch_active)
+        time.sleep(0.01)
+        with self.lock:
+            self.launch_active -= 1
+        return f"%{ctx['task_id']}"
+
+    def _greet(self, ctx, pane):
+        self.greeted.append((ctx["task_id"], pane))
+
+    def test_spawns_prepare_concurrently_and_launch_serially(self):
+        pipeline = SpawnPipeline(self._prepare, self._launch, self._greet,
+                                 workers=8, startup_delay=0.05)
+        try:
+            start = time.monotonic()
+            for i in range(8):
+                pipeline.submit(_spawn_msg(f"T{i:03d}"))
+
+            finished = []
+            self.assertTrue(_wait_for(lambda: finished.extend(pipeline.drain()) or len(finished) == 8))
+            elapsed = time.monotonic() - start
+
+            # 8 x 0.2s sequential would take 1.6s
+            self.assertLess(elapsed, 1.0)
+            self.assertEqual(self.max_launch_active, 1)
+            self.assertTrue(all(job.state in (SpawnJob.STARTING, SpawnJob.READY) for job in finished))
+        finally:
+            pipeline.shutdown(wait=True)
+
+    def test_initial_message_is_deferred(self):
+        pipeline = SpawnPipeline(lambda msg: {"task_id": msg["task_id"]}, self._launch, self._greet,
+                                 workers=1, startup_delay=0.3)
+        try:
+            job = pipeline.submit(_spawn_msg("T001"))
+            self.assertTrue(_wait_for(lambda: job.state == SpawnJob.STARTING))
+            self.assertEqual(self.greeted, [])
+
+            self.assertTrue(_wait_for(lambda: job.state == SpawnJob.READY))
+            self.assertEqual(self.greeted, [("T001", "%T001")])
+        finally:
+            pipeline.shutdown(wait=True)
+
+    def test_failed_prepare_is_reported(self):
+        def prepare(msg):
+            raise RuntimeError("worktree failed")
+
+        completions = []
+        pipeline = SpawnPipeline(prepare, self._launch, self._greet, workers=1,
+                                 startup_delay=0, on_complete=lambda: completions.append(1))
+        try:
+            job = pipeline.submit(_spawn_msg("T001"))
+            self.assertTrue(_wait_for(lambda: not job.active))
+            self.assertEqual(job.state, SpawnJob.FAILED)
+            self.assertEqual(str(job.error), "worktree failed")
+            self.assertEqual(pipeline.drain(), [job])
+            self.assertEqual(completions, [1])
+        finally:
+            pipeline.shutdown(wait=True)
+
+    def test_duplicate_submit_returns_active_job(self):
+        release = threading.Event()
+
+        def prepare(msg):
+            release.wait(2.0)
+            return {"task_id": msg["task_id"]}
+
+        pipeline = SpawnPipeline(prepare, self._launch, self._greet, workers=2, startup_delay=0)
+        try:
+            first = pipeline.submit(_spawn_msg("T001"))
+            second = pipeline.submit(_spawn_msg("T001"))
+            self.assertIs(first, second)
+        finally:
+            release.set()
+            pipeline.shutdown(wait=True)
+
+    def test_finished_jobs_are_dropped(self):
+        def prepare(msg):
+            if msg["task_id"] == "T002":
+                raise RuntimeError("worktree failed")
+            return {"task_id": msg["task_id"]}
+
+        pipeline = SpawnPipeline(prepare, self._launch, self._greet, workers=2, startup_delay=0.05)
+        try:
+            first = pipeline.submit(_spawn_msg("T001"))
+            failed = pipeline.submit(_spawn_msg("T002"))
+            self.assertIs(pipeline.active_job("T001"), first)
+            self.assertTrue(_wait_for(lambda: first.state == SpawnJob.READY and not failed.active))
+            self.assertTrue(_wait_for(lambda: pipeline.jobs == {}))
+            self.assertIsNone(pipeline.active_job("T001"))
+            self.assertEqual(pipeline.pending(), 0)
+        finally:
+            pipeline.shutdown(wait=True)
+
+
+class TestBusdFinishSpawns(unittest.TestCase):
+    """Test that finish_spawns records finished pipeline jobs in the task state"""
+
+    def setUp(self):
+        self.pipeline = MagicMock()
+        self.patches = [
+            patch('bin.busd.spawn_pipeline', self.pipeline),
+            patch('bin.busd.tasks', {}),
+            patch('bin.busd.flush_tasks'),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+
+    def _finished_job(self, task_id, worktree_path):
+        job = SpawnJob(_spawn_msg(task_id))
+        job.context = {"task_id": task_id, "worktree_path": Path(worktree_path)}
+        for state in (SpawnJob.PREPARING, SpawnJob.LAUNCHING, SpawnJob.STARTING):
+            job.advance(state)
+        return job
+
+    def test_launched_spawn_becomes_running(self):
+        bin.busd.tasks["T001"] = {"id": "T001", "status": "spawning", "cwd": "", "worktree_path": ""}
+        self.pipeline.drain.return_value = [self._finished_job("T001", "/work/repo-T001")]
+
+        bin.busd.finish_spawns()
+
+        self.assertEqual(bin.busd.tasks["T001"]["status"], "running")
+        self.assertEqual(bin.busd.tasks["T001"]["worktree_path"], "/work/repo-T001")
+
+    def test_result_before_launch_keeps_status_but_records_worktree(self):
+        bin.busd.tasks["T001"] = {"id": "T001", "status": "done", "cwd": "", "worktree_path": "",
+                                  "completed_at": 1}
+        self.pipeline.drain.return_value = [self._finished_job("T001", "/work/repo-T001")]
+
+        bin.busd.finish_spawns()
+
+        task = bin.busd.tasks["T001"]
+        self.assertEqual(task["status"], "done")
+        self.assertEqual(task["completed_at"], 1)
+        self.assertEqual(task["cwd"], "/work/repo-T001")
+        self.assertEqual(task["worktree_path"], "/work/repo-T001")
+
+
+class TestBusdSendDuringSpawn(unittest.TestCase):
+    """Test that sends to a unit that is still starting wait for it"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.inbox = self.test_dir / "mbox" / "bus" / "in"
+        self.inbox.mkdir(parents=True)
+        self.pipeline = MagicMock()
+        self.patches = [
+            patch('bin.busd.MBOX', self.test_dir / "mbox"),
+            patch('bin.busd.BUS_LOG', self.test_dir / "bus.jsonl"),
+            patch('bin.busd.JOURNAL_FILE', self.test_dir / "journal.jsonl"),
+            patch('bin.busd.spawn_pipeline', self.pipeline),
+            patch('bin.busd.dispatcher', None),
+            patch('bin.busd.ledger', None),
+            patch('bin.busd.pane_map', {}),
+            patch('bin.busd.tasks', {"T001": {"id": "T001", "status": "spawning"}}),
+            patch('bin.busd.retry_queue', RetryQueue(base_delay=60, max_attempts=2)),
+            patch('bin.busd.SPAWN_WAIT_DELAY', 0),
+            patch('bin.busd._inbox_indexes', {}),
+            patch('bin.busd._in_flight', {}),
+            patch('bin.busd._finished', []),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for index in bin.busd._inbox_indexes.values():
+            index.close()
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_send_waits_until_the_unit_has_started(self):
+        msg = {"id": "s1", "ts": 1, "from": "pmai", "to": "impl:T001", "type": "send", "data": {"text": "hi"}}
+        (self.inbox / "0001.json").write_text(json.dumps(msg))
+        starting = SpawnJob(_spawn_msg("T001"))
+        self.pipeline.active_job.return_value = starting
+
+        with patch('bin.busd.send_text') as send_text:
+            for _ in range(3):  # More sweeps than the retry limit
+                self.assertEqual(bin.busd.process_mailbox_once(), 0)
+            send_text.assert_not_called()
+            self.assertTrue((self.inbox / "0001.json").exists())
+            self.assertEqual(bin.busd.retry_queue.attempts(self.inbox / "0001.json"), 0)
+
+            self.pipeline.active_job.return_value = None
+            bin.busd.pane_map["T001"] = "%1"
+            self.assertEqual(bin.busd.process_mailbox_once(), 1)
+
+        send_text.assert_called_once_with("%1", "hi")
+        self.assertFalse((self.inbox / "0001.json").exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""Unit tests for state_journal.py and busd state persistence"""
+
+import json
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+from state_journal import StateJournal, apply_records
+
+
+class TestStateJournal(unittest.TestCase):
+    """Test cases for StateJournal"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.journal = StateJournal(self.test_dir / "journal.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_replay_returns_appended_records(self):
+        self.journal.append([{"k": "task", "id": "T001", "v": {"id": "T001", "status": "running"}}])
+        self.journal.append([{"k": "pane", "id": "T001", "v": "%3"},
+                             {"k": "task", "id": "T001", "v": {"id": "T001", "status": "done"}}])
+
+        tasks, panes = {}, {}
+        apply_records(StateJournal(self.journal.path).replay(), tasks, panes)
+        self.assertEqual(tasks, {"T001": {"id": "T001", "status": "done"}})
+        self.assertEqual(panes, {"T001": "%3"})
+
+    def test_torn_tail_is_discarded(self):
+        self.journal.append([{"k": "pane", "id": "T001", "v": "%3"}])
+        with open(self.journal.path, "a") as fp:
+            fp.write('{"k": "pane", "id": "T002", "v": "%')
+
+        records = self.journal.replay()
+        self.assertEqual(len(records), 1)
+        # Later appends start on a clean line
+        self.journal.append([{"k": "pane", "id": "T003", "v": "%5"}])
+        self.assertEqual([r["id"] for r in self.journal.replay()], ["T001", "T003"])
+
+    def test_delete_record(self):
+        panes = {"T001": "%3"}
+        apply_records([{"k": "pane", "id": "T001", "v": None}], {}, panes)
+        self.assertEqual(panes, {})
+
+
+class TestBusdStatePersistence(unittest.TestCase):
+    """Test cases for journaled save_tasks / load_state in busd"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.patches = [
+            patch('bin.busd.TASKS_FILE', self.test_dir / "tasks.json"),
+            patch('bin.busd.PANES_FILE', self.test_dir / "panes.json"),
+            patch('bin.busd.JOURNAL_FILE', self.test_dir / "journal.jsonl"),
+            patch('bin.busd.tasks', {}),
+            patch('bin.busd.pane_map', {}),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_save_appends_delta_without_rewriting_snapshot(self):
+        for i in range(500):
+            bin.busd.tasks[f"T{i:03d}"] = {"id": f"T{i:03d}", "status": "running"}
+        bin.busd.save_tasks()
+        snapshot = (self.test_dir / "tasks.json").read_text()
+
+        journal = self.test_dir / "journal.jsonl"
+        bin.busd.tasks["T042"]["status"] = "done"
+        bin.busd.save_tasks("T042")
+        size_after_one = journal.stat().st_size
+        bin.busd.tasks["T043"]["status"] = "done"
+        bin.busd.save_tasks("T043")
+
+        # Snapshot untouched; each save costs one small record regardless of task count
+        self.assertEqual((self.test_dir / "tasks.json").read_text(), snapshot)
+        self.assertEqual(journal.stat().st_size, 2 * size_after_one)
+
+    def test_load_state_recovers_from_journal(self):
+        bin.busd.tasks["T001"] = {"id": "T001", "status": "running"}
+        bin.busd.save_tasks()
+        bin.busd.tasks["T001"]["status"] = "done"
+        bin.busd.save_tasks("T001")
+        bin.busd.pane_map["T001"] = "%9"
+        bin.busd.save_pane_map("T001")
+
+        # Simulate a restart: in-memory state is lost
+        bin.busd.tasks = {}
+        bin.busd.pane_map = {}
+        bin.busd.load_state()
+
+        self.assertEqual(bin.busd.tasks["T001"]["status"], "done")
+        self.assertEqual(bin.busd.pane_map, {"T001": "%9"})
+        # Replay compacts the journal into the snapshots
+        self.assertEqual((self.test_dir / "journal.jsonl").read_text(), "")
+        saved = json.loads((self.test_dir / "tasks.json").read_text())
+        self.assertEqual(saved, [{"id": "T001", "status": "done"}])
+
+
+class TestTaskDirtyTracking(unittest.TestCase):
+    """Test cases for skipping and coalescing task state writes"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.inbox = self.test_dir / "mbox" / "bus" / "in"
+        self.inbox.mkdir(parents=True)
+        self.metrics = {"writes": 0, "avoided": 0}
+        self.patches = [
+            patch('bin.busd.MBOX', self.test_dir / "mbox"),
+            patch('bin.busd.BUS_LOG', self.test_dir / "bus.jsonl"),
+            patch('bin.busd.TASKS_FILE', self.test_dir / "tasks.json"),
+            patch('bin.busd.PANES_FILE', self.test_dir / "panes.json"),
+            patch('bin.busd.JOURNAL_FILE', self.test_dir / "journal.jsonl"),
+            patch('bin.busd.tasks', {"T001": {"id": "T001", "status": "running", "env": {}}}),
+            patch('bin.busd.pane_map', {}),
+            patch('bin.busd._dirty_tasks', set()),
+            patch('bin.busd.state_metrics', self.metrics),
+        ]
+        for p in self.patches:
+            p.start()
+        self.journal = self.test_dir / "journal.jsonl"
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def _deliver(self, n, msg_type, data=None):
+        msg = {"id": f"m{n}", "ts": 1000 + n, "from": "impl:T001", "to": "bus",
+               "type": msg_type, "task_id": "T001", "data": data or {"msg": "working"}}
+        (self.inbox / f"{1000 + n}-m{n}.json").write_text(json.dumps(msg))
+
+    def _journal_lines(self):
+        if not self.journal.exists():
+            return []
+        return self.journal.read_text().splitlines()
+
+    def test_log_posts_do_not_write_state(self):
+        for i in range(5):
+            self._deliver(i, "log")
+        self.assertEqual(bin.busd.process_mailbox_once(), 5)
+
+        self.assertEqual(self._journal_lines(), [])
+        self.assertEqual(self.metrics, {"writes": 0, "avoided": 5})
+
+    def test_changes_within_a_sweep_are_coalesced(self):
+        self._deliver(1, "log")
+        self._deliver(2, "result", {"summary": "first"})
+        self._deliver(3, "result", {"summary": "second"})
+        bin.busd.process_mailbox_once()
+
+        lines = self._journal_lines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])["v"]["result"], {"summary": "second"})
+        self.assertEqual(self.metrics, {"writes": 1, "avoided": 2})
+
+    def test_unchanged_update_is_skipped(self):
+        self.assertFalse(bin.busd.update_task("T001", status="running"))
+        self.assertTrue(bin.busd.update_task("T001", status="done"))
+        self.assertEqual(bin.busd.flush_tasks(), 1)
+        self.assertEqual(bin.busd.flush_tasks(), 0)
+        self.assertEqual(len(self._journal_lines()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
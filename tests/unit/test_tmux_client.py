@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Unit tests for tmux_client.py"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+from tmux_client import TmuxClient, TmuxCommandError, format_command, quote
+
+
+class TestQuote(unittest.TestCase):
+    """Test cases for tmux command-language quoting"""
+
+    def test_quotes_special_characters(self):
+        self.assertEqual(quote('a "b" $HOME \\'), '"a \\"b\\" \\$HOME \\\\"')
+
+    def test_control_characters_stay_on_one_line(self):
+        quoted = quote("line1\nline2\x1b")
+        self.assertNotIn("\n", quoted)
+        self.assertEqual(quoted, '"line1\\nline2\\033"')
+
+    def test_format_command(self):
+        self.assertEqual(format_command(["send-keys", "-t", "cc:MAIN.0", "Enter"]),
+                         '"send-keys" "-t" "cc:MAIN.0" "Enter"')
+
+
+@unittest.skipUnless(shutil.which("tmux"), "tmux not installed")
+class TestTmuxClient(unittest.TestCase):
+    """Test cases for the control-mode connection"""
+
+    def setUp(self):
+        self.session = f"test-tmux-client-{os.getpid()}"
+        subprocess.run(["tmux", "new-session", "-d", "-s", self.session, "-x", "120", "-y", "40"],
+                       check=True, capture_output=True)
+        self.client = TmuxClient(self.session, timeout=5).start()
+
+    def tearDown(self):
+        self.client.close()
+        subprocess.run(["tmux", "kill-session", "-t", self.session], capture_output=True)
+
+    def test_runs_commands_and_returns_output(self):
+        self.assertTrue(self.client.alive)
+        pane_id = self.client.run("display-message", "-p", "-t", self.session, "#{pane_id}")
+        self.assertTrue(pane_id.startswith("%"), pane_id)
+
+    def test_arguments_round_trip_exactly(self):
+        text = 'echo "quoted" $HOME \\ ; {braces} ~tilde\nsecond line 日本語\x01'
+        with tempfile.TemporaryDirectory() as tmp:
+            saved = Path(tmp) / "buffer.txt"
+            self.client.run("set-buffer", "-b", "roundtrip", text)
+            self.client.run("save-buffer", "-b", "roundtrip", str(saved))
+            self.assertEqual(saved.read_text(), text)
+
+    def test_errors_raise_with_message(self):
+        with self.assertRaises(TmuxCommandError) as ctx:
+            self.client.run("send-keys", "-t", "no-such-session-xyz", "x")
+        self.assertIn("can't find", ctx.exception.stderr)
+        # The connection stays usable after an error
+        self.assertEqual(self.client.run("display-message", "-p", "ok"), "ok")
+
+    def test_does_not_resize_session(self):
+        width = self.client.run("display-message", "-p", "-t", self.session, "#{window_width}")
+        self.assertEqual(width, "120")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Unit tests for worktree_pool.py and pooled worktrees in busd"""
+
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Add project root and bin directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / "bin"))
+
+import bin.busd
+from worktree_pool import WorktreePool
+
+
+def git(*args, cwd):
+    return subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True, check=True).stdout
+
+
+class TestWorktreePool(unittest.TestCase):
+    """Test cases for WorktreePool"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.repo = self.test_dir / "repo"
+        self.repo.mkdir()
+        git("init", "-q", "-b", "main", cwd=self.repo)
+        git("config", "user.name", "Test", cwd=self.repo)
+        git("config", "user.email", "test@example.com", cwd=self.repo)
+        (self.repo / "README.md").write_text("v1")
+        git("add", ".", cwd=self.repo)
+        git("commit", "-q", "-m", "Initial commit", cwd=self.repo)
+        self.pool_dir = self.test_dir / ".repo-worktree-pool"
+        self.pool = WorktreePool(self.repo, self.pool_dir, size=2)
+
+    def tearDown(self):
+        self.pool.shutdown(wait=True)
+        shutil.rmtree(self.test_dir)
+
+    def test_claim_switches_and_moves_a_pooled_worktree(self):
+        self.pool.fill()
+        self.assertEqual(self.pool.ready(), 2)
+
+        # The base moved on after the pool was filled
+        (self.repo / "README.md").write_text("v2")
+        git("commit", "-q", "-am", "Update", cwd=self.repo)
+
+        dest = self.test_dir / "repo-T001"
+        with self.pool.lock:
+            self.assertTrue(self.pool.claim(dest, "feat/T001", "main"))
+        self.assertEqual(git("branch", "--show-current", cwd=dest).strip(), "feat/T001")
+        self.assertEqual((dest / "README.md").read_text(), "v2")
+        self.assertIn(str(dest), git("worktree", "list", cwd=self.repo))
+        self.assertEqual(self.pool.metrics, {"hits": 1, "misses": 0})
+
+        self.pool.wait()  # Let the refill finish
+        self.assertEqual(self.pool.ready(), 2)
+
+    def test_misses_fall_back_to_the_caller(self):
+        dest = self.test_dir / "repo-T001"
+        with self.pool.lock:
+            self.assertFalse(self.pool.claim(dest, "feat/T001", "main"))  # Still empty
+        self.pool.wait()
+
+        git("branch", "feat/T002", cwd=self.repo)
+        with self.pool.lock:
+            self.assertFalse(self.pool.claim(self.test_dir / "repo-T002", "feat/T002", "main"))
+        self.assertEqual(self.pool.metrics, {"hits": 0, "misses": 2})
+        self.assertFalse(dest.exists())
+
+    def test_restart_keeps_clean_worktrees(self):
+        self.pool.fill()
+        clean, dirty = sorted(self.pool_dir.iterdir())
+        (dirty / "README.md").write_text("edited")
+
+        pool = WorktreePool(self.repo, self.pool_dir, size=1)
+        pool.fill()
+        pool.shutdown()
+        self.assertEqual(list(pool._ready), [clean])
+        self.assertFalse(dirty.exists())
+        self.assertNotIn(str(dirty), git("worktree", "list", cwd=self.repo))
+
+
+class TestBusdPooledWorktree(unittest.TestCase):
+    """Test that ensure_worktree takes worktrees from the pool"""
+
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.repo = self.test_dir / "target_repo"
+        self.repo.mkdir()
+        git("init", "-q", "-b", "main", cwd=self.repo)
+        git("config", "user.name", "Test", cwd=self.repo)
+        git("config", "user.email", "test@example.com", cwd=self.repo)
+        (self.repo / "README.md").write_text("# Test Repo")
+        git("add", ".", cwd=self.repo)
+        git("commit", "-q", "-m", "Initial commit", cwd=self.repo)
+        self.patches = [
+            patch('bin.busd.TARGET_REPO', self.repo),
+            patch('bin.busd.WORKTREE_POOL_SIZE', 1),
+            patch('bin.busd.worktree_pool', None),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        if bin.busd.worktree_pool is not None:
+            bin.busd.worktree_pool.shutdown(wait=True)
+        for p in reversed(self.patches):
+            p.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_spawns_use_the_pool(self):
+        pool = bin.busd.start_worktree_pool()
+        pool.wait()  # Wait for the initial checkout
+        self.assertEqual(pool.ready(), 1)
+        self.assertEqual(pool.pool_dir, self.test_dir / ".target_repo-worktree-pool")
+
+        with bin.busd._git_lock:
+            first = bin.busd.ensure_worktree("T001", "feat/T001")
+            second = bin.busd.ensure_worktree("T002", "feat/T002")  # Pool not refilled yet
+        for path, branch in ((first, "feat/T001"), (second, "feat/T002")):
+            self.assertEqual(git("branch", "--show-current", cwd=path).strip(), branch)
+        self.assertEqual(first, self.test_dir / "target_repo-T001")
+        self.assertEqual(pool.metrics, {"hits": 1, "misses": 1})
+
+    def test_empty_repository_has_no_pool(self):
+        shutil.rmtree(self.repo)
+        self.repo.mkdir()
+        git("init", "-q", cwd=self.repo)
+        self.assertIsNone(bin.busd.start_worktree_pool())
+
+
+if __name__ == '__main__':
+    unittest.main()